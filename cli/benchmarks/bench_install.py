@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Measure `watkit install` of a synthetic dependency tree against a local fake registry.
+
+    python benchmarks/bench_install.py [--packages 200] [--latency-ms 10] [--workers 1 8]
+
+Every request to the fake registry is delayed by --latency-ms. For each worker count, installs
+the tree into an empty project with an empty package store (cold), then reinstalls it from the
+lockfile with the store warm. Prints the time and how many requests each run made. A cold
+install can't beat the tree's depth times the latency, a warm one shouldn't make any requests.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+CLI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLI_DIR)
+
+from benchmarks.fake_registry import FakeRegistry, make_tree
+from command_constants import PKG_DIR
+from commands import install, store
+
+
+def tree_depth(tree: dict[str, list[tuple[str, str]]], name: str = "app") -> int:
+    return 1 + max((tree_depth(tree, dep) for dep, _ in tree[name]), default=0)
+
+
+def use_scratch_dirs(scratch: str, registry: FakeRegistry) -> None:
+    """
+    Point the store, the config and download tracking at scratch dirs and the fake registry.
+    """
+    store.STORE_DIR = os.path.join(scratch, "store")
+    store.PACKAGES_DIR = os.path.join(store.STORE_DIR, "packages")
+    store.INDEX_PATH = os.path.join(store.STORE_DIR, "index.json")
+    install.CONFIG_PATH = os.path.join(scratch, "config.json")
+    with open(install.CONFIG_PATH, "w") as f:
+        f.write(f'{{"registry_url": "{registry.url}"}}')
+    install.SERVER_URL = registry.url
+
+
+def timed_install(registry: FakeRegistry, package: str | None) -> tuple[float, int]:
+    registry.requests.clear()
+    began = time.perf_counter()
+    # install prints a few lines per package
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        install.run(package)
+    return time.perf_counter() - began, registry.count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--packages", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+
+    tree = make_tree(args.packages)
+    print(f"{args.packages} packages, {tree_depth(tree)} deep, {args.latency_ms:.0f}ms per request")
+    print(f"{'workers':>8} {'cold s':>8} {'requests':>9} {'warm s':>8} {'requests':>9}")
+
+    with FakeRegistry(args.latency_ms) as registry:
+        registry.add_tree(tree)
+        for workers in args.workers:
+            install.INSTALL_WORKERS = workers
+            scratch = tempfile.mkdtemp(prefix="watkit-bench-")
+            cwd = os.getcwd()
+            try:
+                use_scratch_dirs(scratch, registry)
+                project = os.path.join(scratch, "project")
+                os.makedirs(project)
+                os.chdir(project)
+
+                cold, cold_requests = timed_install(registry, "app")
+                installed = len(os.listdir(PKG_DIR))
+                if installed != len(tree):
+                    raise SystemExit(f"installed {installed} of {len(tree)} packages with {workers} workers")
+                shutil.rmtree(PKG_DIR)
+                warm, warm_requests = timed_install(registry, None)
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(scratch, ignore_errors=True)
+            print(f"{workers:>8} {cold:>8.2f} {cold_requests:>9} {warm:>8.2f} {warm_requests:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+A registry for benchmarks and tests: an HTTP server on localhost that serves packages the way
+the bucket lays them out (<name>/LATEST and <name>/<version>/<name>-<version>.watpkg) and
+accepts /track-download, with a fixed delay on every request.
+"""
+import io
+import json
+import time
+import random
+import tarfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# a valid module with no imports or exports, so installs never need wat2wasm
+EMPTY_WASM = b"\x00asm\x01\x00\x00\x00"
+
+
+def make_wat(dependencies: list[tuple[str, str]] = ()) -> str:
+    imports = "".join(f'  (import "pkg/{name}v{version}" "f" (func (param i32) (result i32)))\n'
+                      for name, version in dependencies)
+    return f"(module\n{imports})\n"
+
+
+def make_watpkg(name: str, version: str, dependencies: list[tuple[str, str]] = ()) -> bytes:
+    """
+    Build a .watpkg the way `watkit pack` does, with dist/main.wasm bundled so installing it doesn't compile anything.
+    """
+    manifest = {"name": name, "version": version, "main": "src/main.wat", "output": "dist/main.wasm"}
+    members = {
+        "watkit.json": json.dumps(manifest).encode("utf-8"),
+        "src/main.wat": make_wat(dependencies).encode("utf-8"),
+        "dist/main.wasm": EMPTY_WASM,
+    }
+    buffer = io.BytesIO()
+    # a fixed mtime, so the same package always builds the same bytes
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for path, content in members.items():
+            info = tarfile.TarInfo(path)
+            info.size = len(content)
+            info.mtime = 0
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def make_tree(packages: int, fanout: int = 3, seed: int = 1) -> dict[str, list[tuple[str, str]]]:
+    """
+    A dependency tree of `packages` packages at version 1.0.0 rooted at "app": every package imports up
+    to `fanout` packages created after it, so the tree is wide and several packages share dependencies.
+    Returns {name: [(dependency, version), ...]}. No names contain a "v", the CLI splits imports at the first one.
+    """
+    rng = random.Random(seed)
+    names = ["app"] + [f"pkg{i}" for i in range(1, packages)]
+    tree = {}
+    for i, name in enumerate(names):
+        later = names[i + 1:]
+        # the first `packages / fanout` packages make sure everything is reachable from app
+        children = names[i * fanout + 1:i * fanout + 1 + fanout]
+        shared = rng.sample(later, min(len(later), 1)) if later else []
+        tree[name] = [(dep, "1.0.0") for dep in dict.fromkeys(children + shared)]
+    return tree
+
+
+class FakeRegistry:
+    """
+    Serve packages over HTTP on a free localhost port. Use as a context manager.
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.files = {}
+        # path -> how many times it was requested
+        self.requests = Counter()
+        # path -> statuses to answer its next requests with, before serving it normally
+        self.failures = {}
+        # requests being answered right now, and the most there ever were at once
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def add_package(self, name: str, version: str, dependencies: list[tuple[str, str]] = (),
+                    latest: bool = True) -> bytes:
+        archive = make_watpkg(name, version, dependencies)
+        self.files[f"/{name}/{version}/{name}-{version}.watpkg"] = archive
+        if latest:
+            self.files[f"/{name}/LATEST"] = version.encode("utf-8")
+        return archive
+
+    def add_tree(self, tree: dict[str, list[tuple[str, str]]]) -> None:
+        for name, dependencies in tree.items():
+            self.add_package(name, "1.0.0", dependencies)
+
+    def fail(self, path: str, *statuses: int) -> None:
+        """
+        Answer the next requests to path with these statuses, one each, then serve it normally.
+        """
+        self.failures.setdefault(path, []).extend(statuses)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, suffix: str = "") -> int:
+        """
+        How many requests went to paths ending with suffix.
+        """
+        with self.lock:
+            return sum(count for path, count in self.requests.items() if path.endswith(suffix))
+
+    def __enter__(self):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes, Nagle would hold the body back for an ACK
+            disable_nagle_algorithm = True
+
+            def _respond(self, status: int, body: bytes = b"") -> None:
+                path = self.path.split("?", 1)[0]
+                with registry.lock:
+                    registry.requests[path] += 1
+                    registry.in_flight += 1
+                    registry.max_in_flight = max(registry.max_in_flight, registry.in_flight)
+                    failures = registry.failures.get(path)
+                    if failures:
+                        status, body = failures.pop(0), b""
+                try:
+                    time.sleep(registry.latency)
+                finally:
+                    with registry.lock:
+                        registry.in_flight -= 1
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                body = registry.files.get(self.path.split("?", 1)[0])
+                self._respond(200 if body is not None else 404, body or b"")
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self._respond(200 if self.path.startswith("/track-download") else 404, b"{}")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -4,6 +4,15 @@ ALLOWED_SRC_EXT = [".wat"]
 
 # constants for the install command
 PKG_DIR = "pkg"
+# the resolved dependency tree of a project, next to its watkit.json
+LOCKFILE = "watkit.lock"
+LOCKFILE_VERSION = 1
+# packages downloaded and extracted at once while installing a dependency tree
+INSTALL_WORKERS = 8
+# limits on a downloaded archive, checked while it is extracted. the same as the server's publish limits
+MAX_ARCHIVE_FILES = 200
+MAX_ARCHIVE_FILE_SIZE = 10 * 1024 * 1024
+MAX_ARCHIVE_EXTRACTED_SIZE = 50 * 1024 * 1024
 LOCAL_REGISTRY = "registry"
 REQUIRED_FIELDS = {"name", "version", "main", "output"}
 ALLOWED_OPTIONAL_FIELDS = {"description", "license", "author"}
@@ -1,13 +1,16 @@
 import os
 import shutil
 import json
-import requests
+import httpx
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 from colorama import init as colorama_init, Fore, Style
 
-from command_constants import PKG_DIR, SERVER_URL
+import registry_client
+from command_constants import PKG_DIR, SERVER_URL, INSTALL_WORKERS, LOCKFILE, LOCKFILE_VERSION
 from commands.run_func_utils.import_handler_helpers import compile_wat
-from commands.run_func_utils.validation_helpers import safe_extract_tar
+from commands.store import lookup_package, add_archive, link_package, store_path
 
 CONFIG_PATH = os.path.expanduser("~/.watkit/config.json")
 
@@ -19,17 +22,16 @@ def load_config():
         return {}
 
 
-def fetch_from_registry(url: str, stream=False) -> requests.Response:
+def fetch_from_registry(url: str) -> httpx.Response:
     """
     Fetch a file from the registry.
     Args:
         url: str - URL to fetch
-        stream: bool - whether to stream the response
     Returns:
-        requests.Response - response from the registry
+        httpx.Response - response from the registry
     """
     print("url", url)
-    resp = requests.get(url, stream=stream)
+    resp = registry_client.request("GET", url)
     if resp.status_code != 200:
         raise Exception(f"Failed to fetch: {url} → {resp.status_code}")
     return resp
@@ -96,126 +98,308 @@ def extract_package_dependencies(manifest: dict, install_path: str) -> list[tupl
     return list(set(dependencies))  # Remove duplicates
 
 
-def run(name_with_version: str, seen=None) -> None:
+def resolve_base_url(config: dict) -> str | None:
+    """
+    Get the registry URL from the config, as a URL objects can be fetched from.
+    """
+    base_url = config.get("registry_url")
+    # Convert S3 static website URL to S3 REST API URL
+    if base_url and "s3-website" in base_url:
+        # Convert from: https://watkit-registry.s3-website-us-east-1.amazonaws.com
+        # To: https://watkit-registry.s3.us-east-1.amazonaws.com
+        base_url = base_url.replace("s3-website-", "s3.")
+    return base_url
+
+
+def split_name_version(name_with_version: str) -> tuple[str, str]:
+    if "v" in name_with_version:
+        name, version = name_with_version.split("v", 1)
+        return name, version
+    return name_with_version, "latest"
+
+
+def install_package(base_url: str, name: str, version: str, locked: dict | None = None) -> dict:
+    """
+    Install one package, without its dependencies. Versions already in the store are linked
+    into pkg/ without touching the network, others are downloaded into the store first.
+    Removes whatever it put in pkg/ if it fails.
+    Args:
+        base_url: str - registry URL
+        name: str - package name
+        version: str - package version, or "latest"
+        locked: dict - the package's watkit.lock entry. its archive URL and hash are used
+            instead of looking anything up, and a download with another hash is refused
+    Returns:
+        dict - {"name", "version", "path", "url", "sha256", "dependencies": [(name, version), ...]}
+    """
+    # resolve latest version if none specified
+    if version == "latest":
+        latest_url = f"{base_url}/{name}/LATEST"
+        latest_resp = fetch_from_registry(latest_url)
+        version = latest_resp.text.strip()
+        print(f"{Fore.YELLOW}➜ Resolved {name}vlatest to {version}{Style.RESET_ALL}")
+
+    archive_filename = f"{name}-{version}.watpkg"
+    if locked:
+        archive_url = locked["url"]
+        package_store_path = store_path(locked["sha256"])
+        if not os.path.isdir(package_store_path):
+            package_store_path = None
+    else:
+        archive_url = f"{base_url}/{name}/{version}/{archive_filename}"
+        package_store_path = lookup_package(name, version)
+
+    install_path = os.path.join(PKG_DIR, f"{name}v{version}")
+    downloaded = package_store_path is None
+    if downloaded:
+        # extracted into the store straight from the response, the archive never touches the disk
+        print("url", archive_url)
+        with registry_client.stream("GET", archive_url) as archive_resp:
+            if archive_resp.status_code != 200:
+                raise Exception(f"Failed to fetch: {archive_url} → {archive_resp.status_code}")
+            package_store_path = add_archive(name, version, archive_resp.iter_bytes(chunk_size=64 * 1024),
+                                             locked["sha256"] if locked else None)
+    else:
+        print(f"{Fore.GREEN}✓ Found {name}v{version} in the store{Style.RESET_ALL}")
+
+    try:
+        # the archive's own watkit.json says where the sources and output are
+        with open(os.path.join(package_store_path, "watkit.json")) as f:
+            manifest = json.load(f)
+
+        # check if main.wasm already exists (bundled, or compiled by an earlier install)
+        store_wasm_path = os.path.join(package_store_path, manifest["output"])
+        if not os.path.exists(store_wasm_path):
+            # compile if .wasm files weren't bundled. into the store, so every project gets this build
+            print(f"{Fore.YELLOW}➜ Compiling {name} from source...{Style.RESET_ALL}")
+            wat_path = os.path.join(package_store_path, manifest["main"])
+            temp_wasm_path = f"{store_wasm_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            compile_wat(wat_path, temp_wasm_path)
+            os.replace(temp_wasm_path, store_wasm_path)
+        else:
+            print(f"{Fore.GREEN}✓ Using bundled compiled files{Style.RESET_ALL}")
+
+        # link into pkg/modulevversion
+        os.makedirs(PKG_DIR, exist_ok=True)
+        link_package(package_store_path, install_path)
+        dependencies = extract_package_dependencies(manifest, install_path)
+    except Exception:
+        shutil.rmtree(install_path, ignore_errors=True)
+        raise
+
+    main_wasm_path = os.path.join(install_path, manifest["output"])
+    print(f"{Fore.GREEN}✓ installed {name}v{version} → {main_wasm_path}{Style.RESET_ALL}")
+    result = {
+        "name": name,
+        "version": version,
+        "path": install_path,
+        "url": archive_url,
+        # store directories are named after the archive's hash
+        "sha256": os.path.basename(package_store_path),
+        "dependencies": dependencies,
+    }
+    if not downloaded:
+        return result
+
+    # track successful download for *website metrics ooo shiny*
+    try:
+        # use watkit server for tracking (since CLI downloads from S3)
+        track_url = f"{SERVER_URL}/track-download"
+        registry_client.request("POST", track_url, params={"name": name, "version": version})
+    except Exception as e:
+        print(f"{Fore.YELLOW}Warning: Could not track download: {e}{Style.RESET_ALL}")
+
+    return result
+
+
+def load_lockfile() -> dict | None:
+    """
+    Read the project's watkit.lock, or None if there isn't one.
+    """
+    try:
+        with open(LOCKFILE) as f:
+            lock = json.load(f)
+    except FileNotFoundError:
+        return None
+    if lock.get("lockfileVersion") != LOCKFILE_VERSION:
+        raise Exception(f"{LOCKFILE} has version {lock.get('lockfileVersion')}, this watkit reads version {LOCKFILE_VERSION}")
+    return lock
+
+
+def prune_lockfile(lock: dict) -> list[str]:
+    """
+    Drop the packages in a lockfile that its direct dependencies no longer reach.
+    Returns the dropped packages, as name+version.
+    """
+    reachable = set()
+    pending = [f"{dep_name}v{dep_version}" for dep_name, dep_version in lock["dependencies"].items()]
+    while pending:
+        package = pending.pop()
+        if package in reachable or package not in lock["packages"]:
+            continue
+        reachable.add(package)
+        pending.extend(lock["packages"][package]["dependencies"])
+    dropped = sorted(package for package in lock["packages"] if package not in reachable)
+    lock["packages"] = {package: entry for package, entry in lock["packages"].items() if package in reachable}
+    return dropped
+
+
+def write_lockfile(lock: dict) -> None:
+    # sorted keys and a trailing newline, so the same tree always writes the same bytes
+    temp_path = f"{LOCKFILE}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(temp_path, LOCKFILE)
+
+
+def update_lockfile(lock: dict | None, name: str, version: str, results: list[dict]) -> None:
+    """
+    Record a finished install in watkit.lock: name at version as a direct dependency, and every
+    package installed for it with its archive URL and hash. Packages nothing depends on any more are dropped.
+    """
+    lock = lock or {"lockfileVersion": LOCKFILE_VERSION, "dependencies": {}, "packages": {}}
+    lock["dependencies"][name] = version
+    for result in results:
+        lock["packages"][f"{result['name']}v{result['version']}"] = {
+            "name": result["name"],
+            "version": result["version"],
+            "url": result["url"],
+            "sha256": result["sha256"],
+            "dependencies": sorted(f"{dep_name}v{dep_version}" for dep_name, dep_version in result["dependencies"]),
+        }
+    prune_lockfile(lock)
+    write_lockfile(lock)
+
+
+def _abort_install(executor: ThreadPoolExecutor, in_flight, installed: list[dict]) -> None:
+    """
+    Let the downloads already running finish, then clean up everything this run installed.
+    """
+    executor.shutdown(wait=True, cancel_futures=True)
+    for future in in_flight:
+        if not future.cancelled() and future.exception() is None:
+            installed.append(future.result())
+    for result in installed:
+        if os.path.exists(result["path"]):
+            shutil.rmtree(result["path"], ignore_errors=True)
+            print(f"{Fore.YELLOW}➜ Cleaned up: {os.path.basename(result['path'])}{Style.RESET_ALL}")
+
+
+def install_from_lockfile() -> None:
+    """
+    Install exactly the packages in watkit.lock. Archives already in the store are linked without
+    any network access, others are downloaded from the locked URL and must match the locked hash.
+    Nothing is resolved, so LATEST and manifests are never fetched.
+    """
+    colorama_init()
+    lock = load_lockfile()
+    if lock is None:
+        print(f"{Fore.RED}⛌ no {LOCKFILE} found. Install a package with `watkit install <package>` first{Style.RESET_ALL}")
+        return
+
+    packages = lock["packages"]
+    print(f"\n✰ installing {len(packages)} packages from {LOCKFILE}... ✰")
+
+    installed = []
+    executor = ThreadPoolExecutor(max_workers=INSTALL_WORKERS)
+    in_flight = {
+        executor.submit(install_package, None, entry["name"], entry["version"], entry): package
+        for package, entry in packages.items()
+    }
+    try:
+        for future in as_completed(list(in_flight)):
+            package = in_flight.pop(future)
+            try:
+                installed.append(future.result())
+            except Exception as e:
+                raise Exception(f"Failed to install {package}: {e}")
+        print()
+
+    except Exception as e:
+        print(f"{Fore.RED}⛌ install failed: {e}{Style.RESET_ALL}")
+        _abort_install(executor, in_flight, installed)
+        raise  # Re-raise the exception to propagate the error
+
+    finally:
+        executor.shutdown(wait=True)
+
+
+def run(name_with_version: str | None = None, seen=None) -> None:
     """
     Install a package from the registry, using LATEST version resolution if necessary.
-    Handles recursive dependencies automatically.
+    Handles recursive dependencies automatically: every package whose dependencies are known
+    is fetched on a pool of INSTALL_WORKERS threads, and each name/version is fetched once
+    however many packages depend on it. If anything fails, everything installed by this run is removed.
+    The resolved tree is recorded in watkit.lock, packages already locked there must keep their hash.
+    With no package given, installs what watkit.lock lists instead.
     Args:
         name_with_version: str - name and version of the package to install
         seen: set - set of already installed packages
     Returns:
         None
     """
+    if name_with_version is None:
+        install_from_lockfile()
+        return
+
     colorama_init()
     config = load_config()
-    base_url = config.get("registry_url")
+    base_url = resolve_base_url(config)
     if not base_url:
         print(f"{Fore.RED}✘ Missing 'registry_url' in config.{Style.RESET_ALL}")
         return
 
-    # Convert S3 static website URL to S3 REST API URL
-    if "s3-website" in base_url:
-        # Convert from: https://watkit-registry.s3-website-us-east-1.amazonaws.com
-        # To: https://watkit-registry.s3.us-east-1.amazonaws.com
-        base_url = base_url.replace("s3-website-", "s3.")
-
-    # Parse name and optional version
-    if "v" in name_with_version:
-        name, version = name_with_version.split("v", 1)
-    else:
-        name, version = name_with_version, "latest"
-
     if seen is None:
         seen = set()
     if name_with_version in seen:
         return
     seen.add(name_with_version)
 
+    name, version = split_name_version(name_with_version)
     print(f"\n✰ installing {name}v{version}... ✰")
 
-    # Track installed dependencies for cleanup on failure
-    installed_deps = []
-    
-    try:
-        # resolve latest version if none specified
-        if version == "latest":
-            latest_url = f"{base_url}/{name}/LATEST"
-            latest_resp = fetch_from_registry(latest_url)
-            version = latest_resp.text.strip()
-            print(f"{Fore.YELLOW}➜ Resolved {name}vlatest to {version}{Style.RESET_ALL}")
-   
-        archive_filename = f"{name}-{version}.watpkg"
-        manifest_url = f"{base_url}/{name}/{version}/watkit.json"
-        archive_url = f"{base_url}/{name}/{version}/{archive_filename}"
-
-        # grab manifest + archive
-        manifest = fetch_from_registry(manifest_url).json()
-        archive_resp = fetch_from_registry(archive_url, stream=True)
+    lock = load_lockfile()
+    locked_packages = lock["packages"] if lock else {}
 
-        # save archive locally in a tmp dir
-        archive_path = os.path.join("/tmp", archive_filename)
-        with open(archive_path, "wb") as f:
-            for chunk in archive_resp.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        # extract to pkg/modulevversion
-        install_path = os.path.join(PKG_DIR, f"{name}v{version}")
-        os.makedirs(PKG_DIR, exist_ok=True)
-
-        safe_extract_tar(archive_path, install_path)
-
-        # extract dependencies recursively
-        dependencies = extract_package_dependencies(manifest, install_path)
-        for dep_name, dep_version in dependencies:
-            dep_name_with_version = f"{dep_name}v{dep_version}"
-            if dep_name_with_version not in seen:
-                print(f"{Fore.CYAN}➜ Installing dependency: {dep_name_with_version}{Style.RESET_ALL}")
+    # Track installed packages for cleanup on failure
+    installed = []
+    in_flight = {}
+    executor = ThreadPoolExecutor(max_workers=INSTALL_WORKERS)
+    try:
+        root = executor.submit(install_package, base_url, name, version, locked_packages.get(name_with_version))
+        in_flight[root] = name_with_version
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                package = in_flight.pop(future)
                 try:
-                    run(dep_name_with_version, seen)
-                    installed_deps.append(dep_name_with_version)
+                    result = future.result()
                 except Exception as e:
-                    print(f"{Fore.RED}⛌ Failed to install dependency {dep_name_with_version}: {e}{Style.RESET_ALL}")
-                    # clean up any partial installs
-                    for installed_dep in installed_deps:
-                        dep_install_path = os.path.join(PKG_DIR, installed_dep)
-                        if os.path.exists(dep_install_path):
-                            shutil.rmtree(dep_install_path)
-                            print(f"{Fore.YELLOW}➜ Cleaned up failed dependency: {installed_dep}{Style.RESET_ALL}")
-                    # clean up the main package
-                    if os.path.exists(install_path):
-                        shutil.rmtree(install_path)
-                    raise Exception(f"Dependency installation failed: {e}")
-
-        # validate dependencies (but don't recompile)
-        config_path = os.path.join(install_path, "watkit.json")
-        with open(config_path) as f:
-            manifest = json.load(f)
-
-        # check if main.wasm already exists (bundled)
-        main_wasm_path = os.path.join(install_path, manifest["output"])
-        if not os.path.exists(main_wasm_path):
-            # compile if .wasm files weren't bundled
-            print(f"{Fore.YELLOW}➜ Compiling {name} from source...{Style.RESET_ALL}")
-            wat_path = os.path.join(install_path, manifest["main"])
-            compile_wat(wat_path, main_wasm_path)
-        else:
-            print(f"{Fore.GREEN}✓ Using bundled compiled files{Style.RESET_ALL}")
+                    if package != name_with_version:
+                        print(f"{Fore.RED}⛌ Failed to install dependency {package}: {e}{Style.RESET_ALL}")
+                        raise Exception(f"Dependency installation failed: {e}")
+                    raise
+                installed.append(result)
+                # a resolved "latest" is the same package as its pinned version
+                seen.add(f"{result['name']}v{result['version']}")
 
-        print(f"{Fore.GREEN}✓ installed {name}v{version} → {main_wasm_path}{Style.RESET_ALL}\n")
+                for dep_name, dep_version in result["dependencies"]:
+                    dep_name_with_version = f"{dep_name}v{dep_version}"
+                    if dep_name_with_version not in seen:
+                        seen.add(dep_name_with_version)
+                        print(f"{Fore.CYAN}➜ Installing dependency: {dep_name_with_version}{Style.RESET_ALL}")
+                        future = executor.submit(install_package, base_url, dep_name, dep_version,
+                                                 locked_packages.get(dep_name_with_version))
+                        in_flight[future] = dep_name_with_version
 
-        # track successful download for *website metrics ooo shiny*
-        try:
-            # use watkit server for tracking (since CLI downloads from S3)
-            track_url = f"{SERVER_URL}/track-download"
-            requests.post(track_url, params={"name": name, "version": version})
-        except Exception as e:
-            print(f"{Fore.YELLOW}Warning: Could not track download: {e}{Style.RESET_ALL}")
+        update_lockfile(lock, name, installed[0]["version"], installed)
+        print(f"{Fore.GREEN}✓ updated {LOCKFILE}{Style.RESET_ALL}\n")
 
     except Exception as e:
         print(f"{Fore.RED}⛌ install failed: {e}{Style.RESET_ALL}")
-        # clean up the main package and any installed dependencies
-        shutil.rmtree(os.path.join(PKG_DIR, f"{name}v{version}"), ignore_errors=True)
-        for installed_dep in installed_deps:
-            dep_install_path = os.path.join(PKG_DIR, installed_dep)
-            shutil.rmtree(dep_install_path, ignore_errors=True)
+        _abort_install(executor, in_flight, installed)
         raise  # Re-raise the exception to propagate the error
+
+    finally:
+        executor.shutdown(wait=True)
@@ -1,13 +1,15 @@
 import os
 import json
 import tarfile
-import requests
 from colorama import init as colorama_init, Fore, Style
 from command_constants import ALLOWED_TOP_LEVEL, ALLOWED_SRC_EXT
+import registry_client
 
 CONFIG_PATH = os.path.expanduser("~/.watkit/config.json")
 COOKIE_PATH = os.path.expanduser("~/.watkit/cookies.json")
 SERVER_URL = "https://watkit.dev"
+# the server validates and uploads the package before it answers
+PUBLISH_TIMEOUT_SECONDS = 120
 
 
 def validate_project() -> dict | None:
@@ -104,13 +106,15 @@ def run():
 
     # Step 3: Upload to /publish
     with open(archive_path, "rb") as f:
-        files = {"watpkg_file": (os.path.basename(archive_path), f)}
+        # read up front, so a retried request sends the whole archive again
+        files = {"watpkg_file": (os.path.basename(archive_path), f.read())}
         data = {"name": name, "version": version}
-        cookies = {"watkit_token": token}
+        headers = {"Cookie": f"watkit_token={token}"}
 
         print(f"{Fore.CYAN}⇨ Uploading package to {SERVER_URL}/publish...{Style.RESET_ALL}")
         try:
-            response = requests.post(f"{SERVER_URL}/publish", data=data, files=files, cookies=cookies)
+            response = registry_client.request("POST", f"{SERVER_URL}/publish", data=data, files=files,
+                                               headers=headers, timeout=PUBLISH_TIMEOUT_SECONDS)
             if response.status_code == 200:
                 print(f"{Fore.GREEN}✓ Published {name}v{version} successfully!{Style.RESET_ALL}")
             else:
@@ -2,19 +2,48 @@ from colorama import Fore, Style
 import tarfile
 import os
 import json
+import shutil
 
-from command_constants import REQUIRED_FIELDS, ALLOWED_OPTIONAL_FIELDS
+from command_constants import (
+    REQUIRED_FIELDS,
+    ALLOWED_OPTIONAL_FIELDS,
+    MAX_ARCHIVE_FILES,
+    MAX_ARCHIVE_FILE_SIZE,
+    MAX_ARCHIVE_EXTRACTED_SIZE,
+)
 
-def safe_extract_tar(tar_path: str, dest: str) -> None:
+def safe_extract_tar_stream(fileobj, dest: str) -> None:
     """
-    Extract the tar file to the destination directory safely.
+    Extract a .watpkg while it is being read, front to back, so fileobj can be a download that
+    is still arriving. Each member's path, type and size are checked before anything is written.
     """
-    with tarfile.open(tar_path, "r:gz") as tar:
-        for member in tar.getmembers():
+    file_count = 0
+    extracted_size = 0
+    # "r|gz" reads members in order instead of seeking around the archive
+    with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+        for member in tar:
+            file_count += 1
+            if file_count > MAX_ARCHIVE_FILES:
+                raise Exception(f"{Fore.RED}⛌ too many files in archive{Style.RESET_ALL}")
+
             member_path = os.path.join(dest, member.name)
-            if not is_within_directory(dest, member_path):
+            if os.path.isabs(member.name) or not is_within_directory(dest, member_path):
                 raise Exception(f"{Fore.RED}⛌ unsafe file path in archive: {member.name}{Style.RESET_ALL}")
-        tar.extractall(dest)
+            if member.isdir():
+                os.makedirs(member_path, exist_ok=True)
+                continue
+            # no links or devices, they can point outside the package
+            if not member.isfile():
+                raise Exception(f"{Fore.RED}⛌ unsupported file type in archive: {member.name}{Style.RESET_ALL}")
+            if member.size > MAX_ARCHIVE_FILE_SIZE:
+                raise Exception(f"{Fore.RED}⛌ file too large in archive: {member.name}{Style.RESET_ALL}")
+            extracted_size += member.size
+            if extracted_size > MAX_ARCHIVE_EXTRACTED_SIZE:
+                raise Exception(f"{Fore.RED}⛌ archive is too large once extracted{Style.RESET_ALL}")
+
+            os.makedirs(os.path.dirname(member_path), exist_ok=True)
+            with tar.extractfile(member) as source, open(member_path, "wb") as f:
+                shutil.copyfileobj(source, f)
 
 
 def is_within_directory(directory: str, target: str) -> bool:
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
-import os, json, requests, argparse, re
+import os, json, argparse, re
 from colorama import init as colorama_init, Fore, Style
 
 CONFIG_PATH = os.path.expanduser("~/.watkit/config.json")
 from command_constants import SEARCH_API_URL
+import registry_client
 
 def validate_query(query: str) -> None:
     """Validate that query only contains alphanumeric characters, hyphens, and underscores."""
@@ -23,7 +24,7 @@ def run(args):
     print(f"{Fore.CYAN}⇨ searching {by} for '{args.query}'...{Style.RESET_ALL}")
 
     try:
-        resp = requests.get(f"{SEARCH_API_URL}/search", params={"q": args.query, "by": by})
+        resp = registry_client.request("GET", f"{SEARCH_API_URL}/search", params={"q": args.query, "by": by})
         resp.raise_for_status()
         results = resp.json().get("results", [])
         if not results:
@@ -0,0 +1,212 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from colorama import init as colorama_init, Fore, Style
+
+from commands.run_func_utils.validation_helpers import safe_extract_tar_stream
+
+# per-user store shared by every project. each archive is extracted once, into a directory named
+# after its sha256, and projects get hardlinks to those files in their pkg/
+STORE_DIR = os.path.expanduser("~/.watkit/store")
+PACKAGES_DIR = os.path.join(STORE_DIR, "packages")
+# name+version -> archive sha256. published versions never change, so a hit here means
+# the package can be installed without touching the network
+INDEX_PATH = os.path.join(STORE_DIR, "index.json")
+
+_index_lock = threading.Lock()
+
+
+class HashingReader:
+    """
+    File-like reader over an iterator of byte chunks, such as a streamed response body,
+    that hashes every chunk as it comes in.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+        self.digest = hashlib.sha256()
+
+    def _fill(self) -> bool:
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        self.digest.update(chunk)
+        self.buffer += chunk
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self.buffer) < size) and self._fill():
+            pass
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def hexdigest(self) -> str:
+        """
+        SHA-256 of the whole stream. Reads whatever is left first, the tar can end before the gzip trailer.
+        """
+        while self._fill():
+            self.buffer = b""
+        return self.digest.hexdigest()
+
+
+def load_store_index() -> dict:
+    try:
+        with open(INDEX_PATH) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_store_index(index: dict) -> None:
+    # write then rename, so another watkit process never reads half a file
+    os.makedirs(STORE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=STORE_DIR, suffix=".json.tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(temp_path, INDEX_PATH)
+
+
+def store_path(digest: str) -> str:
+    return os.path.join(PACKAGES_DIR, digest)
+
+
+def lookup_package(name: str, version: str) -> str | None:
+    """
+    Get the store directory of a package version, or None if it isn't in the store.
+    """
+    digest = load_store_index().get(f"{name}v{version}")
+    if digest and os.path.isdir(store_path(digest)):
+        return store_path(digest)
+    return None
+
+
+def add_archive(name: str, version: str, chunks, expected_sha256: str | None = None) -> str:
+    """
+    Put an archive in the store as it downloads. The chunks are hashed and extracted in one pass
+    into a staging dir, which is renamed to the archive's hash once the whole archive checks out.
+    If expected_sha256 is given, an archive with any other hash is refused.
+    Returns the store directory.
+    """
+    # stage next to where it ends up, so the rename is atomic and a half-extracted
+    # package is never visible under its hash
+    os.makedirs(PACKAGES_DIR, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(dir=PACKAGES_DIR, prefix=".staging.")
+    try:
+        reader = HashingReader(chunks)
+        safe_extract_tar_stream(reader, staging_dir)
+        digest = reader.hexdigest()
+        if expected_sha256 and digest != expected_sha256:
+            raise Exception(f"checksum mismatch for {name}v{version}: expected {expected_sha256}, got {digest}")
+        path = store_path(digest)
+        if not os.path.isdir(path):
+            try:
+                os.rename(staging_dir, path)
+            except OSError:
+                # another install put the same archive in first
+                if not os.path.isdir(path):
+                    raise
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    with _index_lock:
+        index = load_store_index()
+        index[f"{name}v{version}"] = digest
+        _save_store_index(index)
+    return path
+
+
+def link_package(source: str, dest: str) -> None:
+    """
+    Recreate a store directory at dest with hardlinks, copying files instead where
+    hardlinks aren't possible (another filesystem, or one without hardlinks).
+    The links are made in a staging dir next to dest and renamed into place, so a
+    half-linked package never shows up at dest.
+    """
+    staging_dir = tempfile.mkdtemp(dir=os.path.dirname(dest) or ".", prefix=f".{os.path.basename(dest)}.")
+    try:
+        # mkdtemp makes it private, installed packages are readable like any other directory
+        os.chmod(staging_dir, 0o755)
+        for root, _, files in os.walk(source):
+            target_dir = os.path.join(staging_dir, os.path.relpath(root, source))
+            os.makedirs(target_dir, exist_ok=True)
+            for file in files:
+                source_file = os.path.join(root, file)
+                target_file = os.path.join(target_dir, file)
+                try:
+                    os.link(source_file, target_file)
+                except OSError:
+                    shutil.copy2(source_file, target_file)
+        # a directory can't be renamed over a non-empty one, so the old install goes first
+        shutil.rmtree(dest, ignore_errors=True)
+        os.rename(staging_dir, dest)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def _is_referenced(path: str) -> bool:
+    # every project install hardlinks the files, so a file with a single link is only in the store.
+    # installs that fell back to copying don't count, but they don't need the store either
+    for root, _, files in os.walk(path):
+        for file in files:
+            if os.stat(os.path.join(root, file)).st_nlink > 1:
+                return True
+    return False
+
+
+def _directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, file))
+        for root, _, files in os.walk(path)
+        for file in files
+    )
+
+
+def prune_store() -> tuple[int, int]:
+    """
+    Remove store entries no project links to any more, along with their index entries.
+    Returns how many entries were removed and how many bytes that freed.
+    """
+    if not os.path.isdir(PACKAGES_DIR):
+        return 0, 0
+
+    removed = set()
+    freed = 0
+    for entry in os.listdir(PACKAGES_DIR):
+        path = os.path.join(PACKAGES_DIR, entry)
+        if not os.path.isdir(path):
+            continue
+        # leftovers from an install that was killed halfway
+        if entry.startswith("."):
+            freed += _directory_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        if not _is_referenced(path):
+            freed += _directory_size(path)
+            shutil.rmtree(path, ignore_errors=True)
+            removed.add(entry)
+
+    with _index_lock:
+        index = load_store_index()
+        kept = {package: digest for package, digest in index.items() if os.path.isdir(store_path(digest))}
+        if kept != index:
+            _save_store_index(kept)
+    return len(removed), freed
+
+
+def run(action: str) -> None:
+    """
+    Manage the package store.
+    Args:
+        action: str - what to do, only "prune" for now
+    """
+    colorama_init()
+    if action == "prune":
+        removed, freed = prune_store()
+        print(f"{Fore.GREEN}✓ removed {removed} unused packages from the store, freed {freed / 1024:.1f} KiB{Style.RESET_ALL}")
+    else:
+        print(f"{Fore.RED}⛌ unknown store action: {action}{Style.RESET_ALL}")
@@ -1,14 +1,16 @@
 import os
 import shutil
 from colorama import Fore, Style
-from command_constants import PKG_DIR
+from command_constants import PKG_DIR, LOCKFILE
+from commands.install import load_lockfile, prune_lockfile, write_lockfile, split_name_version
 
 def run(package: str) -> None:
     """
-    Uninstall a package from the current watkit project.
+    Uninstall a package from the current watkit project. If the project has a watkit.lock, the package
+    is dropped from its direct dependencies, and the packages nothing needs any more go with it.
 
     Args:
-        package: The name of the package to uninstall.
+        package: The name and version of the package to uninstall, like its folder in pkg/.
     """
     package_path = os.path.join(PKG_DIR, package)
 
@@ -21,7 +23,34 @@ def run(package: str) -> None:
         return
 
     try:
-        shutil.rmtree(package_path)
-        print(f"{Fore.GREEN}✓ removed package: {package}{Style.RESET_ALL}")
+        lock = load_lockfile()
+    except Exception as e:
+        print(f"{Fore.RED}⛌ failed to uninstall {package}: {e}{Style.RESET_ALL}")
+        return
+
+    removed = [package]
+    if lock is not None:
+        name, version = split_name_version(package)
+        if lock["dependencies"].get(name) == version:
+            del lock["dependencies"][name]
+        removed = prune_lockfile(lock)
+        if package in lock["packages"]:
+            # pkg/ has to keep what the remaining packages import
+            needed_by = sorted(entry for entry, locked in lock["packages"].items() if package in locked["dependencies"])
+            print(f"{Fore.RED}⛌ {package} is still needed by {', '.join(needed_by)}{Style.RESET_ALL}")
+            return
+        if package not in removed:
+            # installed by hand, never recorded in the lockfile
+            removed.append(package)
+
+    try:
+        for entry in removed:
+            entry_path = os.path.join(PKG_DIR, entry)
+            if os.path.exists(entry_path):
+                shutil.rmtree(entry_path)
+                print(f"{Fore.GREEN}✓ removed package: {entry}{Style.RESET_ALL}")
+        if lock is not None:
+            write_lockfile(lock)
+            print(f"{Fore.GREEN}✓ updated {LOCKFILE}{Style.RESET_ALL}")
     except Exception as e:
         print(f"{Fore.RED}⛌ failed to uninstall {package}: {e}{Style.RESET_ALL}")
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+# one pooled client shared by every command, so repeated requests to the registry, the search api
+# and the server reuse their connections instead of doing a new TCP + TLS handshake each time
+
+CONNECT_TIMEOUT_SECONDS = 5.0
+READ_TIMEOUT_SECONDS = 30.0
+
+# attempts per request, including the first. GETs are retried on 5xx, 429 and any connection error,
+# other methods only when the connection failed before anything was sent
+MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY_SECONDS = 0.25
+RETRY_MAX_DELAY_SECONDS = 4.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# requests in flight to one host at once, however many install workers there are
+MAX_CONNECTIONS_PER_HOST = 8
+MAX_CONNECTIONS = 32
+
+_client = None
+_client_lock = threading.Lock()
+_host_slots = {}
+
+
+def get_client() -> httpx.Client:
+    """
+    Get the shared client, creating it on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(
+                # needs h2, from httpx[http2]. plain http servers still get http/1.1 keep-alive
+                http2=True,
+                timeout=httpx.Timeout(READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+                follow_redirects=True,
+            )
+        return _client
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc
+    with _client_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+        return slot
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** attempt)))
+
+
+def _should_retry(method: str, attempt: int, response: httpx.Response | None, error: Exception | None) -> bool:
+    if attempt + 1 >= MAX_ATTEMPTS:
+        return False
+    if error is not None:
+        # nothing reached the server, so even a POST is safe to send again
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        return method in IDEMPOTENT_METHODS and isinstance(error, httpx.TransportError)
+    return method in IDEMPOTENT_METHODS and response.status_code in RETRY_STATUSES
+
+
+@contextmanager
+def stream(method: str, url: str, **kwargs):
+    """
+    Send a request and yield the response without reading the body, for large downloads.
+    Retries like request(). The host's slot is held until the block exits.
+    """
+    method = method.upper()
+    client = get_client()
+    with _host_slot(url):
+        attempt = 0
+        while True:
+            try:
+                response = client.send(client.build_request(method, url, **kwargs), stream=True)
+            except httpx.TransportError as e:
+                if not _should_retry(method, attempt, None, e):
+                    raise
+            else:
+                if not _should_retry(method, attempt, response, None):
+                    break
+                response.close()
+            time.sleep(retry_delay(attempt))
+            attempt += 1
+
+        try:
+            yield response
+        finally:
+            response.close()
+
+
+def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client and read the whole response.
+    Takes the same keyword arguments as httpx.Client.build_request (params, data, files, json, headers, timeout...).
+    """
+    with stream(method, url, **kwargs) as response:
+        response.read()
+    return response
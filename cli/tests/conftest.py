@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from benchmarks.fake_registry import FakeRegistry
+from commands import install, store
+
+
+@pytest.fixture
+def registry():
+    with FakeRegistry() as fake:
+        yield fake
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch, registry):
+    """
+    An empty watkit project as the working directory, with its own package store and config
+    pointing every registry and server request at the fake registry.
+    """
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "watkit.json").write_text(json.dumps({"name": "project", "version": "0.1.0",
+                                                         "main": "src/main.wat", "output": "dist/main.wasm"}))
+    monkeypatch.chdir(project_dir)
+
+    store_dir = tmp_path / "store"
+    monkeypatch.setattr(store, "STORE_DIR", str(store_dir))
+    monkeypatch.setattr(store, "PACKAGES_DIR", str(store_dir / "packages"))
+    monkeypatch.setattr(store, "INDEX_PATH", str(store_dir / "index.json"))
+
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"registry_url": registry.url}))
+    monkeypatch.setattr(install, "CONFIG_PATH", str(config_path))
+    monkeypatch.setattr(install, "SERVER_URL", registry.url)
+    return project_dir
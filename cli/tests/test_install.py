@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+
+import pytest
+
+from benchmarks.fake_registry import make_tree
+from command_constants import PKG_DIR, LOCKFILE
+from commands import install
+
+
+def installed() -> set[str]:
+    if not os.path.isdir(PKG_DIR):
+        return set()
+    return {entry for entry in os.listdir(PKG_DIR) if not entry.startswith(".")}
+
+
+def read_lockfile() -> dict:
+    with open(LOCKFILE) as f:
+        return json.load(f)
+
+
+def test_install_fetches_the_whole_tree_once(project, registry):
+    tree = make_tree(30)
+    registry.add_tree(tree)
+
+    install.run("app")
+
+    assert installed() == {f"{name}v1.0.0" for name in tree}
+    # only the root needed resolving, and every archive was downloaded once however many packages import it
+    assert registry.count("/LATEST") == 1
+    assert registry.count(".watpkg") == len(tree)
+    assert all(count == 1 for path, count in registry.requests.items() if path.endswith(".watpkg"))
+    assert os.path.exists(os.path.join(PKG_DIR, "pkg29v1.0.0", "dist", "main.wasm"))
+
+
+def test_install_writes_the_resolved_tree_to_the_lockfile(project, registry):
+    registry.add_package("app", "1.0.0", [("math", "2.0.0")])
+    math_archive = registry.add_package("math", "2.0.0")
+
+    install.run("app")
+
+    lock = read_lockfile()
+    assert lock["dependencies"] == {"app": "1.0.0"}
+    assert lock["packages"]["appv1.0.0"]["dependencies"] == ["mathv2.0.0"]
+    assert lock["packages"]["mathv2.0.0"] == {
+        "name": "math",
+        "version": "2.0.0",
+        "url": f"{registry.url}/math/2.0.0/math-2.0.0.watpkg",
+        "sha256": hashlib.sha256(math_archive).hexdigest(),
+        "dependencies": [],
+    }
+
+
+def test_a_failed_dependency_removes_everything_this_install_added(project, registry):
+    tree = make_tree(20)
+    registry.add_tree(tree)
+    del registry.files["/pkg15/1.0.0/pkg15-1.0.0.watpkg"]
+
+    with pytest.raises(Exception, match="pkg15"):
+        install.run("app")
+
+    assert installed() == set()
+    assert not os.path.exists(LOCKFILE)
+
+
+def test_install_from_the_lockfile_skips_the_network_on_a_warm_store(project, registry):
+    registry.add_tree(make_tree(10))
+    install.run("app")
+    lockfile_bytes = open(LOCKFILE, "rb").read()
+    registry.requests.clear()
+    # a fresh checkout of the project, on a machine that has installed it before
+    for entry in installed():
+        os.rename(os.path.join(PKG_DIR, entry), os.path.join(project.parent, entry))
+
+    install.run()
+
+    assert registry.count() == 0
+    assert len(installed()) == 10
+    assert open(LOCKFILE, "rb").read() == lockfile_bytes
+
+
+def test_install_from_the_lockfile_refuses_a_changed_archive(project, registry, tmp_path, monkeypatch):
+    registry.add_package("app", "1.0.0", [("math", "1.0.0")])
+    registry.add_package("math", "1.0.0")
+    install.run("app")
+    # a machine with an empty store, and an archive that was swapped after it was locked
+    monkeypatch.setattr(install, "store_path", lambda digest: str(tmp_path / "empty-store" / digest))
+    for entry in installed():
+        os.rename(os.path.join(PKG_DIR, entry), os.path.join(project.parent, entry))
+    registry.add_package("math", "1.0.0", [("app", "1.0.0")])
+    registry.requests.clear()
+
+    with pytest.raises(Exception, match="checksum mismatch"):
+        install.run()
+
+    # nothing was resolved, only the locked archives were fetched
+    assert registry.count("/LATEST") == 0
+    assert installed() == set()
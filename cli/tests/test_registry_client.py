@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import registry_client
+from benchmarks.fake_registry import FakeRegistry
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(registry_client, "retry_delay", lambda attempt: 0)
+
+
+def test_get_is_retried_after_a_server_error(registry):
+    registry.add_package("math", "1.0.0")
+    registry.fail("/math/LATEST", 503)
+
+    response = registry_client.request("GET", f"{registry.url}/math/LATEST")
+
+    assert response.status_code == 200
+    assert response.text == "1.0.0"
+    assert registry.count("/math/LATEST") == 2
+
+
+def test_get_gives_up_after_max_attempts(registry):
+    registry.add_package("math", "1.0.0")
+    registry.fail("/math/LATEST", *[502] * registry_client.MAX_ATTEMPTS)
+
+    response = registry_client.request("GET", f"{registry.url}/math/LATEST")
+
+    assert response.status_code == 502
+    assert registry.count("/math/LATEST") == registry_client.MAX_ATTEMPTS
+
+
+def test_post_that_got_a_response_is_not_retried(registry):
+    registry.fail("/track-download", 503)
+
+    response = registry_client.request("POST", f"{registry.url}/track-download",
+                                       params={"name": "math", "version": "1.0.0"})
+
+    # the server may have counted it, sending it again could count the download twice
+    assert response.status_code == 503
+    assert registry.count("/track-download") == 1
+
+
+def test_requests_to_one_host_are_capped(monkeypatch):
+    monkeypatch.setattr(registry_client, "MAX_CONNECTIONS_PER_HOST", 3)
+    with FakeRegistry(latency_ms=50) as registry:
+        registry.add_package("math", "1.0.0")
+
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            statuses = list(pool.map(lambda _: registry_client.request("GET", f"{registry.url}/math/LATEST").status_code,
+                                     range(24)))
+
+    assert statuses == [200] * 24
+    assert registry.max_in_flight == 3
@@ -0,0 +1,68 @@
+import os
+import json
+import shutil
+
+from command_constants import PKG_DIR, LOCKFILE
+from commands import install, uninstall
+
+
+def installed() -> set[str]:
+    return {entry for entry in os.listdir(PKG_DIR) if not entry.startswith(".")}
+
+
+def read_lockfile() -> dict:
+    with open(LOCKFILE) as f:
+        return json.load(f)
+
+
+def install_two_apps(registry) -> None:
+    # app -> math -> bits, and tool -> bits
+    registry.add_package("app", "1.0.0", [("math", "1.0.0")])
+    registry.add_package("math", "1.0.0", [("bits", "1.0.0")])
+    registry.add_package("bits", "1.0.0")
+    registry.add_package("tool", "1.0.0", [("bits", "1.0.0")])
+    install.run("app")
+    install.run("tool")
+
+
+def test_uninstall_removes_what_nothing_else_needs(project, registry):
+    install_two_apps(registry)
+
+    uninstall.run("appv1.0.0")
+
+    assert installed() == {"toolv1.0.0", "bitsv1.0.0"}
+    lock = read_lockfile()
+    assert lock["dependencies"] == {"tool": "1.0.0"}
+    assert sorted(lock["packages"]) == ["bitsv1.0.0", "toolv1.0.0"]
+
+
+def test_uninstall_keeps_a_package_another_one_imports(project, registry, capsys):
+    install_two_apps(registry)
+    lockfile_bytes = open(LOCKFILE, "rb").read()
+
+    uninstall.run("bitsv1.0.0")
+
+    assert "needed by mathv1.0.0, toolv1.0.0" in capsys.readouterr().out
+    assert installed() == {"appv1.0.0", "mathv1.0.0", "bitsv1.0.0", "toolv1.0.0"}
+    assert open(LOCKFILE, "rb").read() == lockfile_bytes
+
+
+def test_the_lockfile_installs_what_is_left(project, registry):
+    install_two_apps(registry)
+    uninstall.run("toolv1.0.0")
+    shutil.rmtree(PKG_DIR)
+
+    install.run()
+
+    assert installed() == {"appv1.0.0", "mathv1.0.0", "bitsv1.0.0"}
+
+
+def test_uninstall_without_a_lockfile_removes_the_folder(project, registry):
+    registry.add_package("math", "1.0.0")
+    install.run("mathv1.0.0")
+    os.remove(LOCKFILE)
+
+    uninstall.run("mathv1.0.0")
+
+    assert installed() == set()
+    assert not os.path.exists(LOCKFILE)
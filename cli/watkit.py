@@ -12,6 +12,7 @@ from commands.login import run as login_command
 from commands.logout import run as logout_command
 from commands.pack import run as pack_command
 from commands.search import run as search_command
+from commands.store import run as store_command
 
 def main():
     parser = argparse.ArgumentParser(prog="watkit", description="watkit - a wat package manager")
@@ -31,9 +32,11 @@ def main():
     group.add_argument("--author", action="store_true", help="Search by author name")
 
     install_parser = subparsers.add_parser("install", help="install a package from the watkit registry")
-    install_parser.add_argument("package", help="name of the package to install")
+    install_parser.add_argument("package", nargs="?", help="name of the package to install (default: everything in watkit.lock)")
     uninstall_parser = subparsers.add_parser("uninstall", help="uninstall a package from the current project")
-    uninstall_parser.add_argument("package", help="name of the package to uninstall")
+    uninstall_parser.add_argument("package", help="name and version of the package to uninstall, like its folder in pkg/")
+    store_parser = subparsers.add_parser("store", help="manage the package store shared by your projects")
+    store_parser.add_argument("action", choices=["prune"], help="prune: remove packages no project uses any more")
 
     run_parser = subparsers.add_parser("run", help="compile + resolve imports + emit language runner")
     run_parser.add_argument("-l", "--lang", choices=["js", "rust"], default="js", help="output language (default: js)")
@@ -60,6 +63,8 @@ def main():
         run_command(args)
     elif args.command == "uninstall":
         uninstall_command(args.package)
+    elif args.command == "store":
+        store_command(args.action)
     elif args.command == "login":
         login_command()
     elif args.command == "logout":
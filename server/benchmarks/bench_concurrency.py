@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Measure tail latency of the registry server under concurrent load against a local S3 stand-in.
+
+    python benchmarks/bench_concurrency.py [--parallel 100] [--requests 3000] [--s3-latency-ms 30]
+                                           [--s3-concurrency 32] [--packages 300] [--cold]
+
+Starts moto's S3 over HTTP (every S3 request delayed by --s3-latency-ms), seeds a synthetic
+registry, runs the real app under uvicorn and keeps --parallel requests in flight across a mix
+of endpoints. S3 calls, SQLite and search ranking all share the run_blocking pool, whose size is
+--s3-concurrency. /blob-cache/stats doesn't use the pool, so its latency shows how long the event
+loop itself was held up. Every package is requested once before the clock starts, so the run
+measures steady state, unless --cold is given. Prints p50/p95/p99/max per endpoint, throughput,
+and how much CPU the server process used: when it's near 100% the box, not the pool, is the limit.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import json as json_module
+import argparse
+import tempfile
+import subprocess
+from urllib.parse import urlencode, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+import httpx
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from benchmarks.fake_registry import FakeS3Server, free_port, seed_package
+
+BUCKET = "watkit-bench"
+INSTALLER_KEY = "watkit-installer.tar.gz"
+# no "v" in these, the CLI splits pkg/<name>v<version> imports at the first one
+WORDS = ["math", "array", "alloc", "string", "utils", "hash", "json", "list", "matrix", "sort"]
+
+# endpoint -> share of the requests
+MIX = {
+    "search": 0.20,
+    "manifest": 0.20,
+    "archive": 0.15,
+    "track-download": 0.15,
+    "resolve": 0.10,
+    "download": 0.10,
+    "loop probe": 0.10,
+}
+
+
+def seed_registry(endpoint_url: str, packages: int, installer_bytes: int) -> list[str]:
+    """
+    Create the bucket with packages chained 5 deep by their dependencies, plus one installer file.
+    Returns the package names.
+    """
+    s3 = boto3.client("s3", endpoint_url=endpoint_url, region_name="us-east-1",
+                      aws_access_key_id="bench", aws_secret_access_key="bench",
+                      config=Config(max_pool_connections=32))
+    s3.create_bucket(Bucket=BUCKET)
+    rng = random.Random(1)
+    names = [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i}" for i in range(packages)]
+
+    def seed(i: int) -> None:
+        dependencies = [(names[i - 1], "1.0.0")] if i % 5 else []
+        seed_package(s3, BUCKET, names[i], "1.0.0", f"author{i % 40}", dependencies,
+                     description=f"{' '.join(random.Random(i).sample(WORDS, 4))} for webassembly")
+
+    # the stand-in adds latency to every call, so the puts go up concurrently
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(seed, range(packages)))
+    s3.put_object(Bucket=BUCKET, Key=INSTALLER_KEY, Body=os.urandom(installer_bytes))
+    return names
+
+
+def start_server(endpoint_url: str, s3_concurrency: int, tmpdir: str) -> tuple[subprocess.Popen, str]:
+    os.makedirs(os.path.join(tmpdir, "web"), exist_ok=True)
+    port = free_port()
+    env = {
+        **os.environ,
+        "AWS_ENDPOINT_URL": endpoint_url,
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_REGION": "us-east-1",
+        "S3_BUCKET_NAME": BUCKET,
+        "S3_MAX_CONCURRENCY": str(s3_concurrency),
+        "WATKIT_DB_PATH": os.path.join(tmpdir, "watkit.db"),
+        "BLOB_CACHE_DIR": os.path.join(tmpdir, "blob-cache"),
+        "GITHUB_CLIENT_ID": "bench",
+        "GITHUB_CLIENT_SECRET": "bench",
+        "JWT_SECRET": "bench",
+        "REDIRECT_URI": "http://localhost/callback",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", SERVER_DIR, "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=tmpdir, env=env, stdout=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/downloads").status_code == 200:
+                return server, base_url
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            raise SystemExit("server exited during startup")
+        time.sleep(0.2)
+    server.kill()
+    raise SystemExit("server didn't come up")
+
+
+def make_request(kind: str, names: list[str], rng: random.Random) -> tuple[str, str, dict]:
+    name = rng.choice(names)
+    if kind == "search":
+        return "GET", "/search", {"params": {"q": rng.choice(WORDS), "by": "name"}}
+    if kind == "manifest":
+        return "GET", f"/package/{name}/1.0.0/manifest", {}
+    if kind == "archive":
+        return "GET", f"/package/{name}/1.0.0/archive", {}
+    if kind == "track-download":
+        return "POST", "/track-download", {"params": {"name": name, "version": "1.0.0"}}
+    if kind == "resolve":
+        return "POST", "/resolve", {"json": {"packages": [{"name": name}]}}
+    if kind == "download":
+        return "GET", f"/download/{INSTALLER_KEY}", {}
+    return "GET", "/blob-cache/stats", {}
+
+
+async def warm_up(base_url: str, names: list[str], parallel: int) -> None:
+    """
+    Touch every package once through each endpoint that caches something: the blob cache, metadata
+    documents, download counter rows and the search indexes. The measured run then sees steady state.
+    """
+    requests = [("GET", "/search", {"params": {"q": word, "by": "name"}}) for word in WORDS]
+    for name in names:
+        requests += [
+            ("GET", f"/package/{name}/1.0.0/manifest", {}),
+            ("GET", f"/package/{name}/1.0.0/archive", {}),
+            ("POST", "/resolve", {"json": {"packages": [{"name": name}]}}),
+        ]
+    semaphore = asyncio.Semaphore(parallel)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        async def send(method, path, options):
+            async with semaphore:
+                response = await client.request(method, path, **options)
+                if response.status_code != 200:
+                    raise SystemExit(f"warm up failed: {method} {path} -> {response.status_code}")
+        await asyncio.gather(*(send(*request) for request in requests))
+
+
+def cpu_seconds(pid: int) -> float:
+    """
+    User plus system CPU time of a process so far, from /proc. 0 where there's no /proc.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class RawConnection:
+    """
+    A bare HTTP/1.1 keep-alive connection. httpx costs more CPU per request than the server
+    does, which on a small box would make this measure the client instead of the server.
+    """
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, params: dict | None = None, json: dict | None = None) -> int:
+        """
+        Send a request and read the whole response. Returns the status code.
+        """
+        if params:
+            path += "?" + urlencode(params)
+        body = json_module.dumps(json).encode("utf-8") if json is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if json is not None:
+            head += "Content-Type: application/json\r\n"
+        message = head.encode("ascii") + b"\r\n" + body
+
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.writer.write(message)
+            status_line = await self.reader.readline()
+            if status_line:
+                break
+            # the server closed the kept-alive connection before reading this request, send it again
+            self.close()
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if "content-length" in headers:
+            await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding") == "chunked":
+            while size := int((await self.reader.readline()).strip(), 16):
+                await self.reader.readexactly(size + 2)
+            await self.reader.readline()
+        if headers.get("connection") == "close":
+            self.close()
+        return status
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def run_load(base_url: str, names: list[str], total: int, parallel: int,
+                   seed: int) -> tuple[dict, float, list[str]]:
+    """
+    Send total requests, parallel at a time.
+    Returns ({kind: [seconds, ...]}, elapsed seconds, [failed request, ...]).
+    """
+    rng = random.Random(seed)
+    kinds = rng.choices(list(MIX), weights=list(MIX.values()), k=total)
+    latencies = {kind: [] for kind in MIX}
+    failures = []
+    queue = asyncio.Queue()
+    for kind in kinds:
+        queue.put_nowait(kind)
+    url = urlsplit(base_url)
+
+    async def worker():
+        connection = RawConnection(url.hostname, url.port)
+        while not queue.empty():
+            kind = queue.get_nowait()
+            method, path, options = make_request(kind, names, rng)
+            start = time.perf_counter()
+            try:
+                status = await connection.request(method, path, **options)
+            except asyncio.IncompleteReadError as e:
+                # the server dropped the connection partway through the body
+                connection.close()
+                failures.append(f"{method} {path} -> cut off after {len(e.partial)} of {e.expected} bytes")
+                continue
+            latencies[kind].append(time.perf_counter() - start)
+            if status != 200:
+                failures.append(f"{method} {path} -> {status}")
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(parallel)))
+    elapsed = time.perf_counter() - began
+    return latencies, elapsed, failures
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--parallel", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--s3-latency-ms", type=float, default=30)
+    parser.add_argument("--s3-concurrency", type=int, default=32)
+    parser.add_argument("--packages", type=int, default=300)
+    parser.add_argument("--installer-kib", type=int, default=512)
+    parser.add_argument("--cold", action="store_true",
+                        help="skip the warm up, so blob cache and metadata misses hold pool threads on S3")
+    args = parser.parse_args()
+
+    fake_s3 = FakeS3Server(args.s3_latency_ms).start()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        names = seed_registry(fake_s3.endpoint_url, args.packages, args.installer_kib * 1024)
+        server, base_url = start_server(fake_s3.endpoint_url, args.s3_concurrency, tmpdir)
+        try:
+            if not args.cold:
+                asyncio.run(warm_up(base_url, names, args.parallel))
+            cpu_before = cpu_seconds(server.pid)
+            latencies, elapsed, failures = asyncio.run(
+                run_load(base_url, names, args.requests, args.parallel, seed=1)
+            )
+            server_cpu = cpu_seconds(server.pid) - cpu_before
+        finally:
+            server.terminate()
+            server.wait()
+    fake_s3.stop()
+
+    print(f"{args.parallel} in flight, {args.requests} requests, S3 latency {args.s3_latency_ms:g}ms, "
+          f"pool of {args.s3_concurrency} threads, {os.cpu_count()} cpus, {'cold' if args.cold else 'warm'} caches")
+    print(f"{'endpoint':>15} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    everything = []
+    for kind, values in latencies.items():
+        everything += values
+        print(f"{kind:>15} {len(values):>6} {percentile(values, 0.5) * 1000:>8.1f} {percentile(values, 0.95) * 1000:>8.1f} "
+              f"{percentile(values, 0.99) * 1000:>8.1f} {max(values) * 1000:>8.1f}")
+    print(f"{'all':>15} {len(everything):>6} {percentile(everything, 0.5) * 1000:>8.1f} "
+          f"{percentile(everything, 0.95) * 1000:>8.1f} {percentile(everything, 0.99) * 1000:>8.1f} "
+          f"{max(everything) * 1000:>8.1f}")
+    print(f"{args.requests / elapsed:.0f} requests/s, server busy {server_cpu / elapsed:.0%} of one cpu "
+          f"({server_cpu / args.requests * 1000:.1f}ms cpu per request)")
+    if failures:
+        for failure in failures[:5]:
+            print(failure)
+        raise SystemExit(f"{len(failures)} requests failed")
+
+
+if __name__ == "__main__":
+    main()
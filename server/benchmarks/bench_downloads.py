@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Measure download counting throughput as the number of worker processes grows.
+
+    python benchmarks/bench_downloads.py [--workers 1 2 4 8] [--downloads 5000] [--versions 200]
+
+Every worker counts its share of the downloads into one shared database, the way uvicorn
+workers do, and the totals are checked at the end. Prints downloads per second for each
+worker count. Counts are only ever written by one process at a time (SQLite has one writer),
+so throughput stops growing once commits, not request handling, are the bottleneck.
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# helpers.s3 needs these to build its client. every row is seeded up front, so S3 is never called
+for variable, value in {"AWS_ACCESS_KEY_ID": "bench", "AWS_SECRET_ACCESS_KEY": "bench",
+                        "AWS_REGION": "us-east-1", "S3_BUCKET_NAME": "bench"}.items():
+    os.environ.setdefault(variable, value)
+
+
+def _prepare(db_path: str, versions: int) -> None:
+    os.environ["WATKIT_DB_PATH"] = db_path
+    from helpers.db import transaction
+
+    with transaction() as conn:
+        conn.executemany("INSERT INTO download_counts (name, version, count) VALUES ('bench', ?, 0)",
+                         [(f"{i}.0",) for i in range(versions)])
+        conn.execute("INSERT INTO global_counters (key, count) VALUES ('total_downloads', 0)")
+
+
+def _count_downloads(db_path: str, versions: int, downloads: int, ready, start, offset: int) -> None:
+    os.environ["WATKIT_DB_PATH"] = db_path
+    from helpers.downloads import increment_download_counts
+
+    ready.release()
+    start.wait()
+    for i in range(downloads):
+        increment_download_counts("bench", f"{(offset + i) % versions}.0")
+
+
+def run(workers: int, downloads: int, versions: int) -> float:
+    """
+    Count downloads from workers processes at once. Returns downloads per second.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "watkit.db")
+        # each process picks up WATKIT_DB_PATH when it imports helpers.db
+        context = multiprocessing.get_context("spawn")
+        setup = context.Process(target=_prepare, args=(db_path, versions))
+        setup.start()
+        setup.join()
+
+        ready = context.Semaphore(0)
+        start = context.Event()
+        per_worker = downloads // workers
+        processes = [
+            context.Process(target=_count_downloads,
+                            args=(db_path, versions, per_worker, ready, start, i * per_worker))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        # the clock starts once every worker has finished importing
+        for _ in processes:
+            ready.acquire()
+        began = time.perf_counter()
+        start.set()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - began
+
+        with sqlite3.connect(db_path) as conn:
+            counted = conn.execute("SELECT SUM(count) FROM download_counts").fetchone()[0]
+            total = conn.execute("SELECT count FROM global_counters WHERE key = 'total_downloads'").fetchone()[0]
+        if counted != per_worker * workers or total != per_worker * workers:
+            raise SystemExit(f"lost downloads with {workers} workers: counted {counted} and {total}, "
+                             f"expected {per_worker * workers}")
+    return per_worker * workers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--downloads", type=int, default=5000)
+    parser.add_argument("--versions", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cpus")
+    print(f"{'workers':>8} {'downloads/s':>12} {'vs 1 worker':>12}")
+    baseline = None
+    for workers in args.workers:
+        rate = run(workers, args.downloads, args.versions)
+        baseline = baseline or rate
+        print(f"{workers:>8} {rate:>12.0f} {rate / baseline:>11.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Measure how long a publish takes end to end against a local S3 stand-in.
+
+    python benchmarks/bench_publish.py [--publishes 40] [--parallel 1 8] [--s3-latency-ms 30]
+                                       [--archive-kib 64] [--packages 10]
+
+Starts moto's S3 over HTTP (every S3 request delayed by --s3-latency-ms) and the real app under
+uvicorn, like bench_concurrency.py. For each --parallel level, publishes --publishes new versions
+spread over --packages packages, that many at a time, and prints p50/p95/max per publish and
+publishes per second. A publish makes its S3 calls in a few concurrent stages, so with one in
+flight its time is a small multiple of the S3 latency, not one latency per call. Publishes of
+the same package race on LATEST, so higher parallel levels also show the cost of its retries.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+import httpx
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from benchmarks.fake_registry import FakeS3Server, make_watpkg
+from benchmarks.bench_concurrency import seed_registry, start_server, percentile
+
+# start_server runs the app with this secret, so tokens made here are accepted
+os.environ.update({"JWT_SECRET": "bench", "GITHUB_CLIENT_ID": "bench", "GITHUB_CLIENT_SECRET": "bench",
+                   "REDIRECT_URI": "http://localhost/callback"})
+from helpers.auth import create_jwt
+
+
+async def publish_all(base_url: str, archives: list[tuple[str, str, bytes]], parallel: int) -> tuple[list[float], float]:
+    """
+    Publish every (name, version, archive), parallel at a time.
+    Returns ([seconds per publish], elapsed seconds).
+    """
+    semaphore = asyncio.Semaphore(parallel)
+    cookies = {"watkit_token": create_jwt("bench")}
+    latencies = []
+
+    async with httpx.AsyncClient(base_url=base_url, cookies=cookies, timeout=120) as client:
+        async def publish(name: str, version: str, archive: bytes) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/publish", data={"name": name, "version": version},
+                                             files={"watpkg_file": (f"{name}-{version}.watpkg", archive)})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise SystemExit(f"publish of {name}v{version} failed: {response.status_code} {response.text}")
+
+        began = time.perf_counter()
+        await asyncio.gather(*(publish(*item) for item in archives))
+        return latencies, time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--publishes", type=int, default=40)
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--s3-latency-ms", type=float, default=30)
+    parser.add_argument("--s3-concurrency", type=int, default=32)
+    parser.add_argument("--archive-kib", type=int, default=64)
+    parser.add_argument("--packages", type=int, default=10)
+    parser.add_argument("--seed-packages", type=int, default=100,
+                        help="packages already in the registry, so the search index isn't empty")
+    args = parser.parse_args()
+
+    # random bytes barely compress, so the archive is about --archive-kib. only a few extensions
+    # are allowed in an archive, and nothing reads the docs
+    padding = {"docs/data.md": os.urandom(args.archive_kib * 1024)}
+    runs = []
+    fake_s3 = FakeS3Server(args.s3_latency_ms).start()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        seed_registry(fake_s3.endpoint_url, args.seed_packages, installer_bytes=0)
+        server, base_url = start_server(fake_s3.endpoint_url, args.s3_concurrency, tmpdir)
+        try:
+            for run, parallel in enumerate(args.parallel):
+                # fresh packages per run, so every run claims its packages the same way
+                archives = []
+                for i in range(args.publishes):
+                    name, version = f"bench{run}_{i % args.packages}", f"1.0.{i // args.packages}"
+                    archives.append((name, version, make_watpkg(name, version, files=padding)))
+                latencies, elapsed = asyncio.run(publish_all(base_url, archives, parallel))
+                runs.append((parallel, latencies, elapsed))
+        finally:
+            server.terminate()
+            server.wait()
+    fake_s3.stop()
+
+    print(f"{args.publishes} publishes of {args.archive_kib} KiB over {args.packages} packages, "
+          f"S3 latency {args.s3_latency_ms:g}ms, pool of {args.s3_concurrency} threads")
+    print(f"{'parallel':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'publishes/s':>12}")
+    for parallel, latencies, elapsed in runs:
+        print(f"{parallel:>8} {percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} "
+              f"{max(latencies) * 1000:>8.1f} {len(latencies) / elapsed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
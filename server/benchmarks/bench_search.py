@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Compare the trigram index search with the linear SequenceMatcher scan it replaced.
+
+    python benchmarks/bench_search.py [--sizes 1000 10000 100000] [--queries 20]
+
+Prints the average time per query for both, how many queries got exactly the scan's top 15,
+and the index's recall of the scan's top 15, separately for queries that occur in some entry
+and for the rest (mostly typos). Only the best MAX_RESCORE_CANDIDATES by trigram overlap are
+rescored along with every entry containing the query, so a typo can miss a match that shares
+too few trigrams with it.
+"""
+import os
+import sys
+import time
+import random
+import string
+import argparse
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.fuzzy_search import build_trigram_index, search_trigram_index
+
+WORDS = ["math", "vec", "alloc", "string", "utils", "hash", "json", "list", "matrix", "sort",
+         "crypto", "rand", "io", "fmt", "bits", "heap", "tree", "map", "queue", "bigint"]
+
+
+def linear_search(entries: list[dict], query: str, field: str, limit: int = 15) -> list[dict]:
+    """
+    The scan /search used before the index: SequenceMatcher against every entry.
+    """
+    scored_matches = []
+    for entry in entries:
+        target = entry.get(field, "").lower()
+        score = SequenceMatcher(None, query, target).ratio()
+        if score >= 0.5 or query in target:
+            scored_matches.append((score, entry))
+    scored_matches.sort(key=lambda x: x[0], reverse=True)
+    return [entry for _, entry in scored_matches[:limit]]
+
+
+def synthetic_entries(count: int, rng: random.Random) -> list[dict]:
+    entries = []
+    for i in range(count):
+        name = "_".join(rng.sample(WORDS, rng.randint(1, 3)))
+        if rng.random() < 0.5:
+            name += "".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 4)))
+        entries.append({
+            "name": f"{name}{i}",
+            "author": "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))),
+        })
+    return entries
+
+
+def synthetic_queries(count: int, rng: random.Random) -> list[str]:
+    queries = []
+    for _ in range(count):
+        query = rng.choice(WORDS)
+        if rng.random() < 0.3:
+            query += "_" + rng.choice(WORDS)
+        if rng.random() < 0.3 and len(query) > 3:
+            # a typo
+            position = rng.randrange(len(query))
+            query = query[:position] + rng.choice(string.ascii_lowercase) + query[position + 1:]
+        queries.append(query)
+    return queries
+
+
+def average_ms(search, queries: list[str]) -> tuple[float, list]:
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(search(query))
+    return (time.perf_counter() - start) / len(queries) * 1000, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'build ms':>9} {'scan ms':>9} {'index ms':>9} {'speedup':>8} {'same top':>9} "
+          f"{'substring recall':>17} {'typo recall':>12}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        entries = synthetic_entries(size, rng)
+        queries = synthetic_queries(args.queries, rng)
+
+        start = time.perf_counter()
+        index = build_trigram_index(entries, "name")
+        build_ms = (time.perf_counter() - start) * 1000
+
+        scan_ms, expected = average_ms(lambda q: linear_search(entries, q, "name"), queries)
+        index_ms, actual = average_ms(lambda q: search_trigram_index(index, q), queries)
+
+        same = 0
+        # substring query or not -> [found, wanted]
+        recall = {True: [0, 0], False: [0, 0]}
+        for query, old, new in zip(queries, expected, actual):
+            old_names = [entry["name"] for entry in old]
+            new_names = [entry["name"] for entry in new]
+            # the scan's sort is stable too, so equal scores keep entry order in both
+            same += old_names == new_names
+            counts = recall[any(query in entry["name"] for entry in entries)]
+            counts[0] += len(set(old_names) & set(new_names))
+            counts[1] += len(old_names)
+        substring, typo = (found / wanted if wanted else 1.0 for found, wanted in (recall[True], recall[False]))
+        print(f"{size:>8} {build_ms:>9.1f} {scan_ms:>9.2f} {index_ms:>9.2f} {scan_ms / index_ms:>7.1f}x "
+              f"{same:>4}/{len(queries):<4} {substring:>17.1%} {typo:>12.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+A local S3 stand-in and synthetic packages, for the benchmarks and the tests.
+"""
+import io
+import json
+import time
+import socket
+import tarfile
+import multiprocessing
+
+from moto.moto_server.werkzeug_app import DomainDispatcherApplication, create_backend_app
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def _serve_s3(port: int, latency: float) -> None:
+    app = DomainDispatcherApplication(create_backend_app)
+
+    def delayed(environ, start_response):
+        if latency:
+            time.sleep(latency)
+        return app(environ, start_response)
+
+    make_server("127.0.0.1", port, delayed, threaded=True, request_handler=_QuietHandler).serve_forever()
+
+
+class FakeS3Server:
+    """
+    moto's S3 over real HTTP on localhost, with an optional delay on every request
+    so the server's thread pools see something like real S3 latency. Runs in its own
+    process, so it doesn't compete with the caller for the GIL.
+    """
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.port = free_port()
+        self.endpoint_url = f"http://127.0.0.1:{self.port}"
+        self._process = None
+
+    def start(self) -> "FakeS3Server":
+        self._process = multiprocessing.get_context("spawn").Process(
+            target=_serve_s3, args=(self.port, self.latency), daemon=True
+        )
+        self._process.start()
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError("fake S3 didn't come up")
+
+    def stop(self) -> None:
+        self._process.terminate()
+        self._process.join()
+
+
+def make_wat(dependencies: list[tuple[str, str]] = (), exports: list[str] = ("add",)) -> str:
+    """
+    A module importing add from each dependency and exporting an i32 adder under each export name.
+    """
+    lines = ["(module"]
+    for dep_name, dep_version in dependencies:
+        lines.append(f'  (import "pkg/{dep_name}v{dep_version}" "add" '
+                     f'(func ${dep_name}_add (param i32 i32) (result i32)))')
+    for export in exports:
+        lines.append(f'  (func (export "{export}") (param i32 i32) (result i32)')
+        lines.append("    local.get 0")
+        lines.append("    local.get 1")
+        lines.append("    i32.add)")
+    lines.append(")")
+    return "\n".join(lines) + "\n"
+
+
+def make_watpkg(name: str, version: str, dependencies: list[tuple[str, str]] = (), exports: list[str] = ("add",),
+                description: str = "", files: dict[str, bytes] | None = None) -> bytes:
+    """
+    Build a .watpkg (tar.gz) the way `watkit pack` does: watkit.json plus src/main.wat.
+    files adds or replaces archive members by path.
+    """
+    manifest = {
+        "name": name,
+        "version": version,
+        "main": "src/main.wat",
+        "output": "dist/main.wasm",
+        "description": description,
+        "license": "MIT",
+    }
+    members = {
+        "watkit.json": json.dumps(manifest).encode("utf-8"),
+        "src/main.wat": make_wat(dependencies, exports).encode("utf-8"),
+    }
+    members.update(files or {})
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for path, content in members.items():
+            info = tarfile.TarInfo(path)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def seed_package(s3, bucket: str, name: str, version: str, author: str,
+                 dependencies: list[tuple[str, str]] = (), description: str = "") -> bytes:
+    """
+    Put a version into the bucket the way publish lays it out (archive, manifest, LATEST),
+    without its metadata document, so the server builds that from the archive.
+    Returns the archive.
+    """
+    archive = make_watpkg(name, version, dependencies, description=description)
+    manifest = {"name": name, "version": version, "main": "src/main.wat", "output": "dist/main.wasm",
+                "description": description, "author": author}
+    s3.put_object(Bucket=bucket, Key=f"{name}/{version}/{name}-{version}.watpkg", Body=archive)
+    s3.put_object(Bucket=bucket, Key=f"{name}/{version}/watkit.json", Body=json.dumps(manifest).encode("utf-8"))
+    s3.put_object(Bucket=bucket, Key=f"{name}/LATEST", Body=version.encode("utf-8"))
+    return archive
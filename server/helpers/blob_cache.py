@@ -0,0 +1,194 @@
+import os
+import atexit
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+
+from helpers.s3 import s3, BUCKET
+
+# read-through cache of immutable S3 objects (versioned manifests and archives) on local disk
+BLOB_CACHE_DIR = os.environ.get("BLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "watkit-blob-cache"))
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BLOB_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# key -> {"path": str, "size": int, "etag": str, "pins": int}, least recently used first
+_entries = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+# key -> Event, set once the request filling that key is done
+_fills = {}
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_initialized = False
+# each worker process keeps its own directory, since the index only lives in its memory
+_cache_dir = os.path.join(BLOB_CACHE_DIR, str(os.getpid()))
+
+
+def _init_cache_dir() -> None:
+    """
+    Start from an empty cache dir and remove it again when the worker exits.
+    """
+    global _initialized
+    if not _initialized:
+        shutil.rmtree(_cache_dir, ignore_errors=True)
+        os.makedirs(_cache_dir, exist_ok=True)
+        atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+        _initialized = True
+
+
+def _evict_locked() -> None:
+    """
+    Drop least recently used blobs until we're back under budget. Always keeps the newest one,
+    so a single blob bigger than the budget is still served, and skips pinned ones, which are
+    being served straight from their path. Caller holds _lock.
+    """
+    global _total_bytes
+    for key, entry in list(_entries.items())[:-1]:
+        if _total_bytes <= BLOB_CACHE_MAX_BYTES:
+            break
+        if entry["pins"]:
+            continue
+        del _entries[key]
+        _total_bytes -= entry["size"]
+        _stats["evictions"] += 1
+        try:
+            # removed under the lock, so open_cached_blob never opens a file that's about to go.
+            # on posix a response already streaming this file keeps its open handle
+            os.remove(entry["path"])
+        except OSError:
+            pass
+
+
+def _fill(key: str) -> dict | None:
+    """
+    Download a blob into the cache, hashing it for a strong ETag. Returns None if the key doesn't exist.
+    """
+    global _total_bytes
+    path = os.path.join(_cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest())
+    fd, tmp_path = tempfile.mkstemp(dir=_cache_dir, suffix=".tmp")
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            try:
+                body = s3.get_object(Bucket=BUCKET, Key=key)["Body"]
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                    return None
+                raise
+            for chunk in body.iter_chunks(1024 * 1024):
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+
+        entry = {"path": path, "size": size, "etag": f'"{digest.hexdigest()}"', "pins": 0}
+        with _lock:
+            if key in _entries:
+                # filled by another request meanwhile. its file may be pinned, so it's kept as it is
+                return _entries[key]
+            # moved into place under the lock, so an eviction of an older copy can't remove it
+            os.replace(tmp_path, path)
+            _entries[key] = entry
+            _total_bytes += size
+            _evict_locked()
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return entry
+
+
+def get_cached_blob(key: str) -> dict | None:
+    """
+    Get a local copy of an immutable S3 object, fetching it on a miss.
+    Concurrent misses for the same key share one fetch. Returns None if the key doesn't exist.
+    Only use this for keys that never change, there's no revalidation.
+    The file can be evicted at any time, use open_cached_blob to read it.
+    """
+    with _lock:
+        _init_cache_dir()
+        entry = _entries.get(key)
+        if entry:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return entry
+
+        event = _fills.get(key)
+        leader = event is None
+        if leader:
+            event = threading.Event()
+            _fills[key] = event
+        _stats["misses"] += 1
+
+    if not leader:
+        event.wait()
+        with _lock:
+            entry = _entries.get(key)
+        # the fill failed or found nothing, fetch ourselves rather than guess
+        return entry or _fill(key)
+
+    try:
+        return _fill(key)
+    finally:
+        with _lock:
+            del _fills[key]
+        event.set()
+
+
+def open_cached_blob(key: str):
+    """
+    Get a local copy of an immutable S3 object like get_cached_blob, with its file already open.
+    The file is opened while the blob is known to be in the cache, so a later eviction can't
+    remove it from under the caller. The caller closes it.
+    Returns (entry, file), or None if the key doesn't exist.
+    """
+    while True:
+        entry = get_cached_blob(key)
+        if entry is None:
+            return None
+        with _lock:
+            # evicted or replaced since the lookup, the file may be gone
+            if _entries.get(key) is entry:
+                return entry, open(entry["path"], "rb")
+
+
+def pin_cached_blob(key: str) -> dict | None:
+    """
+    Get a local copy of an immutable S3 object like get_cached_blob, and keep it from being
+    evicted until unpin_cached_blob, so its path can be handed to something that opens it later.
+    Returns the entry, or None if the key doesn't exist.
+    """
+    while True:
+        entry = get_cached_blob(key)
+        if entry is None:
+            return None
+        with _lock:
+            # evicted or replaced since the lookup, the file may be gone
+            if _entries.get(key) is entry:
+                entry["pins"] += 1
+                return entry
+
+
+def unpin_cached_blob(entry: dict) -> None:
+    """
+    Let a pinned entry be evicted again, and catch up on evictions it held back.
+    """
+    with _lock:
+        entry["pins"] -= 1
+        if not entry["pins"]:
+            _evict_locked()
+
+
+def get_blob_cache_stats() -> dict:
+    """
+    Get hit/miss counters and the current size of the blob cache.
+    """
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_ratio": _stats["hits"] / lookups if lookups else 0.0,
+            "blobs": len(_entries),
+            "bytes": _total_bytes,
+            "max_bytes": BLOB_CACHE_MAX_BYTES,
+        }
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# local database shared by every uvicorn worker on this machine, where the routes read registry
+# metadata from. in production it sits on the machine's volume (see fly.toml), so it survives restarts,
+# but it's never synced with anything: there is exactly one machine, and everything in the database
+# still has to be rebuildable from the bucket for when the volume is lost, which is why publishes
+# still write LATEST and OWNER files and downloads are flushed to S3
+DB_PATH = os.environ.get("WATKIT_DB_PATH", "watkit.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS download_counts (
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    pending INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, version)
+);
+
+CREATE TABLE IF NOT EXISTS global_counters (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0,
+    pending INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_download_counts_pending ON download_counts (pending) WHERE pending > 0;
+
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT PRIMARY KEY,
+    latest TEXT NOT NULL,
+    author TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT ''
+);
+
+CREATE TABLE IF NOT EXISTS versions (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    author TEXT,
+    published_at REAL,
+    PRIMARY KEY (package, version)
+);
+
+CREATE TABLE IF NOT EXISTS owners (
+    package TEXT PRIMARY KEY,
+    owner TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS authors (
+    username TEXT PRIMARY KEY
+);
+
+-- ids are never reused, so readers can pick up new rows by id
+CREATE TABLE IF NOT EXISTS exports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    results TEXT NOT NULL,
+    UNIQUE (package, version, name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_packages_author ON packages (author);
+CREATE INDEX IF NOT EXISTS idx_exports_name ON exports (name);
+CREATE INDEX IF NOT EXISTS idx_owners_owner ON owners (owner);
+"""
+
+# columns added after a table was first created: (table, column, definition)
+ADDED_COLUMNS = [
+    ("packages", "description", "TEXT NOT NULL DEFAULT ''"),
+    # 1 while a publish holds the version and is still uploading it
+    ("versions", "pending", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def get_db() -> sqlite3.Connection:
+    """
+    Get this thread's connection to the local database, creating the schema on first use.
+    Connections are in autocommit mode, use transaction() for multi-statement writes.
+    """
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers in other workers carry on while one of them writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn = conn
+
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(SCHEMA)
+                _add_missing_columns(conn)
+                _schema_ready = True
+    return conn
+
+
+def _add_missing_columns(conn: sqlite3.Connection) -> None:
+    """
+    Bring tables created by an older schema up to date, CREATE TABLE IF NOT EXISTS leaves them alone.
+    """
+    for table, column, definition in ADDED_COLUMNS:
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            try:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            except sqlite3.OperationalError as e:
+                # another worker got there first
+                if "duplicate column" not in str(e):
+                    raise
+
+
+@contextmanager
+def transaction():
+    """
+    Run a block inside BEGIN IMMEDIATE ... COMMIT, so the write lock is taken up front and
+    concurrent read-modify-writes from other workers wait instead of failing halfway.
+    """
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
@@ -0,0 +1,221 @@
+import os
+import time
+import threading
+
+from helpers.s3 import s3_read_versioned, s3_update_text
+from helpers.db import get_db, transaction
+
+TOTAL_DOWNLOADS_KEY = "total_downloads.txt"
+
+# downloads are counted in the local database, which is what the routes read. they're also written
+# to S3 in batches on this interval, so the counts survive losing the database and can be imported again
+DOWNLOAD_FLUSH_INTERVAL_SECONDS = float(os.environ.get("DOWNLOAD_FLUSH_INTERVAL_SECONDS", "10"))
+
+TOTAL_COUNTER = "total_downloads"
+
+# per-package totals for search ranking are summed up at most this often, a slightly stale
+# count doesn't change the order of results in any way that matters
+DOWNLOAD_TOTALS_TTL_SECONDS = float(os.environ.get("DOWNLOAD_TOTALS_TTL_SECONDS", "30"))
+
+_totals_lock = threading.Lock()
+_totals_memo = {"loaded_at": None, "totals": {}}
+
+_flusher_thread = None
+_flusher_stop = threading.Event()
+
+def _count_key(package_name: str, version: str) -> str:
+    return f"downloads/{package_name}/{version}/count.txt"
+
+def _parse_count(text: str | None) -> int:
+    return int(text.strip()) if text is not None else 0
+
+def _read_count(key: str) -> int:
+    # a missing counter is 0, anything else that goes wrong is raised: a count read as 0 by
+    # mistake would be written back over the real one
+    body, _ = s3_read_versioned(key)
+    return _parse_count(body.decode("utf-8") if body is not None else None)
+
+def _add_to_count(key: str, delta: int) -> None:
+    # compare-and-swap, so flushes from several machines or workers never overwrite each other's deltas
+    s3_update_text(key, lambda text: str(_parse_count(text) + delta))
+
+# the database holds count (everything we know about) and pending (the part not in S3 yet).
+# rows are seeded from S3 the first time a counter is touched on this machine.
+
+def _seed_package_count(conn, package_name: str, version: str) -> None:
+    row = conn.execute("SELECT 1 FROM download_counts WHERE name = ? AND version = ?",
+                       (package_name, version)).fetchone()
+    if row is None:
+        conn.execute("INSERT OR IGNORE INTO download_counts (name, version, count) VALUES (?, ?, ?)",
+                     (package_name, version, _read_count(_count_key(package_name, version))))
+
+def _seed_total_count(conn) -> None:
+    row = conn.execute("SELECT 1 FROM global_counters WHERE key = ?", (TOTAL_COUNTER,)).fetchone()
+    if row is None:
+        conn.execute("INSERT OR IGNORE INTO global_counters (key, count) VALUES (?, ?)",
+                     (TOTAL_COUNTER, _read_count(TOTAL_DOWNLOADS_KEY)))
+
+def get_package_download_count(package_name: str, version: str) -> int:
+    """
+    Get the download count for a specific package version, including downloads not flushed yet
+    """
+    conn = get_db()
+    _seed_package_count(conn, package_name, version)
+    row = conn.execute("SELECT count FROM download_counts WHERE name = ? AND version = ?",
+                       (package_name, version)).fetchone()
+    return row["count"]
+
+class _NotSeeded(Exception):
+    """
+    A counter row doesn't exist on this machine yet, so the increment was rolled back.
+    """
+
+def _increment_seeded(package_name: str, version: str) -> tuple[int, int]:
+    with transaction() as conn:
+        package_row = conn.execute("UPDATE download_counts SET count = count + 1, pending = pending + 1 "
+                                   "WHERE name = ? AND version = ? RETURNING count",
+                                   (package_name, version)).fetchone()
+        total_row = conn.execute("UPDATE global_counters SET count = count + 1, pending = pending + 1 "
+                                 "WHERE key = ? RETURNING count", (TOTAL_COUNTER,)).fetchone()
+        if package_row is None or total_row is None:
+            raise _NotSeeded()
+    return package_row["count"], total_row["count"]
+
+def increment_download_counts(package_name: str, version: str) -> tuple[int, int]:
+    """
+    Count a download for a specific package version and towards the registry-wide total, in one
+    transaction. Only touches the local database, the flusher writes it to S3.
+    Returns (new package version count, new total)
+    """
+    try:
+        return _increment_seeded(package_name, version)
+    except _NotSeeded:
+        pass
+    # first download of this version on this machine. the rows are seeded from S3 outside the
+    # transaction, so the write lock is never held across an S3 read
+    conn = get_db()
+    _seed_package_count(conn, package_name, version)
+    _seed_total_count(conn)
+    return _increment_seeded(package_name, version)
+
+def get_download_counter() -> int:
+    """
+    Get the registry-wide download total, including downloads not flushed yet
+    """
+    conn = get_db()
+    _seed_total_count(conn)
+    row = conn.execute("SELECT count FROM global_counters WHERE key = ?", (TOTAL_COUNTER,)).fetchone()
+    return row["count"]
+
+def get_pending_download_stats() -> dict:
+    """
+    Get the size of the write-behind buffer.
+    """
+    conn = get_db()
+    row = conn.execute("SELECT COUNT(*) AS versions, COALESCE(SUM(pending), 0) AS downloads "
+                       "FROM download_counts WHERE pending > 0").fetchone()
+    total = conn.execute("SELECT pending FROM global_counters WHERE key = ?", (TOTAL_COUNTER,)).fetchone()
+    return {
+        "pending_versions": row["versions"],
+        "pending_downloads": row["downloads"],
+        "pending_total": total["pending"] if total else 0,
+    }
+
+def _claim_pending() -> tuple[dict, int]:
+    """
+    Take every pending delta out of the database in one transaction, so two workers
+    flushing at the same time never write the same downloads twice.
+    """
+    with transaction() as conn:
+        rows = conn.execute("SELECT name, version, pending FROM download_counts WHERE pending > 0").fetchall()
+        conn.execute("UPDATE download_counts SET pending = 0 WHERE pending > 0")
+        total = conn.execute("SELECT pending FROM global_counters WHERE key = ?", (TOTAL_COUNTER,)).fetchone()
+        conn.execute("UPDATE global_counters SET pending = 0 WHERE key = ?", (TOTAL_COUNTER,))
+    counts = {(row["name"], row["version"]): row["pending"] for row in rows}
+    return counts, total["pending"] if total else 0
+
+def _return_pending(counts: dict, total: int) -> None:
+    with transaction() as conn:
+        for (package_name, version), delta in counts.items():
+            conn.execute("UPDATE download_counts SET pending = pending + ? WHERE name = ? AND version = ?",
+                         (delta, package_name, version))
+        if total:
+            conn.execute("UPDATE global_counters SET pending = pending + ? WHERE key = ?", (total, TOTAL_COUNTER))
+
+def flush_download_counts() -> None:
+    """
+    Write the buffered download deltas to S3: each version's count.txt and total_downloads.txt.
+    Deltas that fail to write go back in the buffer.
+    """
+    counts, total = _claim_pending()
+
+    failed = {}
+    for (package_name, version), delta in counts.items():
+        key = _count_key(package_name, version)
+        try:
+            _add_to_count(key, delta)
+        except Exception as e:
+            print(f"Error flushing downloads for {package_name}v{version}: {e}")
+            failed[(package_name, version)] = delta
+
+    if total:
+        try:
+            _add_to_count(TOTAL_DOWNLOADS_KEY, total)
+            total = 0
+        except Exception as e:
+            print(f"Error saving total downloads: {e}")
+
+    if failed or total:
+        _return_pending(failed, total)
+
+def _flush_loop() -> None:
+    while not _flusher_stop.wait(DOWNLOAD_FLUSH_INTERVAL_SECONDS):
+        try:
+            flush_download_counts()
+        except Exception as e:
+            print(f"Error flushing download counts: {e}")
+
+def start_download_flusher() -> None:
+    """
+    Start the background thread that flushes buffered downloads on an interval.
+    """
+    global _flusher_thread
+    if _flusher_thread and _flusher_thread.is_alive():
+        return
+    _flusher_stop.clear()
+    _flusher_thread = threading.Thread(target=_flush_loop, name="download-flusher", daemon=True)
+    _flusher_thread.start()
+
+def stop_download_flusher() -> None:
+    """
+    Stop the flusher thread and write out whatever is still buffered.
+    """
+    _flusher_stop.set()
+    if _flusher_thread:
+        _flusher_thread.join()
+    flush_download_counts()
+
+def get_package_total_downloads(package_name: str) -> int:
+    """
+    Get the total download count across all versions of a package
+    """
+    row = get_db().execute("SELECT COALESCE(SUM(count), 0) AS total FROM download_counts WHERE name = ?",
+                           (package_name,)).fetchone()
+    return row["total"]
+
+def get_all_package_total_downloads() -> dict[str, int]:
+    """
+    Get the total download count of every package, as {name: total}.
+    Summed in one query and reused for DOWNLOAD_TOTALS_TTL_SECONDS. Shared, don't mutate it.
+    """
+    now = time.monotonic()
+    with _totals_lock:
+        if _totals_memo["loaded_at"] is not None and now - _totals_memo["loaded_at"] < DOWNLOAD_TOTALS_TTL_SECONDS:
+            return _totals_memo["totals"]
+
+    rows = get_db().execute("SELECT name, SUM(count) AS total FROM download_counts GROUP BY name").fetchall()
+    totals = {row["name"]: row["total"] for row in rows}
+    with _totals_lock:
+        _totals_memo["loaded_at"] = now
+        _totals_memo["totals"] = totals
+    return totals
@@ -0,0 +1,96 @@
+import threading
+
+from helpers.db import get_db
+from helpers.registry_db import get_generation, get_exports_deleted
+from helpers.fuzzy_search import build_trigram_index, add_to_trigram_index, search_trigram_index
+
+# in-memory inverted index from exported function name to the package versions exporting it.
+# new export rows are folded in as they're published, it's only rebuilt from scratch after a
+# publish is rolled back
+_lock = threading.Lock()
+_index = {
+    "generation": None,
+    "last_id": 0,
+    "rows": 0,
+    # the exports_deleted counter the index was built at
+    "deleted": None,
+    # export name -> package -> version -> {"params": [...], "results": [...]}
+    "names": {},
+    # trigram index over the distinct export names, for fuzzy matches
+    "trigrams": build_trigram_index([], "name"),
+}
+_stats = {"hits": 0, "updates": 0, "rebuilds": 0}
+
+
+def _add_row(row) -> None:
+    packages = _index["names"].get(row["name"])
+    if packages is None:
+        packages = _index["names"][row["name"]] = {}
+        add_to_trigram_index(_index["trigrams"], {"name": row["name"]}, "name")
+    packages.setdefault(row["package"], {})[row["version"]] = {
+        "params": row["params"].split(),
+        "results": row["results"].split(),
+    }
+
+
+def _refresh() -> None:
+    """
+    Bring the index up to date with the database. Caller holds _lock.
+    """
+    generation = get_generation()
+    if _index["generation"] == generation:
+        _stats["hits"] += 1
+        return
+
+    conn = get_db()
+    deleted = get_exports_deleted()
+    if _index["deleted"] != deleted:
+        # rows were deleted, start over
+        rows = conn.execute("SELECT id, package, version, name, params, results FROM exports ORDER BY id").fetchall()
+        _index["names"] = {}
+        _index["trigrams"] = build_trigram_index([], "name")
+        _index["rows"] = 0
+        _index["deleted"] = deleted
+        _stats["rebuilds"] += 1
+    else:
+        rows = conn.execute("SELECT id, package, version, name, params, results FROM exports WHERE id > ? ORDER BY id",
+                            (_index["last_id"],)).fetchall()
+        _stats["updates"] += 1
+
+    for row in rows:
+        _add_row(row)
+    if rows:
+        _index["last_id"] = rows[-1]["id"]
+    _index["rows"] += len(rows)
+    _index["generation"] = generation
+
+
+def search_exports(query: str, limit: int = 15) -> list[dict]:
+    """
+    Find packages exporting a function whose name matches the query, exact matches first,
+    then fuzzy ones. Returns up to limit packages as
+    [{"package": str, "exports": [{"name", "versions": {version: {"params", "results"}}}]}].
+    """
+    with _lock:
+        _refresh()
+        matched_names = []
+        if query in _index["names"]:
+            matched_names.append(query)
+        for entry in search_trigram_index(_index["trigrams"], query.lower(), limit=limit):
+            if entry["name"] != query:
+                matched_names.append(entry["name"])
+
+        results = {}
+        for export_name in matched_names:
+            for package, versions in _index["names"][export_name].items():
+                if package not in results:
+                    if len(results) >= limit:
+                        continue
+                    results[package] = {"package": package, "exports": []}
+                results[package]["exports"].append({"name": export_name, "versions": dict(versions)})
+    return list(results.values())
+
+
+def get_export_index_stats() -> dict:
+    with _lock:
+        return {**_stats, "names": len(_index["names"]), "rows": _index["rows"]}
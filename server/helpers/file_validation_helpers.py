@@ -1,30 +1,117 @@
 import tarfile
 import os
+import gzip
+import shutil
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, UploadFile
 
 MAX_FILE_COUNT = 200
 MAX_FILE_SIZE = 10 * 1024 * 1024
+# everything in an archive once decompressed, so a small gzip bomb can't fill the disk
+MAX_EXTRACTED_SIZE = int(os.environ.get("MAX_EXTRACTED_SIZE", str(50 * 1024 * 1024)))
+# what the CLI puts in a package, anything else is rejected
+ALLOWED_FILES = {"watkit.json"}
+ALLOWED_EXTENSIONS = {".wat", ".wasm", ".md"}
+# what the server actually needs on disk
+EXTRACTED_EXTENSIONS = {".wat", ".wasm"}
+# compressed size of an uploaded .watpkg
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# archives are decompressed here instead of on the event loop or the S3 pool
+ARCHIVE_WORKERS = int(os.environ.get("ARCHIVE_WORKERS", "4"))
+_archive_executor = ThreadPoolExecutor(max_workers=ARCHIVE_WORKERS, thread_name_prefix="archive")
 
 def is_within_directory(directory: str, target: str) -> bool:
     """Prevent directory traversal"""
     abs_dir = os.path.abspath(directory)
     abs_target = os.path.abspath(target)
-    return os.path.commonprefix([abs_dir, abs_target]) == abs_dir
+    return os.path.commonpath([abs_dir, abs_target]) == abs_dir
+
+class _CappedReader:
+    """
+    File-like wrapper that fails once more than max_bytes have been read through it,
+    so a gzip bomb is stopped by what it decompresses to, not by what its headers claim.
+    """
+    def __init__(self, fileobj, max_bytes: int):
+        self.fileobj = fileobj
+        self.max_bytes = max_bytes
+        self.total = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.total += len(data)
+        if self.total > self.max_bytes:
+            raise ValueError("Archive is too large once decompressed")
+        return data
 
-def safe_extract_tar(tar: tarfile.TarFile, path: str) -> None:
+def extract_package_archive(archive_path: str, path: str, strict: bool = True) -> None:
     """
-    Extract the tar file to the destination directory safely. Checks size and file count.
+    Validate and extract a .watpkg in one streaming pass over the archive. Checks the file count,
+    each file's size, the total decompressed size, paths and file types while reading, and only
+    writes watkit.json and .wat/.wasm files to disk.
+    With strict=False files of other types are skipped instead of rejected, for archives
+    published before these checks.
     """
-    members = tar.getmembers()
+    file_count = 0
+    with open(archive_path, "rb") as raw, gzip.GzipFile(fileobj=raw) as unzipped:
+        # leave room for the tar headers and padding around the files
+        reader = _CappedReader(unzipped, MAX_EXTRACTED_SIZE + (MAX_FILE_COUNT + 2) * 2 * tarfile.BLOCKSIZE)
+        # "r|" reads members as they come instead of seeking around, so nothing is read twice
+        with tarfile.open(fileobj=reader, mode="r|") as tar:
+            for member in tar:
+                file_count += 1
+                if file_count > MAX_FILE_COUNT:
+                    raise ValueError("Too many files in archive")
 
-    if len(members) > MAX_FILE_COUNT:
-        raise ValueError("Too many files in archive")
+                name = os.path.normpath(member.name)
+                target = os.path.join(path, name)
+                if os.path.isabs(name) or not is_within_directory(path, target):
+                    raise ValueError(f"Unsafe path in archive: {member.name}")
+                if member.isdir():
+                    continue
+                # no links or devices, they can point outside the package
+                if not member.isfile():
+                    raise ValueError(f"Unsupported file type in archive: {member.name}")
+                if member.size > MAX_FILE_SIZE:
+                    raise ValueError(f"File too large: {member.name}")
 
-    for member in members:
-        if member.size > MAX_FILE_SIZE:
-            raise ValueError(f"File too large: {member.name}")
+                extension = os.path.splitext(name)[1]
+                if name not in ALLOWED_FILES and extension not in ALLOWED_EXTENSIONS:
+                    if strict:
+                        raise ValueError(f"File type not allowed in archive: {member.name}")
+                    continue
+                if name != "watkit.json" and extension not in EXTRACTED_EXTENSIONS:
+                    continue
 
-        extracted_path = os.path.join(path, member.name)
-        if not is_within_directory(path, extracted_path):
-            raise ValueError(f"Unsafe path in archive: {member.name}")
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                source = tar.extractfile(member)
+                with open(target, "wb") as f:
+                    shutil.copyfileobj(source, f, UPLOAD_CHUNK_SIZE)
 
-    tar.extractall(path=path)
+async def extract_package_archive_async(archive_path: str, path: str, strict: bool = True) -> None:
+    """
+    Run extract_package_archive on the archive pool, so a large or hostile upload never holds up the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_archive_executor, extract_package_archive, archive_path, path, strict)
+
+
+async def save_upload(upload: UploadFile, dest_path: str) -> tuple[int, str]:
+    """
+    Copy an upload to disk chunk by chunk, hashing it on the way and giving up as soon as it
+    passes MAX_UPLOAD_SIZE. Memory use doesn't depend on the archive size.
+    Returns (size, sha256 hex digest).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest_path, "wb") as f:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise HTTPException(status_code=413, detail=f"Package archive is larger than {MAX_UPLOAD_SIZE} bytes")
+            digest.update(chunk)
+            f.write(chunk)
+    return size, digest.hexdigest()
@@ -0,0 +1,127 @@
+import heapq
+import threading
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+# how many of the best trigram-overlap candidates get rescored with SequenceMatcher, on top of every
+# entry containing the query. benchmarks/bench_search.py shows the scan's results for queries that occur
+# in the corpus from about 1000 up, 2000 also finds nearly all of its typo matches
+MAX_RESCORE_CANDIDATES = 2000
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Split a string into trigrams, padded so short strings and word edges still get some.
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_trigram_index(entries: list[dict], field: str) -> dict:
+    """
+    Build a trigram inverted index over one field of the search index entries.
+    Postings are lists of entry positions, in ascending order. sizes holds each value's trigram count.
+    """
+    values = [(entry.get(field) or "").lower() for entry in entries]
+    postings = defaultdict(list)
+    sizes = []
+    for i, value in enumerate(values):
+        grams = trigrams(value)
+        sizes.append(len(grams))
+        for gram in grams:
+            postings[gram].append(i)
+
+    return {"entries": entries, "values": values, "sizes": sizes, "postings": dict(postings)}
+
+
+def add_to_trigram_index(index: dict, entry: dict, field: str) -> None:
+    """
+    Append one entry to an index built by build_trigram_index. Its position is the highest,
+    so postings stay in ascending order. Not thread safe, the caller serializes updates.
+    """
+    value = (entry.get(field) or "").lower()
+    position = len(index["values"])
+    index["entries"].append(entry)
+    index["values"].append(value)
+    grams = trigrams(value)
+    index["sizes"].append(len(grams))
+    for gram in grams:
+        index["postings"].setdefault(gram, []).append(position)
+
+
+def get_trigram_index(entries: list[dict], field: str) -> dict:
+    """
+    Get the trigram index for a field, rebuilding it only when the entries list changes.
+    Relies on the search index cache handing back the same list until the index is refreshed.
+    """
+    with _index_lock:
+        cached = _index_cache.get(field)
+        if cached and cached["entries"] is entries:
+            return cached
+
+    index = build_trigram_index(entries, field)
+    with _index_lock:
+        _index_cache[field] = index
+    return index
+
+
+def _substring_candidates(index: dict, query: str) -> set[int]:
+    """
+    Find every entry containing the query. All of the query's unpadded trigrams must appear
+    in a matching value, so intersecting their postings gives a superset to check.
+    """
+    values = index["values"]
+    if len(query) < 3:
+        return {i for i, value in enumerate(values) if query in value}
+
+    inner = sorted((query[i:i + 3] for i in range(len(query) - 2)),
+                   key=lambda gram: len(index["postings"].get(gram, ())))
+    candidates = set(index["postings"].get(inner[0], ()))
+    for gram in inner[1:]:
+        if not candidates:
+            break
+        candidates.intersection_update(index["postings"].get(gram, ()))
+
+    return {i for i in candidates if query in values[i]}
+
+
+def search_trigram_index(index: dict, query: str, limit: int = 15, threshold: float = 0.5) -> list[dict]:
+    """
+    Fuzzy search the index. Candidates come from substring matches plus the entries sharing the most
+    trigrams with the query, and only those get the (slow) SequenceMatcher rescoring.
+    Same rules as the old linear scan: keep anything with ratio >= threshold or containing the query.
+    """
+    values = index["values"]
+    sizes = index["sizes"]
+    query_grams = trigrams(query)
+    overlap = defaultdict(int)
+    for gram in query_grams:
+        for i in index["postings"].get(gram, ()):
+            overlap[i] += 1
+
+    # shared trigrams over both trigram counts (the Dice coefficient) tracks SequenceMatcher's ratio,
+    # which is also relative to both lengths. raw overlap would favour long values over close short ones.
+    # ties go to the earlier entry, like they do in the final sort
+    query_size = len(query_grams)
+    best_overlap = heapq.nlargest(MAX_RESCORE_CANDIDATES, overlap,
+                                  key=lambda i: (overlap[i] / (query_size + sizes[i]), -i))
+    candidates = set(best_overlap) | _substring_candidates(index, query)
+
+    scored_matches = []
+    for i in candidates:
+        target = values[i]
+        contains = query in target
+        matcher = SequenceMatcher(None, query, target)
+        # the quick ratios are cheap upper bounds, skip the full ratio when they already rule it out
+        if not contains and (matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold):
+            continue
+        score = matcher.ratio()
+        if score >= threshold or contains:
+            scored_matches.append((score, i))
+
+    # ties keep index order, like the stable sort in the old scan
+    scored_matches.sort(key=lambda x: (-x[0], x[1]))
+    return [index["entries"][i] for _, i in scored_matches[:limit]]
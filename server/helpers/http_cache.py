@@ -0,0 +1,29 @@
+from fastapi import Request
+from fastapi.responses import Response
+
+# versioned keys (<name>/<version>/...) never change once published
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# LATEST, the search index and friends change on every publish
+MUTABLE_CACHE_CONTROL = "public, max-age=60"
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check the request's If-None-Match header against an ETag.
+    If-None-Match uses weak comparison, so a W/ prefix on either side is ignored.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+def cache_headers(etag: str, cache_control: str) -> dict:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """
+    Build a 304 response carrying the same validators as the full response would.
+    """
+    return Response(status_code=304, headers=cache_headers(etag, cache_control))
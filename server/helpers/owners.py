@@ -0,0 +1,57 @@
+from helpers import registry_db
+from helpers.s3 import s3_read_versioned, s3_put_if_match, s3_update_text
+from helpers.http_cache import MUTABLE_CACHE_CONTROL
+
+# who owns a package is decided by <name>/OWNER in the bucket, which every machine sees and which
+# outlives the local database. the owners table is only a copy, filled in from these files
+
+
+def owner_key(name: str) -> str:
+    return f"{name}/OWNER"
+
+
+def _owner_from_text(name: str, text: str | None) -> str | None:
+    """
+    The owner named by an OWNER file. Packages whose OWNER file was never written
+    fall back to the owner imported into the database.
+    """
+    owner = (text or "").strip()
+    return owner or registry_db.get_package_owner(name)
+
+
+def get_package_owner(name: str) -> str | None:
+    """
+    Get a package's owner from the bucket, or None if nobody has claimed it yet.
+    """
+    body, _ = s3_read_versioned(owner_key(name))
+    owner = _owner_from_text(name, body.decode("utf-8") if body is not None else None)
+    if owner:
+        registry_db.set_package_owner(name, owner)
+    return owner
+
+
+def claim_package_owner(name: str, username: str) -> str:
+    """
+    Make username the owner of a new package. The OWNER file is only created if it doesn't exist,
+    so if someone else claimed it first, on any machine, they keep it.
+    Returns whoever owns the package afterwards.
+    """
+    if s3_put_if_match(owner_key(name), username.encode("utf-8"), None, MUTABLE_CACHE_CONTROL) is None:
+        return get_package_owner(name)
+    registry_db.set_package_owner(name, username)
+    return username
+
+
+def transfer_package_owner(name: str, current_owner: str, new_owner: str) -> str | None:
+    """
+    Hand a package to new_owner, only if current_owner still owns it.
+    Returns whoever owns the package afterwards.
+    """
+    def transfer(text: str | None) -> str | None:
+        return new_owner if _owner_from_text(name, text) == current_owner else None
+
+    _, current = s3_update_text(owner_key(name), transfer, MUTABLE_CACHE_CONTROL)
+    owner = _owner_from_text(name, current)
+    if owner:
+        registry_db.set_package_owner(name, owner)
+    return owner
@@ -0,0 +1,180 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+from fastapi import HTTPException
+
+from helpers.s3 import s3_write_text
+from helpers.blob_cache import open_cached_blob
+from helpers.wat_parser import parse_wat_exports
+from helpers.file_validation_helpers import extract_package_archive
+from helpers.http_cache import IMMUTABLE_CACHE_CONTROL
+from helpers.validation import validate_package_name, validate_version
+
+# same import syntax the CLI looks for when it installs a package
+IMPORT_PATTERN = re.compile(r'\s*\(import\s+"([^"]+)"\s+"([^"]+)"')
+PKG_IMPORT_PREFIX = "pkg/"
+# bumped when fields are added to the metadata document. it's part of the key, so every format is
+# written once and stays immutable, and versions without one in the current format get it built on load
+METADATA_FORMAT = 2
+# descriptions longer than this are cut off before they go in the database and the search index
+MAX_DESCRIPTION_LENGTH = 500
+
+def metadata_key(name: str, version: str) -> str:
+    return f"{name}/{version}/metadata.v{METADATA_FORMAT}.json"
+
+def archive_key(name: str, version: str) -> str:
+    return f"{name}/{version}/{name}-{version}.watpkg"
+
+def manifest_description(manifest: dict) -> str:
+    """
+    The description from a watkit.json, or "" if it doesn't have a usable one.
+    """
+    description = manifest.get("description") if isinstance(manifest, dict) else None
+    if not isinstance(description, str):
+        return ""
+    return " ".join(description.split())[:MAX_DESCRIPTION_LENGTH]
+
+def hash_file(path: str) -> str:
+    """
+    SHA-256 of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parse_wat_imports(wat_path: str) -> list[dict[str, str]]:
+    """
+    Parse the (module, name) imports from a WAT file.
+    """
+    imports = []
+    with open(wat_path, "r", errors="replace") as f:
+        for line in f:
+            match = IMPORT_PATTERN.match(line)
+            if match:
+                imports.append({"module": match.group(1), "name": match.group(2)})
+    return imports
+
+def split_package_module(module: str) -> tuple[str, str] | None:
+    """
+    Split a "pkg/<name>v<version>" import module into (name, version) at the first "v",
+    the same way the CLI does when it installs dependencies. Returns None for other imports.
+    Raises ValueError for a pkg/ import the CLI couldn't install.
+    """
+    if not module.startswith(PKG_IMPORT_PREFIX):
+        return None
+    pkg_part = module[len(PKG_IMPORT_PREFIX):]
+    if "v" not in pkg_part:
+        raise ValueError(f'"{module}" is not of the form pkg/<name>v<version>')
+    name, version = pkg_part.split("v", 1)
+    # these end up in S3 keys, so they have to be names and versions the registry accepts
+    try:
+        validate_package_name(name)
+        validate_version(version)
+    except HTTPException as e:
+        raise ValueError(f'"{module}": {e.detail}')
+    return name, version
+
+def find_files(extract_dir: str, extension: str) -> list[str]:
+    found = []
+    for root, _, files in os.walk(extract_dir):
+        for file in files:
+            if file.endswith(extension):
+                found.append(os.path.join(root, file))
+    return sorted(found)
+
+def build_package_metadata(extract_dir: str, archive_path: str, key: str, sha256: str | None = None,
+                           strict: bool = True) -> dict:
+    """
+    Build the metadata document stored next to a published version's manifest, so resolvers,
+    installers and search never have to download and parse the archive.
+    Pass sha256 if the archive was already hashed while it was received.
+    Raises ValueError for a pkg/ import that can't be split into a name and version. With strict=False
+    those are skipped with a warning instead, for versions published before this was checked.
+    """
+    dependencies = set()
+    package_imports = set()
+    local_imports = set()
+    exports = []
+    for wat_path in find_files(extract_dir, ".wat"):
+        file = os.path.relpath(wat_path, extract_dir)
+        for imp in parse_wat_imports(wat_path):
+            try:
+                dep = split_package_module(imp["module"])
+            except ValueError as e:
+                if strict:
+                    raise
+                print(f"Warning: Skipping package import in {key}: {e}")
+                continue
+            if dep:
+                dependencies.add(dep)
+                package_imports.add((imp["module"], imp["name"]))
+            else:
+                local_imports.add((imp["module"], imp["name"]))
+
+        with open(wat_path, "r", errors="replace") as f:
+            exports.extend({"file": file, **export} for export in parse_wat_exports(f.read()))
+
+    wasm_files = [
+        {
+            "path": os.path.relpath(wasm_path, extract_dir),
+            "size": os.path.getsize(wasm_path),
+            "sha256": hash_file(wasm_path),
+        }
+        for wasm_path in find_files(extract_dir, ".wasm")
+    ]
+
+    return {
+        "format": METADATA_FORMAT,
+        "dependencies": [{"name": name, "version": version} for name, version in sorted(dependencies)],
+        "imports": {
+            "packages": [{"module": module, "name": name} for module, name in sorted(package_imports)],
+            "local": [{"module": module, "name": name} for module, name in sorted(local_imports)],
+        },
+        "exports": exports,
+        "wasm": wasm_files,
+        "archive": {
+            "key": key,
+            "size": os.path.getsize(archive_path),
+            "sha256": sha256 or hash_file(archive_path),
+        },
+    }
+
+def backfill_package_metadata(name: str, version: str) -> dict | None:
+    """
+    Build and store the metadata document for a version published before we kept one
+    in the current format. Returns None if the version has no archive.
+    """
+    key = archive_key(name, version)
+    opened = open_cached_blob(key)
+    if opened is None:
+        return None
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # work from our own copy, the cached one can be evicted while we parse it
+        archive_path = os.path.join(tmpdir, "archive.watpkg")
+        with opened[1] as src, open(archive_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+
+        extract_dir = os.path.join(tmpdir, "package")
+        # archives from before the upload checks may hold other files, skip those
+        extract_package_archive(archive_path, extract_dir, strict=False)
+        metadata = build_package_metadata(extract_dir, archive_path, key, strict=False)
+
+    s3_write_text(metadata_key(name, version), json.dumps(metadata, separators=(",", ":")), IMMUTABLE_CACHE_CONTROL)
+    return metadata
+
+def load_package_metadata(name: str, version: str) -> dict | None:
+    """
+    Get a version's metadata document, backfilling it if the version predates them or their current format.
+    Returns None if the version doesn't exist.
+    """
+    opened = open_cached_blob(metadata_key(name, version))
+    if opened is None:
+        return backfill_package_metadata(name, version)
+    with opened[1] as f:
+        return json.load(f)
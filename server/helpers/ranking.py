@@ -0,0 +1,197 @@
+import os
+import math
+import re
+import bisect
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+
+from helpers.fuzzy_search import get_trigram_index, search_trigram_index
+
+# BM25 over a package's name, author and description, all in one document. the text score is
+# then lifted by how popular the package is, so of two equally good matches the one people
+# actually download comes first, but popularity alone never gets a package into the results
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# a term in the name counts this many times over, a match there says more than one in the description
+FIELD_WEIGHTS = {"name": 3, "author": 2, "description": 1}
+
+# a result's score is multiplied by up to 1 + POPULARITY_WEIGHT for the most downloaded package
+POPULARITY_WEIGHT = float(os.environ.get("SEARCH_POPULARITY_WEIGHT", "0.5"))
+
+# how much the name's similarity to the whole query adds, keeps typos and partial names working
+FUZZY_WEIGHT = 0.5
+MAX_FUZZY_CANDIDATES = 50
+
+# query terms also match longer terms starting with them ("alloc" finds "allocator"), for less
+PREFIX_MIN_LENGTH = 3
+PREFIX_MATCH_WEIGHT = 0.5
+MAX_PREFIX_EXPANSIONS = 20
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+# term statistics, kept up to date one package at a time as the search entries change
+_lock = threading.Lock()
+_index = {
+    "entries": None,
+    "by_name": {},
+    # name -> (author, description) the package was indexed with
+    "documents": {},
+    # name -> weighted term frequencies, and their sum
+    "terms": {},
+    "lengths": {},
+    # term -> {name: weighted term frequency}
+    "postings": {},
+    # every term in postings, sorted, for prefix matches
+    "vocabulary": [],
+    "total_length": 0,
+}
+_stats = {"hits": 0, "updates": 0, "documents_updated": 0}
+
+
+def tokenize(text: str) -> list[str]:
+    return TERM_PATTERN.findall((text or "").lower())
+
+
+def _document_terms(entry: dict) -> Counter:
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(entry.get(field)):
+            terms[term] += weight
+    return terms
+
+
+def _remove_document(name: str) -> None:
+    for term, frequency in _index["terms"].pop(name).items():
+        postings = _index["postings"][term]
+        del postings[name]
+        if not postings:
+            del _index["postings"][term]
+            vocabulary = _index["vocabulary"]
+            del vocabulary[bisect.bisect_left(vocabulary, term)]
+    _index["total_length"] -= _index["lengths"].pop(name)
+    del _index["documents"][name]
+
+
+def _add_document(entry: dict) -> None:
+    name = entry["name"]
+    terms = _document_terms(entry)
+    for term, frequency in terms.items():
+        postings = _index["postings"].get(term)
+        if postings is None:
+            postings = _index["postings"][term] = {}
+            bisect.insort(_index["vocabulary"], term)
+        postings[name] = frequency
+    _index["terms"][name] = terms
+    _index["lengths"][name] = sum(terms.values())
+    _index["total_length"] += _index["lengths"][name]
+    _index["documents"][name] = (entry.get("author"), entry.get("description"))
+
+
+def _refresh(entries: list) -> None:
+    """
+    Fold changes to the search entries into the term statistics. Only packages that were added,
+    removed or republished with a different author or description are re-indexed. Caller holds _lock.
+    """
+    if _index["entries"] is entries:
+        _stats["hits"] += 1
+        return
+
+    current = {entry["name"]: entry for entry in entries}
+    changed = 0
+    for name in [name for name in _index["documents"] if name not in current]:
+        _remove_document(name)
+        changed += 1
+    for name, entry in current.items():
+        indexed = _index["documents"].get(name)
+        if indexed == (entry.get("author"), entry.get("description")):
+            continue
+        if indexed is not None:
+            _remove_document(name)
+        _add_document(entry)
+        changed += 1
+
+    _index["entries"] = entries
+    _index["by_name"] = current
+    _stats["updates"] += 1
+    _stats["documents_updated"] += changed
+
+
+def _query_terms(query: str) -> Counter:
+    """
+    Weight of each index term the query matches: 1 for the query's own terms, less for prefix matches.
+    """
+    weights = Counter()
+    vocabulary = _index["vocabulary"]
+    for term in tokenize(query):
+        weights[term] = max(weights[term], 1.0)
+        if len(term) < PREFIX_MIN_LENGTH:
+            continue
+        start = bisect.bisect_right(vocabulary, term)
+        for candidate in vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(term):
+                break
+            weights[candidate] = max(weights[candidate], PREFIX_MATCH_WEIGHT)
+    return weights
+
+
+def _bm25_scores(query: str) -> dict[str, float]:
+    """
+    BM25 score of every package matching at least one query term. Caller holds _lock.
+    """
+    document_count = len(_index["documents"])
+    if not document_count:
+        return {}
+    average_length = _index["total_length"] / document_count
+
+    scores = Counter()
+    for term, weight in _query_terms(query).items():
+        postings = _index["postings"].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+        for name, frequency in postings.items():
+            norm = 1 - BM25_B + BM25_B * _index["lengths"][name] / average_length
+            scores[name] += weight * idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+    return scores
+
+
+def search_ranked(entries: list, query: str, downloads: dict[str, int], limit: int = 15) -> list[dict]:
+    """
+    Rank packages for a query: BM25 over name, author and description plus the name's fuzzy
+    similarity to the query, lifted by log-scaled download totals (downloads is {name: total}).
+    Returns up to limit of the shared entries, best first. Copy them before mutating.
+    """
+    trigram_index = get_trigram_index(entries, "name")
+    fuzzy_matches = search_trigram_index(trigram_index, query.lower(), limit=MAX_FUZZY_CANDIDATES)
+
+    with _lock:
+        _refresh(entries)
+        text_scores = _bm25_scores(query)
+        by_name = _index["by_name"]
+
+    best_text = max(text_scores.values(), default=0) or 1
+    relevance = {name: score / best_text for name, score in text_scores.items()}
+    for entry in fuzzy_matches:
+        similarity = SequenceMatcher(None, query.lower(), entry["name"].lower()).ratio()
+        relevance[entry["name"]] = relevance.get(entry["name"], 0) + FUZZY_WEIGHT * similarity
+
+    most_downloads = math.log1p(max(downloads.values(), default=0)) or 1
+    scored = []
+    for name, score in relevance.items():
+        popularity = math.log1p(downloads.get(name, 0)) / most_downloads
+        scored.append((score * (1 + POPULARITY_WEIGHT * popularity), name))
+
+    # ties go to the name, so results don't shuffle between identical requests
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [by_name[name] for _, name in scored[:limit]]
+
+
+def get_ranking_stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "documents": len(_index["documents"]),
+            "terms": len(_index["postings"]),
+        }
@@ -0,0 +1,208 @@
+import time
+import random
+import threading
+
+from helpers.db import get_db, transaction
+
+# bumped on every change to packages or versions, so workers know when their in-memory
+# copy of the search entries is out of date
+GENERATION_COUNTER = "registry_generation"
+# bumped whenever export rows are deleted, so in-memory indexes built from them know to start over
+EXPORTS_DELETED_COUNTER = "exports_deleted"
+
+# a reserved version that's older than this belongs to a publish that died partway, it can be taken over
+RESERVATION_TIMEOUT_SECONDS = 15 * 60
+
+_entries_lock = threading.Lock()
+_entries_memo = {"generation": None, "entries": None, "by_name": None}
+_stats = {"hits": 0, "rebuilds": 0}
+
+
+def bump_generation(conn) -> None:
+    """
+    Mark the package list as changed. Call inside the transaction that changed it.
+    """
+    conn.execute("INSERT INTO global_counters (key, count) VALUES (?, 1) "
+                 "ON CONFLICT (key) DO UPDATE SET count = count + 1", (GENERATION_COUNTER,))
+
+
+def get_generation() -> int:
+    row = get_db().execute("SELECT count FROM global_counters WHERE key = ?", (GENERATION_COUNTER,)).fetchone()
+    return row["count"] if row else 0
+
+
+def get_exports_deleted() -> int:
+    row = get_db().execute("SELECT count FROM global_counters WHERE key = ?", (EXPORTS_DELETED_COUNTER,)).fetchone()
+    return row["count"] if row else 0
+
+
+def get_package_owner(name: str) -> str | None:
+    """
+    Get this database's copy of a package's owner, or None if it doesn't know one.
+    The OWNER files in the bucket decide, see helpers.owners.
+    """
+    row = get_db().execute("SELECT owner FROM owners WHERE package = ?", (name,)).fetchone()
+    return row["owner"] if row else None
+
+
+def set_package_owner(name: str, owner: str) -> None:
+    """
+    Update this database's copy of a package's owner.
+    """
+    get_db().execute("INSERT INTO owners (package, owner) VALUES (?, ?) "
+                     "ON CONFLICT (package) DO UPDATE SET owner = excluded.owner", (name, owner))
+
+
+def version_exists(name: str, version: str) -> bool:
+    row = get_db().execute("SELECT 1 FROM versions WHERE package = ? AND version = ? AND pending = 0",
+                           (name, version)).fetchone()
+    return row is not None
+
+
+def reserve_version(name: str, version: str, username: str) -> bool:
+    """
+    Hold a version for a publish that's about to upload it, so a concurrent publish of the same
+    version is turned away before either of them touches the bucket. Reserved versions aren't
+    listed anywhere until record_publish completes them.
+    Returns False if the version is already published or reserved.
+    """
+    with transaction() as conn:
+        conn.execute("DELETE FROM versions WHERE package = ? AND version = ? AND pending = 1 AND published_at < ?",
+                     (name, version, time.time() - RESERVATION_TIMEOUT_SECONDS))
+        cursor = conn.execute("INSERT OR IGNORE INTO versions (package, version, author, published_at, pending) "
+                              "VALUES (?, ?, ?, ?, 1)", (name, version, username, time.time()))
+    return cursor.rowcount == 1
+
+
+def release_version(name: str, version: str) -> None:
+    """
+    Give up a reservation from reserve_version, for a publish that failed before it was recorded.
+    """
+    get_db().execute("DELETE FROM versions WHERE package = ? AND version = ? AND pending = 1", (name, version))
+
+
+def get_latest_version(name: str) -> str | None:
+    row = get_db().execute("SELECT latest FROM packages WHERE name = ?", (name,)).fetchone()
+    return row["latest"] if row else None
+
+
+def add_exports(conn, name: str, version: str, exports: list[dict]) -> None:
+    """
+    Store a version's exported functions, as listed in its metadata document.
+    If two files export the same name the first one wins.
+    """
+    conn.executemany(
+        "INSERT OR IGNORE INTO exports (package, version, name, params, results) VALUES (?, ?, ?, ?, ?)",
+        [(name, version, export["name"], " ".join(export["params"]), " ".join(export["results"])) for export in exports]
+    )
+
+
+def record_publish(name: str, version: str, username: str, exports: list[dict] = (), description: str = "") -> dict | None:
+    """
+    Complete a version reserved with reserve_version: the version row, its exported functions, the package's
+    latest version, author and description, the publisher in authors and a zeroed download counter,
+    all in one transaction.
+    Returns the package row as it was before (None if it's new), so a failed publish can put it back.
+    """
+    with transaction() as conn:
+        row = conn.execute("SELECT latest, author, description FROM packages WHERE name = ?", (name,)).fetchone()
+        cursor = conn.execute("UPDATE versions SET author = ?, published_at = ?, pending = 0 "
+                              "WHERE package = ? AND version = ? AND pending = 1",
+                              (username, time.time(), name, version))
+        if cursor.rowcount != 1:
+            raise RuntimeError(f"{name}v{version} isn't reserved for this publish")
+        conn.execute("INSERT INTO packages (name, latest, author, description) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT (name) DO UPDATE SET latest = excluded.latest, author = excluded.author, "
+                     "description = excluded.description",
+                     (name, version, username, description))
+        add_exports(conn, name, version, exports)
+        conn.execute("INSERT OR IGNORE INTO authors (username) VALUES (?)", (username,))
+        conn.execute("INSERT OR IGNORE INTO download_counts (name, version, count) VALUES (?, ?, 0)",
+                     (name, version))
+        bump_generation(conn)
+    return dict(row) if row else None
+
+
+def undo_publish(name: str, version: str, previous: dict | None) -> None:
+    """
+    Remove a version added by record_publish, putting the package row back as it was.
+    """
+    with transaction() as conn:
+        conn.execute("DELETE FROM versions WHERE package = ? AND version = ?", (name, version))
+        conn.execute("DELETE FROM exports WHERE package = ? AND version = ?", (name, version))
+        conn.execute("INSERT INTO global_counters (key, count) VALUES (?, 1) "
+                     "ON CONFLICT (key) DO UPDATE SET count = count + 1", (EXPORTS_DELETED_COUNTER,))
+        conn.execute("DELETE FROM download_counts WHERE name = ? AND version = ?", (name, version))
+        if previous is None:
+            conn.execute("DELETE FROM packages WHERE name = ?", (name,))
+        else:
+            # leave it alone if another publish has moved latest on since
+            conn.execute("UPDATE packages SET latest = ?, author = ?, description = ? WHERE name = ? AND latest = ?",
+                         (previous["latest"], previous["author"], previous.get("description", ""), name, version))
+        bump_generation(conn)
+
+
+def count_packages() -> int:
+    return get_db().execute("SELECT COUNT(*) AS total FROM packages").fetchone()["total"]
+
+
+def count_authors() -> int:
+    return get_db().execute("SELECT COUNT(*) AS total FROM authors").fetchone()["total"]
+
+
+def load_search_entries() -> list:
+    """
+    Get every package as a search entry ({name, author, description, latest, versions}).
+    The list is rebuilt only when the registry generation moves, and stays the same object
+    otherwise, so indexes built on top of it (like the trigram index) aren't rebuilt for nothing.
+    Shared between requests, copy entries before mutating them.
+    """
+    generation = get_generation()
+    with _entries_lock:
+        if _entries_memo["generation"] == generation:
+            _stats["hits"] += 1
+            return _entries_memo["entries"]
+
+    conn = get_db()
+    versions = {}
+    for row in conn.execute("SELECT package, version FROM versions WHERE pending = 0 ORDER BY package, version"):
+        versions.setdefault(row["package"], []).append(row["version"])
+    entries = [
+        {
+            "name": row["name"],
+            "author": row["author"],
+            "description": row["description"],
+            "latest": row["latest"],
+            "versions": versions.get(row["name"], []),
+        }
+        for row in conn.execute("SELECT name, author, description, latest FROM packages ORDER BY name")
+    ]
+
+    with _entries_lock:
+        _entries_memo["generation"] = generation
+        _entries_memo["entries"] = entries
+        _entries_memo["by_name"] = {entry["name"]: entry for entry in entries}
+        _stats["rebuilds"] += 1
+    return entries
+
+
+def get_search_entry(name: str) -> dict | None:
+    """
+    Get one package's search entry from the in-memory list. Shared, copy it before mutating.
+    """
+    load_search_entries()
+    with _entries_lock:
+        return _entries_memo["by_name"].get(name)
+
+
+def sample_search_entries(count: int) -> list:
+    entries = load_search_entries()
+    return random.sample(entries, min(count, len(entries)))
+
+
+def get_search_stats() -> dict:
+    """
+    Get how often the in-memory search entries were reused or rebuilt.
+    """
+    with _entries_lock:
+        return {**_stats, "generation": _entries_memo["generation"]}
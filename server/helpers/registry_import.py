@@ -0,0 +1,192 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers.s3 import s3_list_objects, s3_read_text
+from helpers.db import get_db, transaction
+from helpers.downloads import TOTAL_COUNTER, TOTAL_DOWNLOADS_KEY
+from helpers.registry_db import bump_generation, add_exports
+from helpers.package_metadata import load_package_metadata, manifest_description
+
+# set in global_counters once the bucket has been imported into this database
+IMPORTED_COUNTER = "registry_imported"
+
+# reads in flight at once while importing
+IMPORT_CONCURRENCY = 16
+
+AUTHORS_KEY = "AUTHORS.txt"
+OWNERS_KEY = "owners.json"
+
+
+def _read_optional(key: str) -> str | None:
+    try:
+        return s3_read_text(key)
+    except Exception:
+        return None
+
+
+def _manifest(text: str | None) -> dict:
+    try:
+        manifest = json.loads(text)
+    except Exception:
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _manifest_author(text: str | None) -> str | None:
+    return _manifest(text).get("author")
+
+
+def import_registry_from_bucket() -> dict:
+    """
+    Load registry metadata from the bucket layout that predates the database: versions from
+    <name>/<version>/watkit.json, the LATEST and OWNER files, owners.json, AUTHORS.txt and the
+    download count.txt files. Rows already in the database are kept, so it's safe to run more than once.
+    Returns how many of each were imported.
+    """
+    versions = {}
+    latest_keys = {}
+    owner_keys = {}
+    count_keys = {}
+    for key in s3_list_objects(""):
+        parts = key.split("/")
+        if len(parts) == 4 and parts[0] == "downloads" and parts[3] == "count.txt":
+            count_keys[(parts[1], parts[2])] = key
+        elif len(parts) == 3 and parts[2] == "watkit.json":
+            versions.setdefault(parts[0], []).append(parts[1])
+        elif len(parts) == 2 and parts[1] == "LATEST":
+            latest_keys[parts[0]] = key
+        elif len(parts) == 2 and parts[1] == "OWNER":
+            owner_keys[parts[0]] = key
+
+    # one read per object, all of them in parallel
+    keys = [f"{name}/{version}/watkit.json" for name in versions for version in versions[name]]
+    keys += list(latest_keys.values()) + list(owner_keys.values()) + list(count_keys.values())
+    keys += [AUTHORS_KEY, OWNERS_KEY, TOTAL_DOWNLOADS_KEY]
+    with ThreadPoolExecutor(max_workers=IMPORT_CONCURRENCY) as executor:
+        texts = dict(zip(keys, executor.map(_read_optional, keys)))
+
+    try:
+        legacy_owners = json.loads(texts[OWNERS_KEY] or "{}")
+    except Exception:
+        legacy_owners = {}
+    if not isinstance(legacy_owners, dict):
+        legacy_owners = {}
+
+    version_rows = []
+    package_rows = []
+    owners = {}
+    authors = {author.strip() for author in (texts[AUTHORS_KEY] or "").split("\n") if author.strip()}
+    for name in sorted(versions):
+        package_versions = sorted(versions[name])
+        version_authors = {
+            version: _manifest_author(texts[f"{name}/{version}/watkit.json"]) for version in package_versions
+        }
+        version_rows += [(name, version, author) for version, author in version_authors.items()]
+        authors.update(author for author in version_authors.values() if author)
+
+        latest = (texts.get(latest_keys.get(name)) or "").strip()
+        if latest not in version_authors:
+            latest = package_versions[-1]
+        # the OWNER file decides, it's what claims and transfers write. then owners.json from before
+        # there were OWNER files, then the first manifest that names an author
+        owner = (texts.get(owner_keys.get(name)) or "").strip() or legacy_owners.get(name) or next(
+            (author for author in version_authors.values() if author), None
+        )
+        if owner:
+            owners[name] = owner
+        description = manifest_description(_manifest(texts[f"{name}/{latest}/watkit.json"]))
+        package_rows.append((name, latest, version_authors[latest] or owner or "", description))
+
+    count_rows = []
+    for (name, version), key in count_keys.items():
+        try:
+            count_rows.append((name, version, int((texts[key] or "0").strip())))
+        except ValueError:
+            continue
+    try:
+        total = int((texts[TOTAL_DOWNLOADS_KEY] or "0").strip())
+    except ValueError:
+        total = 0
+
+    with transaction() as conn:
+        conn.executemany("INSERT OR IGNORE INTO versions (package, version, author) VALUES (?, ?, ?)", version_rows)
+        conn.executemany("INSERT OR IGNORE INTO packages (name, latest, author, description) VALUES (?, ?, ?, ?)", package_rows)
+        conn.executemany("INSERT OR IGNORE INTO owners (package, owner) VALUES (?, ?)", owners.items())
+        conn.executemany("INSERT OR IGNORE INTO authors (username) VALUES (?)", [(author,) for author in authors])
+        conn.executemany("INSERT OR IGNORE INTO download_counts (name, version, count) VALUES (?, ?, ?)", count_rows)
+        conn.execute("INSERT OR IGNORE INTO global_counters (key, count) VALUES (?, ?)", (TOTAL_COUNTER, total))
+        conn.execute("INSERT OR IGNORE INTO global_counters (key, count) VALUES (?, 1)", (IMPORTED_COUNTER,))
+        bump_generation(conn)
+
+    return {
+        "packages": len(package_rows),
+        "versions": len(version_rows),
+        "owners": len(owners),
+        "authors": len(authors),
+        "download_counts": len(count_rows),
+    }
+
+
+def import_exports() -> int:
+    """
+    Fill in exported functions for versions that don't have any recorded, from their metadata
+    documents (which get rebuilt from the archive for versions published before they had exports).
+    Returns how many versions were looked at.
+    """
+    rows = get_db().execute(
+        "SELECT package, version FROM versions v WHERE pending = 0 AND NOT EXISTS "
+        "(SELECT 1 FROM exports e WHERE e.package = v.package AND e.version = v.version)"
+    ).fetchall()
+    pending = [(row["package"], row["version"]) for row in rows]
+
+    def load(package_version: tuple[str, str]) -> dict | None:
+        try:
+            return load_package_metadata(*package_version)
+        except Exception as e:
+            print(f"Warning: Failed to load metadata for {package_version[0]}v{package_version[1]}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=IMPORT_CONCURRENCY) as executor:
+        metadata_list = list(executor.map(load, pending))
+
+    with transaction() as conn:
+        for (name, version), metadata in zip(pending, metadata_list):
+            if metadata:
+                add_exports(conn, name, version, metadata.get("exports", []))
+        bump_generation(conn)
+    return len(pending)
+
+
+def import_descriptions() -> int:
+    """
+    Fill in descriptions for packages that don't have one, from their latest manifest.
+    For databases imported before packages had descriptions. Returns how many were filled in.
+    """
+    rows = get_db().execute("SELECT name, latest FROM packages WHERE description = ''").fetchall()
+    keys = [f"{row['name']}/{row['latest']}/watkit.json" for row in rows]
+    with ThreadPoolExecutor(max_workers=IMPORT_CONCURRENCY) as executor:
+        texts = list(executor.map(_read_optional, keys))
+
+    updates = []
+    for row, text in zip(rows, texts):
+        description = manifest_description(_manifest(text))
+        if description:
+            updates.append((description, row["name"], row["latest"]))
+
+    with transaction() as conn:
+        # skip packages published again in the meantime, they already have the newer description
+        conn.executemany("UPDATE packages SET description = ? WHERE name = ? AND latest = ? AND description = ''",
+                         updates)
+        bump_generation(conn)
+    return len(updates)
+
+
+def ensure_registry_imported() -> None:
+    """
+    Import the bucket the first time a server starts on an empty database, exported functions included,
+    so searching by export works on a new machine too.
+    """
+    row = get_db().execute("SELECT 1 FROM global_counters WHERE key = ?", (IMPORTED_COUNTER,)).fetchone()
+    if row is None:
+        print(f"Importing registry metadata from the bucket: {import_registry_from_bucket()}")
+        print(f"Indexed exports for {import_exports()} versions")
@@ -1,16 +1,42 @@
 import os
+import time
+import random
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# how many S3 calls may be in flight at once, shared by the connection pool and the async wrappers.
+# benchmarks/bench_concurrency.py shows 32 is enough once the caches are warm, the CPU runs out first.
+# with cold caches and slow S3 the pool is the limit, but 64 threads only bought ~12% more throughput
+# and held up the event loop, so it isn't worth raising
+S3_MAX_CONCURRENCY = int(os.environ.get("S3_MAX_CONCURRENCY", "32"))
 
 s3 = boto3.client(
     "s3",
     aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
     aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
     region_name=os.environ["AWS_REGION"],
+    config=Config(
+        max_pool_connections=S3_MAX_CONCURRENCY,
+        retries={"max_attempts": 3, "mode": "standard"},
+        tcp_keepalive=True,
+    ),
 )
 BUCKET = os.environ["S3_BUCKET_NAME"]
 
-def s3_upload(file_path: str, key: str):
-    s3.upload_file(file_path, BUCKET, key)
+# compare-and-swap writes retry this many times with exponential backoff before giving up
+CAS_MAX_ATTEMPTS = int(os.environ.get("S3_CAS_MAX_ATTEMPTS", "8"))
+CAS_BASE_DELAY_SECONDS = 0.05
+CAS_MAX_DELAY_SECONDS = 2.0
+
+class WriteConflict(Exception):
+    """
+    A compare-and-swap write kept losing to concurrent writers.
+    """
+
+def s3_upload(file_path: str, key: str, cache_control: str | None = None):
+    extra_args = {"CacheControl": cache_control} if cache_control else None
+    s3.upload_file(file_path, BUCKET, key, ExtraArgs=extra_args)
 
 def s3_exists(key: str) -> bool:
     try:
@@ -23,8 +49,12 @@ def s3_read_text(key: str) -> str:
     obj = s3.get_object(Bucket=BUCKET, Key=key)
     return obj["Body"].read().decode("utf-8")
 
-def s3_write_text(key: str, content: str):
-    s3.put_object(Bucket=BUCKET, Key=key, Body=content.encode("utf-8"))
+def s3_write_text(key: str, content: str, cache_control: str | None = None):
+    extra_args = {"CacheControl": cache_control} if cache_control else {}
+    s3.put_object(Bucket=BUCKET, Key=key, Body=content.encode("utf-8"), **extra_args)
+
+def s3_delete(key: str):
+    s3.delete_object(Bucket=BUCKET, Key=key)
 
 def s3_list_objects(prefix: str) -> list[str]:
     paginator = s3.get_paginator("list_objects_v2")
@@ -36,48 +66,58 @@ def s3_list_objects(prefix: str) -> list[str]:
 
     return keys
 
-def get_package_download_count(package_name: str, version: str) -> int:
+def s3_read_versioned(key: str) -> tuple[bytes | None, str | None]:
     """
-    Get the download count for a specific package version from S3
+    Read an object along with its ETag. Returns (None, None) if it doesn't exist.
     """
-    key = f"downloads/{package_name}/{version}/count.txt"
     try:
-        if s3_exists(key):
-            count_text = s3_read_text(key)
-            return int(count_text.strip())
-        else:
-            return 0
-    except Exception:
-        return 0
-
-def increment_package_download_count(package_name: str, version: str) -> int:
+        obj = s3.get_object(Bucket=BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None, None
+        raise
+    return obj["Body"].read(), obj["ETag"]
+
+def s3_put_if_match(key: str, body: bytes, etag: str | None, cache_control: str | None = None) -> str | None:
     """
-    Increment the download count for a specific package version in S3
-    Returns the new count
+    Write an object only if it still has the given ETag, or only if it doesn't exist yet when etag is None.
+    Returns the new ETag, or None if someone else wrote it first.
     """
-    current_count = get_package_download_count(package_name, version)
-    new_count = current_count + 1
-    
-    key = f"downloads/{package_name}/{version}/count.txt"
+    params = {"Bucket": BUCKET, "Key": key, "Body": body}
+    if cache_control:
+        params["CacheControl"] = cache_control
+    if etag:
+        params["IfMatch"] = etag
+    else:
+        params["IfNoneMatch"] = "*"
     try:
-        s3_write_text(key, str(new_count))
-        return new_count
-    except Exception:
-        # If we can't write to S3, return the current count
-        return current_count
+        return s3.put_object(**params)["ETag"]
+    except ClientError as e:
+        # 412 when the precondition failed, 409 when another conditional write was in flight
+        if e.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict", "412", "409"):
+            return None
+        raise
 
-def get_package_total_downloads(package_name: str) -> int:
+def cas_backoff(attempt: int) -> None:
     """
-    Get the total download count across all versions of a package
+    Sleep before retrying a lost compare-and-swap, with full jitter so the losers don't collide again.
     """
-    prefix = f"downloads/{package_name}/"
-    try:
-        keys = s3_list_objects(prefix)
-        total = 0
-        for key in keys:
-            if key.endswith("/count.txt"):
-                count_text = s3_read_text(key)
-                total += int(count_text.strip())
-        return total
-    except Exception:
-        return 0
+    time.sleep(random.uniform(0, min(CAS_MAX_DELAY_SECONDS, CAS_BASE_DELAY_SECONDS * 2 ** attempt)))
+
+def s3_update_text(key: str, mutate, cache_control: str | None = None) -> tuple[str | None, str | None]:
+    """
+    Read-modify-write a text object with compare-and-swap, so concurrent updates are never lost.
+    mutate gets the current text (None if the object doesn't exist) and returns the new text,
+    or None to leave it alone. It may be called several times if the write races with another one.
+    Returns (previous, current) text.
+    """
+    for attempt in range(CAS_MAX_ATTEMPTS):
+        body, etag = s3_read_versioned(key)
+        previous = body.decode("utf-8") if body is not None else None
+        updated = mutate(previous)
+        if updated is None or updated == previous:
+            return previous, previous
+        if s3_put_if_match(key, updated.encode("utf-8"), etag, cache_control) is not None:
+            return previous, updated
+        cas_backoff(attempt)
+    raise WriteConflict(f"Gave up updating {key} after {CAS_MAX_ATTEMPTS} conflicting writes")
@@ -0,0 +1,38 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import s3 as s3_sync
+from helpers.s3 import S3_MAX_CONCURRENCY
+
+# boto3 is blocking, so S3 calls from async routes run here instead of on the event loop.
+# the pool is the same size as the boto3 connection pool, so a thread never waits for a connection
+_executor = ThreadPoolExecutor(max_workers=S3_MAX_CONCURRENCY, thread_name_prefix="s3")
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function on the S3 thread pool and wait for it without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+async def s3_upload(file_path: str, key: str, cache_control: str | None = None):
+    return await run_blocking(s3_sync.s3_upload, file_path, key, cache_control)
+
+async def s3_exists(key: str) -> bool:
+    return await run_blocking(s3_sync.s3_exists, key)
+
+async def s3_read_text(key: str) -> str:
+    return await run_blocking(s3_sync.s3_read_text, key)
+
+async def s3_write_text(key: str, content: str, cache_control: str | None = None):
+    return await run_blocking(s3_sync.s3_write_text, key, content, cache_control)
+
+async def s3_list_objects(prefix: str) -> list[str]:
+    return await run_blocking(s3_sync.s3_list_objects, prefix)
+
+async def s3_delete(key: str):
+    return await run_blocking(s3_sync.s3_delete, key)
+
+async def s3_update_text(key: str, mutate, cache_control: str | None = None) -> tuple[str | None, str | None]:
+    return await run_blocking(s3_sync.s3_update_text, key, mutate, cache_control)
@@ -0,0 +1,117 @@
+import re
+
+# strings, parens and atoms, with line and block comments skipped
+TOKEN_PATTERN = re.compile(r'\(;.*?;\)|;;[^\n]*|"(?:[^"\\]|\\.)*"|[()]|[^\s()";]+', re.DOTALL)
+
+VALUE_TYPES = {"i32", "i64", "f32", "f64", "v128", "funcref", "externref"}
+
+
+def parse_sexpr(text: str) -> list:
+    """
+    Parse WAT text into nested lists of tokens. Strings keep their quotes so they can be told
+    apart from atoms. Iterative, so deeply folded instructions don't hit the recursion limit.
+    Unbalanced parens are tolerated, whatever was parsed so far is returned.
+    """
+    root = []
+    stack = [root]
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group(0)
+        if token.startswith("(;") or token.startswith(";;"):
+            continue
+        if token == "(":
+            node = []
+            stack[-1].append(node)
+            stack.append(node)
+        elif token == ")":
+            if len(stack) > 1:
+                stack.pop()
+        else:
+            stack[-1].append(token)
+    return root
+
+
+def _unquote(token) -> str | None:
+    if isinstance(token, str) and len(token) >= 2 and token[0] == '"' and token[-1] == '"':
+        return token[1:-1]
+    return None
+
+
+def _signature(fields: list, types: dict) -> dict:
+    """
+    Read the params and results of a func or type definition. A (type $t) reference is looked up
+    in types unless the signature is also written out inline.
+    """
+    params = []
+    results = []
+    type_ref = None
+    for field in fields:
+        if not isinstance(field, list) or not field:
+            continue
+        if field[0] == "param":
+            # (param $name i32) names a single param, (param i32 i64) doesn't name any
+            params.extend(token for token in field[1:] if token in VALUE_TYPES)
+        elif field[0] == "result":
+            results.extend(token for token in field[1:] if token in VALUE_TYPES)
+        elif field[0] == "type" and len(field) > 1:
+            type_ref = field[1]
+    if not params and not results and type_ref in types:
+        return types[type_ref]
+    return {"params": params, "results": results}
+
+
+def parse_wat_exports(text: str) -> list[dict]:
+    """
+    Get the exported functions of a WAT module with their signatures:
+    [{"name": str, "params": [type, ...], "results": [type, ...]}].
+    Handles inline (func (export "x") ...) exports, (export "x" (func $f)) fields and
+    signatures given through (type $t).
+    """
+    tree = parse_sexpr(text)
+    modules = [node for node in tree if isinstance(node, list) and node and node[0] == "module"]
+    fields = modules[0][1:] if modules else tree
+
+    # type definitions, by $id and by index
+    types = {}
+    type_count = 0
+    for field in fields:
+        if isinstance(field, list) and field and field[0] == "type":
+            index = str(type_count)
+            type_count += 1
+            func = next((sub for sub in field[1:] if isinstance(sub, list) and sub and sub[0] == "func"), [])
+            signature = _signature(func[1:], {})
+            types[index] = signature
+            if len(field) > 1 and isinstance(field[1], str) and field[1].startswith("$"):
+                types[field[1]] = signature
+
+    # function index space: imported functions come first, then the module's own
+    functions = []
+    exports = []
+    for field in fields:
+        if not isinstance(field, list) or not field:
+            continue
+        if field[0] == "import":
+            func = next((sub for sub in field[1:] if isinstance(sub, list) and sub and sub[0] == "func"), None)
+            if func is not None:
+                func_id = func[1] if len(func) > 1 and isinstance(func[1], str) and func[1].startswith("$") else None
+                functions.append((func_id, _signature(func[1:], types)))
+        elif field[0] == "func":
+            func_id = field[1] if len(field) > 1 and isinstance(field[1], str) and field[1].startswith("$") else None
+            signature = _signature(field[1:], types)
+            functions.append((func_id, signature))
+            for sub in field[1:]:
+                if isinstance(sub, list) and len(sub) > 1 and sub[0] == "export" and _unquote(sub[1]) is not None:
+                    exports.append({"name": _unquote(sub[1]), **signature})
+
+    by_ref = {}
+    for index, (func_id, signature) in enumerate(functions):
+        by_ref[str(index)] = signature
+        if func_id:
+            by_ref[func_id] = signature
+
+    for field in fields:
+        if isinstance(field, list) and len(field) > 2 and field[0] == "export" and _unquote(field[1]) is not None:
+            target = field[2]
+            if isinstance(target, list) and len(target) > 1 and target[0] == "func" and target[1] in by_ref:
+                exports.append({"name": _unquote(field[1]), **by_ref[target[1]]})
+
+    return exports
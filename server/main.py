@@ -1,7 +1,7 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.openapi.utils import get_openapi
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 
 from routes.publish import router as publish_router
 from routes.auth import router as auth_router
@@ -9,9 +9,37 @@ from routes.serve import router as serve_router
 from routes.search import router as search_router
 from routes.config import router as config_router
 from routes.download import router as download_router
+from routes.resolve import router as resolve_router
+from routes.transfer import router as transfer_router
+from helpers.downloads import start_download_flusher, stop_download_flusher
+from helpers.registry_import import ensure_registry_imported
+from helpers.s3_async import run_blocking
+from helpers.file_validation_helpers import MAX_UPLOAD_SIZE
 
 app = FastAPI()
 
+@app.on_event("startup")
+async def on_startup():
+    # a fresh database is filled from the bucket before we serve anything
+    await run_blocking(ensure_registry_imported)
+    start_download_flusher()
+
+# write out buffered download counts before the worker exits
+@app.on_event("shutdown")
+async def on_shutdown():
+    stop_download_flusher()
+
+# turn away oversized publishes before the multipart body is parsed and spooled to disk.
+# uploads without a Content-Length are still capped while they're copied in publish_package
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.method == "POST" and request.url.path == "/publish":
+        content_length = request.headers.get("content-length")
+        # leave room for the form fields and multipart boundaries around the archive
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE + 64 * 1024:
+            return JSONResponse({"detail": f"Package archive is larger than {MAX_UPLOAD_SIZE} bytes"}, status_code=413)
+    return await call_next(request)
+
 # Mount static files
 app.mount("/web", StaticFiles(directory="web"), name="web")
 
@@ -22,6 +50,8 @@ app.include_router(serve_router, prefix="")
 app.include_router(search_router, prefix="")
 app.include_router(config_router, prefix="")
 app.include_router(download_router, prefix="")
+app.include_router(resolve_router, prefix="")
+app.include_router(transfer_router, prefix="")
 
 # Serve the main page at root
 @app.get("/")
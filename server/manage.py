@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+
+from helpers.registry_import import import_registry_from_bucket, import_exports, import_descriptions
+
+def import_registry_command():
+    imported = import_registry_from_bucket()
+    print("imported " + ", ".join(f"{count} {kind}" for kind, count in imported.items()))
+
+def import_exports_command():
+    print(f"indexed exports for {import_exports()} versions")
+
+def import_descriptions_command():
+    print(f"filled in descriptions for {import_descriptions()} packages")
+
+def main():
+    parser = argparse.ArgumentParser(prog="manage.py", description="one-off maintenance tasks for the watkit registry")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("import-registry", help="load registry metadata from the bucket into the local database")
+    subparsers.add_parser("import-exports", help="index the exported functions of versions published before they were recorded")
+    subparsers.add_parser("import-descriptions", help="fill in package descriptions from their latest manifests")
+    args = parser.parse_args()
+
+    # command routing tree
+    if args.command == "import-registry":
+        import_registry_command()
+    elif args.command == "import-exports":
+        import_exports_command()
+    elif args.command == "import-descriptions":
+        import_descriptions_command()
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
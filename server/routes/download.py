@@ -1,44 +1,98 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from helpers.s3 import s3, BUCKET
+from helpers.s3_async import run_blocking
+from helpers.http_cache import MUTABLE_CACHE_CONTROL, not_modified
 import os
+import re
 
 router = APIRouter()
 
+# bytes held in memory per request at any time while proxying from S3
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# a single byte range, e.g. "bytes=0-499", "bytes=500-" or "bytes=-500"
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def parse_range_header(range_header: str | None) -> str | None:
+    """
+    Check a Range header and return it if it's a single byte range we can pass to S3.
+    Anything else (multiple ranges, other units) is ignored and the whole file is sent, as the RFC allows.
+    """
+    if not range_header:
+        return None
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1) and match.group(2) and int(match.group(2)) < int(match.group(1)):
+        return None
+    return range_header.strip()
+
+def iter_s3_body(body):
+    """
+    Yield an S3 object body chunk by chunk, closing the connection when done or when the client goes away.
+    """
+    try:
+        for chunk in body.iter_chunks(DOWNLOAD_CHUNK_SIZE):
+            yield chunk
+    finally:
+        body.close()
+
 @router.get("/download/{filename}")
-async def download_file(filename: str):
+async def download_file(filename: str, request: Request):
     """
-    Download a file from S3 with proper download headers
+    Download a file from S3 with proper download headers. Supports single byte ranges so downloads can resume.
     """
     # Validate filename to prevent directory traversal
     if not filename or '/' in filename or '..' in filename:
         raise HTTPException(status_code=400, detail="Invalid filename")
-    
+
+    byte_range = parse_range_header(request.headers.get("range"))
+    if_none_match = request.headers.get("if-none-match")
+
     try:
         # Get the object from S3 directly using boto3
-        response = s3.get_object(Bucket=BUCKET, Key=filename)
-        
-        # Get the file content and metadata
-        content = response['Body'].read()
-        content_type = response.get('ContentType', 'application/octet-stream')
-        content_length = response.get('ContentLength', len(content))
-        
-        # Create streaming response with proper download headers
-        return StreamingResponse(
-            iter([content]),
-            media_type=content_type,
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Content-Length": str(content_length),
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET",
-                "Access-Control-Allow-Headers": "*"
-            }
-        )
-        
+        params = {"Bucket": BUCKET, "Key": filename}
+        if byte_range:
+            params["Range"] = byte_range
+        # let S3 answer revalidations, its ETag is a hash of the object content
+        if if_none_match:
+            params["IfNoneMatch"] = if_none_match
+        response = await run_blocking(s3.get_object, **params)
     except s3.exceptions.NoSuchKey:
         raise HTTPException(status_code=404, detail="File not found")
     except s3.exceptions.ClientError as e:
+        metadata = e.response.get("ResponseMetadata", {})
+        if metadata.get("HTTPStatusCode") == 304:
+            return not_modified(metadata.get("HTTPHeaders", {}).get("etag", if_none_match), MUTABLE_CACHE_CONTROL)
+        if e.response.get("Error", {}).get("Code") == "InvalidRange":
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable")
         raise HTTPException(status_code=500, detail=f"S3 error: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    content_type = response.get('ContentType', 'application/octet-stream')
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Content-Length": str(response['ContentLength']),
+        "Accept-Ranges": "bytes",
+        "ETag": response['ETag'],
+        # these are the installer files, they change whenever we cut a release
+        "Cache-Control": MUTABLE_CACHE_CONTROL,
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET",
+        "Access-Control-Allow-Headers": "*"
+    }
+
+    status_code = 200
+    if byte_range and response.get('ContentRange'):
+        status_code = 206
+        headers["Content-Range"] = response['ContentRange']
+
+    # Stream the body straight through instead of reading the whole object into memory
+    return StreamingResponse(
+        iter_s3_body(response['Body']),
+        status_code=status_code,
+        media_type=content_type,
+        headers=headers
+    )
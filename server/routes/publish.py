@@ -3,96 +3,97 @@ from fastapi.responses import JSONResponse
 import os
 import shutil
 import tempfile
-import tarfile
 import json
-import uuid
 import re
+import asyncio
 
 from helpers.auth import fetch_github_username_from_cookie
-from helpers.file_validation_helpers import safe_extract_tar
+from helpers.file_validation_helpers import extract_package_archive_async, save_upload
 from helpers.validation import validate_package_name, validate_version
-from helpers.s3 import (
+from helpers.s3 import s3_put_if_match
+from helpers.s3_async import (
+    run_blocking,
     s3_upload,
-    s3_exists,
-    s3_read_text,
     s3_write_text,
-    s3_list_objects
+    s3_delete,
+    s3_update_text
 )
+from helpers.owners import get_package_owner, claim_package_owner
+from helpers.registry_db import (
+    reserve_version,
+    release_version,
+    record_publish,
+    undo_publish,
+    get_latest_version
+)
+from helpers.http_cache import IMMUTABLE_CACHE_CONTROL, MUTABLE_CACHE_CONTROL
+from helpers.package_metadata import build_package_metadata, metadata_key, archive_key, manifest_description
 
 router = APIRouter()
 BUCKET = os.environ["S3_BUCKET_NAME"]
 
-@router.post("/publish")
-async def publish_package(
-    request: Request,
-    name: str = Form(...),
-    version: str = Form(...),
-    watpkg_file: UploadFile = File(...)
-):
-    validate_package_name(name)
-    validate_version(version)
+async def get_or_claim_owner(name: str, username: str) -> str:
+    """
+    Get the package owner, claiming the package for the publisher if it's new.
+    """
+    owner = await run_blocking(get_package_owner, name)
+    if owner is None:
+        owner = await run_blocking(claim_package_owner, name, username)
+    return owner
+
+async def point_latest_at_database(name: str) -> str | None:
+    """
+    Make LATEST in the bucket say what the database says the latest version is.
+    Returns that version, or None if the database doesn't have the package.
+    """
+    # the database is read inside the compare-and-swap, so whichever publish writes LATEST last
+    # writes it after every publish recorded before it, and the two end up agreeing
+    _, current = await s3_update_text(f"{name}/LATEST", lambda text: get_latest_version(name), MUTABLE_CACHE_CONTROL)
+    return current
+
+async def rollback_publish(
+    name: str,
+    version: str,
+    blob_keys: list[str],
+    recorded: bool = False,
+    previous_package: dict | None = None
+) -> None:
+    """
+    Undo a publish that failed partway: take the version out of the database if it was already
+    recorded and point LATEST back, then delete the version's blobs. Best effort, failures are only logged.
+    """
+    if recorded:
+        try:
+            await run_blocking(undo_publish, name, version, previous_package)
+            if await point_latest_at_database(name) is None:
+                await s3_delete(f"{name}/LATEST")
+        except Exception as e:
+            print(f"Warning: Failed to roll back registry metadata: {e}")
 
-    if not watpkg_file.filename.endswith(".watpkg"):
-        raise HTTPException(status_code=400, detail="only .watpkg files are allowed")
+    # the manifest goes too, so the version can be published again
+    for result in await asyncio.gather(*(s3_delete(key) for key in blob_keys), return_exceptions=True):
+        if isinstance(result, Exception):
+            print(f"Warning: Failed to roll back upload: {result}")
 
-    username = fetch_github_username_from_cookie(request)
-    
-    authors_key = "AUTHORS.txt"
-    try:
-        if s3_exists(authors_key):
-            authors_content = s3_read_text(authors_key)
-            authors_list = [author.strip() for author in authors_content.split('\n') if author.strip()]
-        else:
-            authors_list = []
-        
-        if username not in authors_list:
-            authors_list.append(username)
-            authors_list.sort()
-            s3_write_text(authors_key, '\n'.join(authors_list))
-    except Exception as e:
-        print(f"Warning: Failed to update AUTHORS.txt: {e}")
-    
+async def upload_and_record(name: str, version: str, username: str, watpkg_file: UploadFile) -> None:
+    """
+    Check the archive, upload the version's blobs and record it. The caller holds the version's reservation.
+    """
     package_prefix = f"{name}/"
     version_prefix = f"{package_prefix}{version}/"
 
-    if s3_exists(f"{version_prefix}watkit.json"):
-        raise HTTPException(status_code=409, detail="This version already exists")
-
-    owner_key = f"{package_prefix}OWNER"
-    if s3_exists(owner_key):
-        owner = s3_read_text(owner_key).strip()
-    else:
-        owner = None
-        objects = s3_list_objects(package_prefix)
-        for obj_key in objects:
-            if obj_key.endswith("watkit.json") and obj_key != owner_key:
-                content = s3_read_text(obj_key)
-                try:
-                    data = json.loads(content)
-                    if "author" in data:
-                        owner = data["author"]
-                        break
-                except Exception:
-                    continue
-        if not owner:
-            owner = username
-        s3_write_text(owner_key, owner)
-
-    if owner != username:
-        raise HTTPException(status_code=403, detail="Only the package owner can publish new versions.")
-
     with tempfile.TemporaryDirectory() as tmpdir:
-        pkg_path = os.path.join(tmpdir, watpkg_file.filename)
-        with open(pkg_path, "wb") as f:
-            f.write(await watpkg_file.read())
+        # the client's filename is only checked for the extension, it never names a file here or in the bucket
+        pkg_path = os.path.join(tmpdir, "archive.watpkg")
+        _, archive_sha256 = await save_upload(watpkg_file, pkg_path)
 
+        extract_dir = os.path.join(tmpdir, "package")
         try:
-            with tarfile.open(pkg_path, "r:gz") as tar:
-                safe_extract_tar(tar, tmpdir)
+            await extract_package_archive_async(pkg_path, extract_dir)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
 
-        manifest_path = os.path.join(tmpdir, "watkit.json")
+        manifest_path = os.path.join(extract_dir, "watkit.json")
         if not os.path.exists(manifest_path):
             raise HTTPException(status_code=400, detail="Missing watkit.json")
 
@@ -103,49 +104,83 @@ async def publish_package(
             raise HTTPException(status_code=400, detail="Invalid watkit.json")
 
         manifest["author"] = username
-        temp_manifest_path = os.path.join(tmpdir, f"watkit.json.{uuid.uuid4().hex}.tmp")
-        with open(temp_manifest_path, "w") as f:
-            json.dump(manifest, f, indent=2)
 
-        s3_upload(pkg_path, f"{version_prefix}{watpkg_file.filename}")
-        s3_upload(temp_manifest_path, f"{version_prefix}watkit.json")
+        # parse the archive once here, so resolvers never have to download it
+        # where the CLI, serve and the metadata backfill all look for it
+        archive_blob_key = archive_key(name, version)
+        try:
+            metadata = await run_blocking(build_package_metadata, extract_dir, pkg_path, archive_blob_key, archive_sha256)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid package import: {e}")
+
+        # the manifest is what makes a version exist in the bucket, so it goes first and only if it isn't
+        # there yet. the reservation covers this machine, this covers publishes of the version from others
+        manifest_key = f"{version_prefix}watkit.json"
+        created = await run_blocking(s3_put_if_match, manifest_key, json.dumps(manifest, indent=2).encode("utf-8"),
+                                     None, IMMUTABLE_CACHE_CONTROL)
+        if created is None:
+            raise HTTPException(status_code=409, detail="This version already exists")
+
+        # the other blobs don't depend on each other, so they go up concurrently
+        blob_keys = [archive_blob_key, manifest_key, metadata_key(name, version)]
+        results = await asyncio.gather(
+            # versioned keys never change after this, so clients and CDNs may keep them forever
+            s3_upload(pkg_path, archive_blob_key, IMMUTABLE_CACHE_CONTROL),
+            s3_write_text(metadata_key(name, version), json.dumps(metadata, separators=(",", ":")), IMMUTABLE_CACHE_CONTROL),
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            await rollback_publish(name, version, blob_keys)
+            raise HTTPException(status_code=500, detail=f"Failed to upload package: {errors[0]}")
+
+        # only record the version once all of its blobs are in place. LATEST is still written
+        # to the bucket because the CLI reads it from there
+        try:
+            previous_package = await run_blocking(record_publish, name, version, username, metadata["exports"],
+                                                  manifest_description(manifest))
+        except Exception as e:
+            await rollback_publish(name, version, blob_keys)
+            raise HTTPException(status_code=500, detail=f"Failed to update registry metadata: {e}")
 
-        s3_write_text(f"downloads/{name}/{version}/count.txt", "0")
+        try:
+            await point_latest_at_database(name)
+        except Exception as e:
+            await rollback_publish(name, version, blob_keys, recorded=True, previous_package=previous_package)
+            raise HTTPException(status_code=500, detail=f"Failed to update registry metadata: {e}")
+
+@router.post("/publish")
+async def publish_package(
+    request: Request,
+    name: str = Form(...),
+    version: str = Form(...),
+    watpkg_file: UploadFile = File(...)
+):
+    validate_package_name(name)
+    validate_version(version)
 
-        s3_write_text(f"{package_prefix}LATEST", version)
+    if not watpkg_file.filename.endswith(".watpkg"):
+        raise HTTPException(status_code=400, detail="only .watpkg files are allowed")
 
-        index_key = "search_index.json"
-        try:
-            if s3_exists(index_key):
-                index_data = json.loads(s3_read_text(index_key))
-            else:
-                index_data = []
-        except Exception:
-            index_data = []
-
-        found = False
-        for entry in index_data:
-            if entry["name"] == name:
-                found = True
-                if version not in entry["versions"]:
-                    entry["versions"].append(version)
-                    entry["versions"].sort()
-                entry["latest"] = version
-                entry["author"] = username
-                break
-
-        if not found:
-            index_data.append({
-                "name": name,
-                "author": username,
-                "latest": version,
-                "versions": [version]
-            })
+    username = fetch_github_username_from_cookie(request)
 
+    if await get_or_claim_owner(name, username) != username:
+        raise HTTPException(status_code=403, detail="Only the package owner can publish new versions.")
+
+    # held before anything is uploaded, so of two publishes of the same version one gets a 409 here
+    # instead of both uploading and the loser's rollback deleting the winner's blobs
+    if not await run_blocking(reserve_version, name, version, username):
+        raise HTTPException(status_code=409, detail="This version already exists")
+
+    try:
+        await upload_and_record(name, version, username, watpkg_file)
+    except BaseException:
+        # a version that was recorded and rolled back has no reservation left, this only frees the others
         try:
-            s3_write_text(index_key, json.dumps(index_data, indent=2))
+            await run_blocking(release_version, name, version)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to update search index: {e}")
+            print(f"Warning: Failed to release {name}v{version}: {e}")
+        raise
 
     return JSONResponse({
         "status": "ok",
@@ -0,0 +1,94 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import asyncio
+import os
+
+from helpers.s3_async import run_blocking
+from helpers.package_metadata import load_package_metadata
+from helpers.registry_db import get_latest_version
+from helpers.validation import validate_package_name, validate_version
+
+router = APIRouter()
+
+BUCKET = os.environ["S3_BUCKET_NAME"]
+# where clients download archives from, the CLI reads the bucket directly
+REGISTRY_URL = os.environ.get("REGISTRY_URL", f"https://{BUCKET}.s3.{os.environ['AWS_REGION']}.amazonaws.com")
+
+MAX_RESOLVE_REQUESTS = 50
+MAX_RESOLVED_PACKAGES = 500
+
+class PackageRequest(BaseModel):
+    name: str
+    version: str = "latest"
+
+class ResolveRequest(BaseModel):
+    packages: list[PackageRequest]
+
+async def resolve_version(name: str, version: str) -> str:
+    """
+    Turn "latest" into a concrete version.
+    """
+    if version != "latest":
+        return version
+    latest = await run_blocking(get_latest_version, name)
+    if latest is None:
+        raise HTTPException(status_code=404, detail=f"Package not found: {name}")
+    return latest
+
+@router.post("/resolve")
+async def resolve_packages(data: ResolveRequest):
+    """
+    Resolve packages and their whole transitive dependency tree in one request.
+    Returns every package in the closure with its archive URL, size and SHA-256.
+    """
+    if not data.packages:
+        raise HTTPException(status_code=400, detail="No packages requested")
+    if len(data.packages) > MAX_RESOLVE_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"Too many packages requested (max {MAX_RESOLVE_REQUESTS})")
+
+    for pkg in data.packages:
+        validate_package_name(pkg.name)
+        if pkg.version != "latest":
+            validate_version(pkg.version)
+
+    roots = await asyncio.gather(*(resolve_version(pkg.name, pkg.version) for pkg in data.packages))
+    level = [(pkg.name, version) for pkg, version in zip(data.packages, roots)]
+
+    resolved = {}
+    # breadth first, fetching each level's metadata concurrently
+    while level:
+        level = [dep for dep in dict.fromkeys(level) if f"{dep[0]}v{dep[1]}" not in resolved]
+        if not level:
+            break
+        if len(resolved) + len(level) > MAX_RESOLVED_PACKAGES:
+            raise HTTPException(status_code=400, detail="Dependency tree is too large")
+
+        metadata_list = await asyncio.gather(
+            *(run_blocking(load_package_metadata, name, version) for name, version in level)
+        )
+
+        next_level = []
+        for (name, version), metadata in zip(level, metadata_list):
+            if metadata is None:
+                raise HTTPException(status_code=404, detail=f"Package not found: {name}v{version}")
+
+            for dep in metadata["dependencies"]:
+                next_level.append((dep["name"], dep["version"]))
+
+            archive = metadata["archive"]
+            resolved[f"{name}v{version}"] = {
+                "name": name,
+                "version": version,
+                "manifest_url": f"{REGISTRY_URL}/{name}/{version}/watkit.json",
+                "archive_url": f"{REGISTRY_URL}/{archive['key']}",
+                "size": archive["size"],
+                "sha256": archive["sha256"],
+                "dependencies": [f"{dep['name']}v{dep['version']}" for dep in metadata["dependencies"]],
+            }
+        level = next_level
+
+    return JSONResponse({
+        "roots": [f"{pkg.name}v{version}" for pkg, version in zip(data.packages, roots)],
+        "packages": list(resolved.values()),
+    })
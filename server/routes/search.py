@@ -1,24 +1,40 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, HTTPException
 from fastapi.responses import JSONResponse
-import boto3
-import json
-import os
-from difflib import SequenceMatcher
-from helpers.s3 import get_package_total_downloads
+from helpers.downloads import get_package_total_downloads, get_all_package_total_downloads
+from helpers.s3_async import run_blocking
+from helpers.registry_db import load_search_entries, sample_search_entries, get_search_entry, get_search_stats
+from helpers.export_index import search_exports, get_export_index_stats
+from helpers.fuzzy_search import get_trigram_index, search_trigram_index
+from helpers.ranking import search_ranked, get_ranking_stats
 from helpers.validation import validate_alphanumeric_hyphen_underscore
 
 router = APIRouter()
 
-BUCKET = os.environ["S3_BUCKET_NAME"]
-INDEX_KEY = "search_index.json"
-
-s3 = boto3.client("s3")
+def add_download_counts(packages: list[dict]) -> None:
+    """
+    Attach the total download count to each package entry.
+    """
+    for package in packages:
+        package_name = package.get("name", "")
+        if package_name:
+            package["downloads"] = get_package_total_downloads(package_name)
+        else:
+            package["downloads"] = 0
 
-def similarity(a: str, b: str) -> float:
+def search_by_export(q: str) -> list[dict]:
     """
-    Calculate the similarity between two strings using the SequenceMatcher algorithm.
+    Packages exporting a function named like q, as search entries with the matching exports attached.
     """
-    return SequenceMatcher(None, a, b).ratio()
+    results = []
+    for match in search_exports(q, limit=15):
+        entry = get_search_entry(match["package"])
+        if entry is None:
+            continue
+        result = dict(entry)
+        result["exports"] = match["exports"]
+        results.append(result)
+    add_download_counts(results)
+    return results
 
 @router.get("/search")
 async def search_packages(q: str = Query(...), by: str = Query("name")):
@@ -26,37 +42,32 @@ async def search_packages(q: str = Query(...), by: str = Query("name")):
     Search for packages in the remote s3 registry.
     """
     validate_alphanumeric_hyphen_underscore(q, "query")
-    if by not in ["name", "author"]:
-        raise HTTPException(status_code=400, detail="by parameter must be either 'name' or 'author'")
+    if by not in ["name", "author", "export"]:
+        raise HTTPException(status_code=400, detail="by parameter must be 'name', 'author' or 'export'")
+
+    if by == "export":
+        return JSONResponse({"results": await run_blocking(search_by_export, q)})
     
     try:
-        obj = s3.get_object(Bucket=BUCKET, Key=INDEX_KEY)
-        index_data = json.loads(obj["Body"].read())
+        index_data = await run_blocking(load_search_entries)
     except Exception:
+        index_data = None
+    if index_data is None:
         return JSONResponse({"error": "Failed to load search index"}, status_code=500)
 
-    q_lower = q.lower()
-    scored_matches = []
-
-    for entry in index_data:
-        target = entry.get(by, "").lower()
-        score = similarity(q_lower, target)
-
-        # Consider anything with score >= 0.5
-        if score >= 0.5 or q_lower in target:
-            scored_matches.append((score, entry))
-
-    # Sort by score descending and limit to top 15
-    scored_matches.sort(key=lambda x: x[0], reverse=True)
-    top_results = [entry for _, entry in scored_matches[:15]]
+    if by == "name":
+        # text relevance over name, author and description, lifted by popularity
+        downloads = await run_blocking(get_all_package_total_downloads)
+        matches = await run_blocking(search_ranked, index_data, q, downloads, limit=15)
+    else:
+        # trigram candidates rescored by similarity, top 15
+        trigram_index = await run_blocking(get_trigram_index, index_data, by)
+        matches = await run_blocking(search_trigram_index, trigram_index, q.lower(), limit=15)
+    # copy the entries, the cached index is shared between requests
+    top_results = [dict(entry) for entry in matches]
 
     # Add download counts to each package
-    for package in top_results:
-        package_name = package.get("name", "")
-        if package_name:
-            package["downloads"] = get_package_total_downloads(package_name)
-        else:
-            package["downloads"] = 0
+    await run_blocking(add_download_counts, top_results)
 
     return JSONResponse({"results": top_results})
 
@@ -66,25 +77,26 @@ async def get_random_packages(count: int = Query(3, ge=1, le=10)):
     Get random packages from the registry.
     """
     try:
-        obj = s3.get_object(Bucket=BUCKET, Key=INDEX_KEY)
-        index_data = json.loads(obj["Body"].read())
+        sampled = await run_blocking(sample_search_entries, count)
     except Exception:
+        sampled = None
+    if sampled is None:
         return JSONResponse({"error": "Failed to load search index"}, status_code=500)
 
-    if not index_data:
-        return JSONResponse({"results": []})
-
-    # Shuffle and take the requested number of packages
-    import random
-    random.shuffle(index_data)
-    random_packages = index_data[:count]
+    # copy the entries, the cached list is shared between requests
+    random_packages = [dict(entry) for entry in sampled]
 
     # Add download counts to each package
-    for package in random_packages:
-        package_name = package.get("name", "")
-        if package_name:
-            package["downloads"] = get_package_total_downloads(package_name)
-        else:
-            package["downloads"] = 0
+    await run_blocking(add_download_counts, random_packages)
 
     return JSONResponse({"results": random_packages})
+
+@router.get("/search/stats")
+async def get_search_cache_stats():
+    """
+    Get how often the in-process search entries, ranking statistics and export index were reused or rebuilt.
+    """
+    stats = await run_blocking(get_search_stats)
+    stats["ranking"] = await run_blocking(get_ranking_stats)
+    stats["exports"] = await run_blocking(get_export_index_stats)
+    return JSONResponse(stats)
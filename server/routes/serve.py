@@ -1,64 +1,59 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse
+from starlette.background import BackgroundTask
 import os
-import threading
-from helpers.s3 import increment_package_download_count, get_package_download_count, s3_list_objects, s3_read_text, s3_write_text, s3_exists
+import json
+from helpers.s3_async import run_blocking
+from helpers.downloads import (
+    increment_download_counts,
+    get_package_download_count,
+    get_download_counter,
+    get_pending_download_stats
+)
 from helpers.validation import validate_package_name, validate_version
+from helpers.blob_cache import open_cached_blob, pin_cached_blob, unpin_cached_blob, get_blob_cache_stats
+from helpers.registry_db import count_packages, count_authors
+from helpers.http_cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    etag_matches,
+    cache_headers,
+    not_modified
+)
 
 router = APIRouter()
 
-# Global download counter with thread safety and S3 persistence
-TOTAL_DOWNLOADS_COUNTER = 0
-download_lock = threading.Lock()
 BUCKET = os.environ["S3_BUCKET_NAME"]
 
-def load_total_downloads():
-    """Load total downloads count from S3"""
-    global TOTAL_DOWNLOADS_COUNTER
-    try:
-        if s3_exists("total_downloads.txt"):
-            count_text = s3_read_text("total_downloads.txt")
-            TOTAL_DOWNLOADS_COUNTER = int(count_text.strip())
-        else:
-            TOTAL_DOWNLOADS_COUNTER = 0
-    except Exception as e:
-        print(f"Error loading total downloads: {e}")
-        TOTAL_DOWNLOADS_COUNTER = 0
-
-def increment_download_counter():
-    global TOTAL_DOWNLOADS_COUNTER
-    with download_lock:
-        TOTAL_DOWNLOADS_COUNTER += 1
-        # Save to S3
+class PinnedBlobResponse(FileResponse):
+    """
+    A FileResponse of a pinned blob cache entry. Its background task unpins the entry, and it runs
+    when the response fails part way too, so a client going away can't pin a blob forever.
+    """
+    async def __call__(self, scope, receive, send):
         try:
-            s3_write_text("total_downloads.txt", str(TOTAL_DOWNLOADS_COUNTER))
-        except Exception as e:
-            print(f"Error saving total downloads: {e}")
-        return TOTAL_DOWNLOADS_COUNTER
-
-def get_download_counter():
-    global TOTAL_DOWNLOADS_COUNTER
-    with download_lock:
-        return TOTAL_DOWNLOADS_COUNTER
-
-# Load the total downloads count when the module is imported
-load_total_downloads()
+            await super().__call__(scope, receive, send)
+        except BaseException:
+            await self.background()
+            raise
 
 @router.get("/package/{name}/{version}/manifest")
-async def get_manifest(name: str, version: str):
+async def get_manifest(name: str, version: str, request: Request):
     validate_package_name(name)
     validate_version(version)
     
     try:
-        # Use S3 helper to read the manifest directly from S3
+        # versioned manifests never change, so they're served from the local blob cache
         manifest_key = f"{name}/{version}/watkit.json"
-        if not s3_exists(manifest_key):
+        opened = await run_blocking(open_cached_blob, manifest_key)
+        if opened is None:
             raise HTTPException(status_code=404, detail="Manifest not found")
-        
-        manifest_content = s3_read_text(manifest_key)
-        import json
-        data = json.loads(manifest_content)
-        return JSONResponse(data)
+
+        blob, f = opened
+        with f:
+            if etag_matches(request, blob["etag"]):
+                return not_modified(blob["etag"], IMMUTABLE_CACHE_CONTROL)
+            data = json.load(f)
+        return JSONResponse(data, headers=cache_headers(blob["etag"], IMMUTABLE_CACHE_CONTROL))
     except HTTPException:
         raise
     except Exception as e:
@@ -67,22 +62,37 @@ async def get_manifest(name: str, version: str):
 
 
 @router.get("/package/{name}/{version}/archive")
-async def get_archive(name: str, version: str):
+async def get_archive(name: str, version: str, request: Request):
     validate_package_name(name)
     validate_version(version)
     
-    archive_name = f"{name}.watpkg"
-    archive_path = os.path.join(BUCKET, name, version, archive_name)
-    if not os.path.exists(archive_path):
+    archive_name = f"{name}-{version}.watpkg"
+    # pinned until the response is sent, so an eviction can't remove the file while it's served from its path
+    blob = await run_blocking(pin_cached_blob, f"{name}/{version}/{archive_name}")
+    if blob is None:
         raise HTTPException(status_code=404, detail="Package archive not found")
-    
-    # Track download for this specific package version
-    download_count = increment_package_download_count(name, version)
-    # Also increment global counter
-    total_downloads = increment_download_counter()
-    print(f"Download tracked: {name}v{version} (package downloads: {download_count}, total: {total_downloads})")
-    
-    return FileResponse(archive_path, media_type="application/gzip", filename=archive_name)
+
+    try:
+        revalidated = etag_matches(request, blob["etag"])
+        if not revalidated:
+            # Track download for this specific package version, and the global counter with it
+            download_count, total_downloads = await run_blocking(increment_download_counts, name, version)
+            print(f"Download tracked: {name}v{version} (package downloads: {download_count}, total: {total_downloads})")
+    except BaseException:
+        unpin_cached_blob(blob)
+        raise
+
+    if revalidated:
+        unpin_cached_blob(blob)
+        return not_modified(blob["etag"], IMMUTABLE_CACHE_CONTROL)
+
+    return PinnedBlobResponse(
+        blob["path"],
+        media_type="application/gzip",
+        headers=cache_headers(blob["etag"], IMMUTABLE_CACHE_CONTROL),
+        filename=archive_name,
+        background=BackgroundTask(unpin_cached_blob, blob),
+    )
 
 @router.post("/track-download")
 async def track_download(name: str, version: str):
@@ -92,9 +102,8 @@ async def track_download(name: str, version: str):
     validate_package_name(name)
     validate_version(version)
     
-    download_count = increment_package_download_count(name, version)
-    # Also increment global counter
-    total_downloads = increment_download_counter()
+    # the version's count and the global counter go up together
+    download_count, total_downloads = await run_blocking(increment_download_counts, name, version)
     print(f"Download tracked via API: {name}v{version} (package downloads: {download_count}, total: {total_downloads})")
     return JSONResponse({"success": True, "download_count": download_count})
 
@@ -103,41 +112,28 @@ async def get_download_count():
     """
     Get the total number of downloads across all packages
     """
-    return JSONResponse({"total_downloads": get_download_counter()})
+    return JSONResponse({"total_downloads": await run_blocking(get_download_counter)})
+
+@router.get("/downloads/pending")
+async def get_pending_downloads():
+    """
+    Get the number of downloads counted in memory but not yet flushed to S3
+    """
+    return JSONResponse(await run_blocking(get_pending_download_stats))
 
 @router.get("/authors")
 async def get_authors_count():
     """
-    Get the number of authors by counting lines in AUTHORS.txt
+    Get the number of authors who have published a package
     """
-    try:
-        if s3_exists("AUTHORS.txt"):
-            authors_text = s3_read_text("AUTHORS.txt")
-            # Count non-empty lines
-            lines = [line.strip() for line in authors_text.split('\n') if line.strip()]
-            return JSONResponse({"total_authors": len(lines)})
-        else:
-            return JSONResponse({"total_authors": 0})
-    except Exception as e:
-        print(f"Error reading AUTHORS.txt: {e}")
-        return JSONResponse({"total_authors": 0})
+    return JSONResponse({"total_authors": await run_blocking(count_authors)})
 
 @router.get("/packages")
 async def get_packages_count():
     """
-    Get the number of packages by counting entries in search_index.json
+    Get the number of packages in the registry
     """
-    try:
-        if s3_exists("search_index.json"):
-            import json
-            index_text = s3_read_text("search_index.json")
-            index_data = json.loads(index_text)
-            return JSONResponse({"total_packages": len(index_data)})
-        else:
-            return JSONResponse({"total_packages": 0})
-    except Exception as e:
-        print(f"Error reading search_index.json: {e}")
-        return JSONResponse({"total_packages": 0})
+    return JSONResponse({"total_packages": await run_blocking(count_packages)})
 
 @router.get("/package/{name}/{version}/downloads")
 async def get_package_download_count_endpoint(name: str, version: str):
@@ -147,5 +143,12 @@ async def get_package_download_count_endpoint(name: str, version: str):
     validate_package_name(name)
     validate_version(version)
     
-    count = get_package_download_count(name, version)
+    count = await run_blocking(get_package_download_count, name, version)
     return JSONResponse({"downloads": count})
+
+@router.get("/blob-cache/stats")
+async def get_blob_cache_stats_endpoint():
+    """
+    Get hit ratio and size of the local blob cache
+    """
+    return JSONResponse(get_blob_cache_stats())
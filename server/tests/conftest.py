@@ -0,0 +1,124 @@
+import os
+import asyncio
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pytest
+from moto import mock_aws
+
+# the helpers read their configuration when they're imported
+_scratch_dir = tempfile.mkdtemp(prefix="watkit-tests-")
+os.environ.update({
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_REGION": "us-east-1",
+    "S3_BUCKET_NAME": "watkit-test",
+    "WATKIT_DB_PATH": os.path.join(_scratch_dir, "watkit.db"),
+    "BLOB_CACHE_DIR": os.path.join(_scratch_dir, "blob-cache"),
+    "GITHUB_CLIENT_ID": "testing",
+    "GITHUB_CLIENT_SECRET": "testing",
+    "JWT_SECRET": "testing",
+    "REDIRECT_URI": "http://localhost/callback",
+    "DOWNLOAD_FLUSH_INTERVAL_SECONDS": "3600",
+})
+
+from fastapi.testclient import TestClient
+
+from helpers import db, registry_db, export_index, downloads, blob_cache
+from helpers.s3 import s3, BUCKET
+
+# main mounts ./web when it's imported
+os.makedirs(os.path.join(_scratch_dir, "web"), exist_ok=True)
+_cwd = os.getcwd()
+os.chdir(_scratch_dir)
+try:
+    import main
+finally:
+    os.chdir(_cwd)
+
+
+@pytest.fixture(autouse=True)
+def registry(tmp_path, monkeypatch):
+    """
+    An empty bucket, a fresh database and cold in-process caches for every test.
+    """
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "watkit.db"))
+    monkeypatch.setattr(db, "_local", threading.local())
+    monkeypatch.setattr(db, "_schema_ready", False)
+    # generations start over with the database, so memos keyed on them would be wrong
+    monkeypatch.setattr(registry_db, "_entries_memo", {"generation": None, "entries": None, "by_name": None})
+    monkeypatch.setattr(export_index, "_index", {
+        "generation": None,
+        "last_id": 0,
+        "rows": 0,
+        "deleted": None,
+        "names": {},
+        "trigrams": export_index.build_trigram_index([], "name"),
+    })
+    monkeypatch.setattr(downloads, "_totals_memo", {"loaded_at": None, "totals": {}})
+    monkeypatch.setattr(blob_cache, "_entries", OrderedDict())
+    monkeypatch.setattr(blob_cache, "_total_bytes", 0)
+    monkeypatch.setattr(blob_cache, "_cache_dir", str(tmp_path / "blob-cache"))
+    monkeypatch.setattr(blob_cache, "_initialized", False)
+
+    with mock_aws():
+        s3.create_bucket(Bucket=BUCKET)
+        yield tmp_path
+
+
+@pytest.fixture
+def client():
+    # no lifespan, so the startup import and the download flusher don't run
+    return TestClient(main.app)
+
+
+def call_asgi(method: str, path: str, headers: dict[str, str] | None = None, body=()) -> dict:
+    """
+    Send one request straight to the app, without the test client, which holds whole request
+    and response bodies in memory. body is an iterable of chunks, fed to the app as it asks for them.
+    The response body is counted and thrown away.
+    Returns the status, response headers, body bytes and the largest body message.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"testserver")] + [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    received = {"status": None, "headers": {}, "bytes": 0, "largest": 0}
+
+    async def run():
+        chunks = iter(body)
+        pending = next(chunks, b"")
+        finished = asyncio.Event()
+
+        async def receive():
+            nonlocal pending
+            if pending is not None:
+                chunk, pending = pending, next(chunks, None)
+                return {"type": "http.request", "body": chunk, "more_body": pending is not None}
+            # the client stays connected until the whole response is in
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                received["status"] = message["status"]
+                received["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                size = len(message.get("body", b""))
+                received["bytes"] += size
+                received["largest"] = max(received["largest"], size)
+                if not message.get("more_body", False):
+                    finished.set()
+
+        await main.app(scope, receive, send)
+
+    asyncio.run(run())
+    return received
+
+
+@pytest.fixture
+def asgi():
+    return call_asgi
@@ -0,0 +1,97 @@
+import os
+
+from benchmarks.fake_registry import seed_package
+from helpers import blob_cache
+from helpers.blob_cache import get_cached_blob, open_cached_blob, pin_cached_blob, unpin_cached_blob
+from helpers.s3 import s3, BUCKET
+
+
+def evict_after_first_lookup(monkeypatch, evicting_key: str):
+    """
+    Make the next lookup return its entry and then push it out of the cache before the caller can use it,
+    the way a concurrent request filling evicting_key would.
+    """
+    monkeypatch.setattr(blob_cache, "BLOB_CACHE_MAX_BYTES", 1)
+    lookup = blob_cache.get_cached_blob
+    calls = []
+
+    def racing_lookup(key):
+        entry = lookup(key)
+        if not calls:
+            calls.append(key)
+            lookup(evicting_key)
+            assert not os.path.exists(entry["path"])
+        return entry
+
+    monkeypatch.setattr(blob_cache, "get_cached_blob", racing_lookup)
+    return calls
+
+
+def test_open_blob_outlives_its_eviction(monkeypatch):
+    s3.put_object(Bucket=BUCKET, Key="a", Body=b"first")
+    s3.put_object(Bucket=BUCKET, Key="b", Body=b"second")
+    monkeypatch.setattr(blob_cache, "BLOB_CACHE_MAX_BYTES", 1)
+
+    entry, f = open_cached_blob("a")
+    with f:
+        # only the newest blob fits, so this pushes "a" out and removes its file
+        get_cached_blob("b")
+        assert not os.path.exists(entry["path"])
+        assert f.read() == b"first"
+
+
+def test_open_blob_retries_when_evicted_before_it_opens(monkeypatch):
+    s3.put_object(Bucket=BUCKET, Key="a", Body=b"first")
+    s3.put_object(Bucket=BUCKET, Key="b", Body=b"second")
+    calls = evict_after_first_lookup(monkeypatch, "b")
+
+    entry, f = open_cached_blob("a")
+    with f:
+        assert f.read() == b"first"
+    assert calls == ["a"]
+    assert os.path.exists(entry["path"])
+
+
+def test_archive_and_manifest_survive_a_concurrent_eviction(client, monkeypatch):
+    archive = seed_package(s3, BUCKET, "math", "1.0.0", "alice")
+    seed_package(s3, BUCKET, "other", "1.0.0", "alice")
+
+    evict_after_first_lookup(monkeypatch, "other/1.0.0/other-1.0.0.watpkg")
+    response = client.get("/package/math/1.0.0/archive")
+    assert response.status_code == 200
+    assert response.content == archive
+    assert response.headers["content-length"] == str(len(archive))
+    assert response.headers["content-disposition"] == 'attachment; filename="math-1.0.0.watpkg"'
+
+    evict_after_first_lookup(monkeypatch, "other/1.0.0/watkit.json")
+    response = client.get("/package/math/1.0.0/manifest")
+    assert response.status_code == 200
+    assert response.json()["author"] == "alice"
+
+
+def test_pinned_blob_is_not_evicted_until_unpinned(monkeypatch):
+    s3.put_object(Bucket=BUCKET, Key="a", Body=b"first")
+    s3.put_object(Bucket=BUCKET, Key="b", Body=b"second")
+    monkeypatch.setattr(blob_cache, "BLOB_CACHE_MAX_BYTES", 1)
+
+    entry = pin_cached_blob("a")
+    get_cached_blob("b")
+    # over budget, but "a" is still being served from its path
+    assert os.path.exists(entry["path"])
+
+    unpin_cached_blob(entry)
+    assert not os.path.exists(entry["path"])
+    assert "a" not in blob_cache._entries
+
+
+def test_archive_is_unpinned_once_served_or_revalidated(client):
+    archive = seed_package(s3, BUCKET, "math", "1.0.0", "alice")
+
+    response = client.get("/package/math/1.0.0/archive")
+    assert response.content == archive
+    entry = blob_cache._entries["math/1.0.0/math-1.0.0.watpkg"]
+    assert entry["pins"] == 0
+
+    response = client.get("/package/math/1.0.0/archive", headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+    assert entry["pins"] == 0
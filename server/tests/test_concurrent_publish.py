@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from moto.s3.responses import S3Response
+
+import main
+from benchmarks.fake_registry import make_watpkg
+from helpers import registry_db
+from helpers.auth import create_jwt
+from helpers.export_index import search_exports
+from helpers.s3 import s3, BUCKET
+
+PUBLISHES = 50
+
+
+@pytest.fixture(autouse=True)
+def atomic_conditional_writes(monkeypatch):
+    """
+    S3 checks If-Match and If-None-Match and writes in one step, moto checks and then writes,
+    so two threads can both pass the check. Doing one write at a time puts the atomicity back.
+    """
+    lock = threading.Lock()
+    for method in ("put_object", "delete_object"):
+        original = getattr(S3Response, method)
+
+        def locked(self, original=original):
+            with lock:
+                return original(self)
+
+        monkeypatch.setattr(S3Response, method, locked)
+
+
+def publish_all(publishes: list[tuple[str, str, str]]) -> list[int]:
+    """
+    Publish every (name, version, username) at once, each from its own client, and return the status codes.
+    """
+    archives = [make_watpkg(name, version) for name, version, _ in publishes]
+    start = threading.Barrier(len(publishes))
+
+    def publish(i: int) -> int:
+        name, version, username = publishes[i]
+        client = TestClient(main.app)
+        client.cookies.set("watkit_token", create_jwt(username))
+        start.wait()
+        response = client.post("/publish", data={"name": name, "version": version},
+                               files={"watpkg_file": (f"{name}-{version}.watpkg", archives[i], "application/octet-stream")})
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=len(publishes)) as executor:
+        return list(executor.map(publish, range(len(publishes))))
+
+
+def read_text(key: str) -> str:
+    return s3.get_object(Bucket=BUCKET, Key=key)["Body"].read().decode("utf-8")
+
+
+def test_concurrent_publishes_of_different_versions_are_all_kept():
+    # 10 packages with their own owners, 5 versions each
+    publishes = [(f"pkg{i % 10}", f"1.0.{i // 10}", f"author{i % 10}") for i in range(PUBLISHES)]
+
+    statuses = publish_all(publishes)
+
+    assert statuses == [200] * PUBLISHES
+    entries = {entry["name"]: entry for entry in registry_db.load_search_entries()}
+    assert sorted(entries) == [f"pkg{i}" for i in range(10)]
+    for name, version, username in publishes:
+        assert version in entries[name]["versions"]
+        assert read_text(f"{name}/OWNER") == username
+        assert f'"version": "{version}"' in read_text(f"{name}/{version}/watkit.json")
+    assert registry_db.count_authors() == 10
+    for name, entry in entries.items():
+        # LATEST and the database agree on one of the published versions
+        assert read_text(f"{name}/LATEST").strip() == entry["latest"]
+        assert entry["latest"] in entry["versions"]
+    exported = {(hit["package"], version) for hit in search_exports("add")
+                for export in hit["exports"] for version in export["versions"]}
+    assert exported == {(name, version) for name, version, _ in publishes}
+
+
+def test_concurrent_publishes_of_the_same_version_keep_exactly_one():
+    publishes = [("math", "1.0.0", "alice")] * PUBLISHES
+
+    statuses = publish_all(publishes)
+
+    # the others are turned away, not failed halfway
+    assert sorted(statuses) == [200] + [409] * (PUBLISHES - 1)
+    assert registry_db.load_search_entries()[0]["versions"] == ["1.0.0"]
+    keys = [item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET, Prefix="math/1.0.0/")["Contents"]]
+    assert "math/1.0.0/watkit.json" in keys
+    assert "math/1.0.0/math-1.0.0.watpkg" in keys
+    assert read_text("math/LATEST").strip() == "1.0.0"
+
+
+def test_concurrent_first_publishes_from_different_users_have_one_owner():
+    publishes = [("math", f"1.0.{i}", f"user{i}") for i in range(PUBLISHES)]
+
+    statuses = publish_all(publishes)
+
+    assert sorted(statuses) == [200] + [403] * (PUBLISHES - 1)
+    owner = read_text("math/OWNER")
+    winner = publishes[statuses.index(200)]
+    assert owner == winner[2]
+    assert registry_db.get_package_owner("math") == owner
+    assert registry_db.load_search_entries()[0]["versions"] == [winner[1]]
@@ -0,0 +1,83 @@
+import tracemalloc
+
+from helpers.s3 import s3, BUCKET
+from routes import download
+
+INSTALLER = "watkit-installer.tar.gz"
+
+
+class FakeBody:
+    """
+    An S3 body that makes up its bytes as they're read, so the only large allocations are the server's own.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.closed = False
+
+    def iter_chunks(self, chunk_size):
+        sent = 0
+        while sent < self.size:
+            chunk = b"w" * min(chunk_size, self.size - sent)
+            sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def serve_fake_body(monkeypatch, size: int) -> FakeBody:
+    body = FakeBody(size)
+    monkeypatch.setattr(download.s3, "get_object", lambda **params: {
+        "Body": body, "ContentLength": size, "ETag": '"fake"', "ContentType": "application/gzip",
+    })
+    return body
+
+
+def test_download_streams_large_files_in_constant_memory(monkeypatch, asgi):
+    # the first request through the app imports and caches things, keep that out of the measurement
+    serve_fake_body(monkeypatch, 1024)
+    asgi("GET", f"/download/{INSTALLER}")
+
+    size = 64 * 1024 * 1024
+    body = serve_fake_body(monkeypatch, size)
+    tracemalloc.start()
+    try:
+        response = asgi("GET", f"/download/{INSTALLER}")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert response["status"] == 200
+    assert response["bytes"] == size
+    assert response["largest"] <= download.DOWNLOAD_CHUNK_SIZE
+    assert body.closed
+    # a few chunks in flight, nowhere near the 64 MiB file
+    assert peak < 1024 * 1024
+
+
+def test_download_serves_a_single_range(client):
+    s3.put_object(Bucket=BUCKET, Key=INSTALLER, Body=bytes(range(256)) * 4)
+
+    response = client.get(f"/download/{INSTALLER}", headers={"Range": "bytes=100-199"})
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 100-199/1024"
+    assert response.headers["content-length"] == "100"
+    assert response.content == bytes(range(100, 200))
+
+
+def test_download_rejects_a_range_past_the_end(client):
+    s3.put_object(Bucket=BUCKET, Key=INSTALLER, Body=b"x" * 1024)
+
+    response = client.get(f"/download/{INSTALLER}", headers={"Range": "bytes=4096-"})
+
+    assert response.status_code == 416
+
+
+def test_download_ignores_multiple_ranges(client):
+    s3.put_object(Bucket=BUCKET, Key=INSTALLER, Body=b"x" * 1024)
+
+    response = client.get(f"/download/{INSTALLER}", headers={"Range": "bytes=0-9,20-29"})
+
+    assert response.status_code == 200
+    assert len(response.content) == 1024
@@ -0,0 +1,62 @@
+from botocore.exceptions import ClientError
+
+from helpers import s3 as s3_helpers
+from helpers.downloads import (
+    TOTAL_DOWNLOADS_KEY,
+    flush_download_counts,
+    get_pending_download_stats,
+    increment_download_counts,
+)
+from helpers.s3 import s3, BUCKET
+
+COUNT_KEY = "downloads/math/1.0.0/count.txt"
+
+
+def read_count(key: str) -> str:
+    return s3.get_object(Bucket=BUCKET, Key=key)["Body"].read().decode("utf-8")
+
+
+def test_flush_adds_to_what_another_machine_flushed_meanwhile(monkeypatch):
+    s3.put_object(Bucket=BUCKET, Key=COUNT_KEY, Body=b"5")
+    for _ in range(3):
+        increment_download_counts("math", "1.0.0")
+    original = s3_helpers.s3_put_if_match
+    raced = []
+
+    def put_after_another_flush(key, body, etag, cache_control=None):
+        # another machine writes its own 10 downloads between this flush's read and its write
+        if key == COUNT_KEY and not raced:
+            raced.append(key)
+            s3.put_object(Bucket=BUCKET, Key=COUNT_KEY, Body=b"15")
+        return original(key, body, etag, cache_control)
+
+    monkeypatch.setattr(s3_helpers, "s3_put_if_match", put_after_another_flush)
+
+    flush_download_counts()
+
+    assert read_count(COUNT_KEY) == "18"
+    assert read_count(TOTAL_DOWNLOADS_KEY) == "3"
+    assert get_pending_download_stats()["pending_downloads"] == 0
+
+
+def test_a_count_that_cant_be_read_stays_pending(monkeypatch):
+    s3.put_object(Bucket=BUCKET, Key=COUNT_KEY, Body=b"5")
+    for _ in range(2):
+        increment_download_counts("math", "1.0.0")
+    original = s3.get_object
+
+    def unavailable(**params):
+        if params["Key"] == COUNT_KEY:
+            raise ClientError({"Error": {"Code": "SlowDown", "Message": "Please reduce your request rate."}}, "GetObject")
+        return original(**params)
+
+    monkeypatch.setattr(s3, "get_object", unavailable)
+    flush_download_counts()
+    monkeypatch.setattr(s3, "get_object", original)
+
+    # the count wasn't overwritten with the delta alone, and the delta is flushed once S3 answers again
+    assert read_count(COUNT_KEY) == "5"
+    assert get_pending_download_stats()["pending_downloads"] == 2
+    flush_download_counts()
+    assert read_count(COUNT_KEY) == "7"
+    assert get_pending_download_stats()["pending_downloads"] == 0
@@ -0,0 +1,55 @@
+from benchmarks.fake_registry import seed_package
+from helpers import registry_db
+from helpers.export_index import search_exports, get_export_index_stats
+from helpers.registry_import import ensure_registry_imported
+from helpers.s3 import s3, BUCKET
+
+
+def publish_exports(name: str, version: str, exports: list[str]) -> dict | None:
+    assert registry_db.reserve_version(name, version, "alice")
+    return registry_db.record_publish(name, version, "alice",
+                                      [{"name": export, "params": ["i32"], "results": ["i32"]} for export in exports])
+
+
+def exported_versions(export: str) -> set[tuple[str, str]]:
+    return {(match["package"], version) for match in search_exports(export)
+            for found in match["exports"] if found["name"] == export for version in found["versions"]}
+
+
+def test_a_new_machine_can_search_by_export(client):
+    # published before this machine's database existed
+    seed_package(s3, BUCKET, "math", "1.0.0", "alice")
+
+    ensure_registry_imported()
+
+    assert exported_versions("add") == {("math", "1.0.0")}
+    response = client.get("/search", params={"q": "add", "by": "export"})
+    assert [result["name"] for result in response.json()["results"]] == ["math"]
+
+
+def test_new_exports_are_folded_in_without_a_rebuild():
+    publish_exports("math", "1.0.0", ["add"])
+    assert exported_versions("add") == {("math", "1.0.0")}
+    rebuilds = get_export_index_stats()["rebuilds"]
+
+    publish_exports("math", "1.1.0", ["add", "sub"])
+
+    assert exported_versions("add") == {("math", "1.0.0"), ("math", "1.1.0")}
+    assert exported_versions("sub") == {("math", "1.1.0")}
+    assert get_export_index_stats()["rebuilds"] == rebuilds
+
+
+def test_a_rolled_back_publish_leaves_the_index():
+    publish_exports("math", "1.0.0", ["add"])
+    previous = publish_exports("math", "1.1.0", ["sub"])
+    assert exported_versions("sub") == {("math", "1.1.0")}
+    rebuilds = get_export_index_stats()["rebuilds"]
+
+    # as many rows added as deleted, so counting rows wouldn't notice
+    registry_db.undo_publish("math", "1.1.0", previous)
+    publish_exports("vector", "1.0.0", ["dot"])
+
+    assert exported_versions("sub") == set()
+    assert exported_versions("dot") == {("vector", "1.0.0")}
+    assert exported_versions("add") == {("math", "1.0.0")}
+    assert get_export_index_stats()["rebuilds"] == rebuilds + 1
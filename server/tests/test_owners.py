@@ -0,0 +1,98 @@
+import json
+import threading
+
+from benchmarks.fake_registry import make_watpkg, seed_package
+from helpers import db, registry_db
+from helpers.auth import create_jwt
+from helpers.owners import get_package_owner
+from helpers.registry_import import import_registry_from_bucket
+from helpers.s3 import s3, BUCKET
+
+
+def publish(client, name: str, version: str, username: str):
+    client.cookies.set("watkit_token", create_jwt(username))
+    archive = make_watpkg(name, version)
+    return client.post("/publish", data={"name": name, "version": version},
+                       files={"watpkg_file": (f"{name}-{version}.watpkg", archive, "application/octet-stream")})
+
+
+def transfer(client, name: str, username: str, new_owner: str):
+    client.cookies.set("watkit_token", create_jwt(username))
+    return client.post(f"/package/{name}/transfer", data={"new_owner": new_owner})
+
+
+def read_owner_file(name: str) -> str:
+    return s3.get_object(Bucket=BUCKET, Key=f"{name}/OWNER")["Body"].read().decode("utf-8")
+
+
+def start_on_a_new_machine(tmp_path, monkeypatch, machine: str) -> None:
+    """
+    Switch to an empty database and import the bucket into it, like a machine starting from scratch.
+    """
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / f"{machine}.db"))
+    monkeypatch.setattr(db, "_local", threading.local())
+    monkeypatch.setattr(db, "_schema_ready", False)
+    monkeypatch.setattr(registry_db, "_entries_memo", {"generation": None, "entries": None, "by_name": None})
+    import_registry_from_bucket()
+
+
+def test_first_publish_writes_the_owner_file(client):
+    assert publish(client, "math", "1.0.0", "alice").status_code == 200
+
+    assert read_owner_file("math") == "alice"
+    assert registry_db.get_package_owner("math") == "alice"
+
+
+def test_transfer_survives_a_fresh_database(client, tmp_path, monkeypatch):
+    assert publish(client, "math", "1.0.0", "alice").status_code == 200
+    assert transfer(client, "math", "alice", "bob").status_code == 200
+    assert read_owner_file("math") == "bob"
+
+    start_on_a_new_machine(tmp_path, monkeypatch, "restarted")
+
+    assert registry_db.get_package_owner("math") == "bob"
+    assert publish(client, "math", "1.0.1", "alice").status_code == 403
+    assert publish(client, "math", "1.0.1", "bob").status_code == 200
+
+
+def test_claims_are_shared_between_machines(client, tmp_path, monkeypatch):
+    assert publish(client, "math", "1.0.0", "alice").status_code == 200
+
+    # a machine that started before the claim and never imported it
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "other.db"))
+    monkeypatch.setattr(db, "_local", threading.local())
+    monkeypatch.setattr(db, "_schema_ready", False)
+
+    assert publish(client, "math", "2.0.0", "mallory").status_code == 403
+    assert read_owner_file("math") == "alice"
+
+
+def test_transfer_from_another_machine_is_seen(client, tmp_path, monkeypatch):
+    assert publish(client, "math", "1.0.0", "alice").status_code == 200
+    # this machine's database still says alice
+    s3.put_object(Bucket=BUCKET, Key="math/OWNER", Body=b"bob")
+
+    assert transfer(client, "math", "alice", "mallory").status_code == 403
+    assert read_owner_file("math") == "bob"
+    assert registry_db.get_package_owner("math") == "bob"
+
+
+def test_owner_files_win_over_owners_json(tmp_path, monkeypatch):
+    seed_package(s3, BUCKET, "math", "1.0.0", "alice")
+    seed_package(s3, BUCKET, "vector", "1.0.0", "alice")
+    s3.put_object(Bucket=BUCKET, Key="owners.json", Body=json.dumps({"math": "alice", "vector": "carol"}).encode())
+    s3.put_object(Bucket=BUCKET, Key="math/OWNER", Body=b"bob")
+
+    start_on_a_new_machine(tmp_path, monkeypatch, "imported")
+
+    assert get_package_owner("math") == "bob"
+    # no OWNER file yet, owners.json still counts
+    assert get_package_owner("vector") == "carol"
+
+
+def test_transfer_of_a_package_from_before_owner_files(client, tmp_path, monkeypatch):
+    seed_package(s3, BUCKET, "math", "1.0.0", "alice")
+    start_on_a_new_machine(tmp_path, monkeypatch, "imported")
+
+    assert transfer(client, "math", "alice", "bob").status_code == 200
+    assert read_owner_file("math") == "bob"
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from benchmarks.fake_registry import make_watpkg, seed_package
+from helpers.auth import create_jwt
+from helpers.http_cache import IMMUTABLE_CACHE_CONTROL
+from helpers.package_metadata import split_package_module, load_package_metadata, metadata_key
+from helpers.s3 import s3, BUCKET
+
+BAD_IMPORT_WAT = b'(module\n  (import "pkg/nothing" "add" (func $add (param i32 i32) (result i32)))\n)\n'
+
+
+def publish(client, name: str, version: str, archive: bytes, username: str = "alice"):
+    client.cookies.set("watkit_token", create_jwt(username))
+    return client.post("/publish", data={"name": name, "version": version},
+                       files={"watpkg_file": (f"{name}-{version}.watpkg", archive, "application/octet-stream")})
+
+
+@pytest.mark.parametrize("module, expected", [
+    ("pkg/mathv1.0.0", ("math", "1.0.0")),
+    # split at the first "v", like the CLI, so a "v" in the version stays in the version
+    ("pkg/foov1.0.0dev", ("foo", "1.0.0dev")),
+    ("pkg/math_utilsv2.1", ("math_utils", "2.1")),
+    ("env", None),
+    ("wasi_snapshot_preview1", None),
+])
+def test_split_package_module(module, expected):
+    assert split_package_module(module) == expected
+
+
+@pytest.mark.parametrize("module", ["pkg/nothing", "pkg/v1.0.0", "pkg/foov1.0-beta", "pkg/foo/barv1.0"])
+def test_split_package_module_rejects_imports_the_cli_cant_install(module):
+    with pytest.raises(ValueError):
+        split_package_module(module)
+
+
+def test_publish_records_dependencies_split_like_the_cli(client):
+    archive = make_watpkg("app", "1.0.0", dependencies=[("foo", "1.0.0dev")])
+
+    response = publish(client, "app", "1.0.0", archive)
+
+    assert response.status_code == 200
+    metadata = json.loads(s3.get_object(Bucket=BUCKET, Key=metadata_key("app", "1.0.0"))["Body"].read())
+    assert metadata["dependencies"] == [{"name": "foo", "version": "1.0.0dev"}]
+
+
+def test_publish_rejects_an_unparseable_package_import(client):
+    archive = make_watpkg("app", "1.0.0", files={"src/main.wat": BAD_IMPORT_WAT})
+
+    response = publish(client, "app", "1.0.0", archive)
+
+    assert response.status_code == 400
+    assert "pkg/nothing" in response.json()["detail"]
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET, Prefix="app/1.0.0/")
+
+
+def test_backfill_skips_an_unparseable_package_import(capsys):
+    # published before imports were checked, it still gets metadata
+    seed_package(s3, BUCKET, "old", "1.0.0", "alice")
+    archive = make_watpkg("old", "1.0.0", files={"src/main.wat": BAD_IMPORT_WAT})
+    s3.put_object(Bucket=BUCKET, Key="old/1.0.0/old-1.0.0.watpkg", Body=archive)
+
+    metadata = load_package_metadata("old", "1.0.0")
+
+    assert metadata["dependencies"] == []
+    assert "pkg/nothing" in capsys.readouterr().out
+
+
+def test_an_older_metadata_format_is_rebuilt_next_to_it():
+    seed_package(s3, BUCKET, "old", "1.0.0", "alice")
+    s3.put_object(Bucket=BUCKET, Key="old/1.0.0/metadata.json", Body=b'{"dependencies": []}')
+
+    metadata = load_package_metadata("old", "1.0.0")
+
+    assert metadata["exports"][0]["name"] == "add"
+    stored = s3.get_object(Bucket=BUCKET, Key=metadata_key("old", "1.0.0"))
+    assert json.loads(stored["Body"].read()) == metadata
+    assert stored["CacheControl"] == IMMUTABLE_CACHE_CONTROL
+    # documents are never rewritten, so anything that cached the old one keeps a correct copy
+    assert s3.get_object(Bucket=BUCKET, Key="old/1.0.0/metadata.json")["Body"].read() == b'{"dependencies": []}'
@@ -0,0 +1,219 @@
+import io
+import os
+import asyncio
+import resource
+import tracemalloc
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import main
+from benchmarks.fake_registry import make_watpkg
+from helpers import file_validation_helpers, registry_db
+from helpers.auth import create_jwt
+from helpers.file_validation_helpers import save_upload
+from helpers.registry_db import version_exists, reserve_version, load_search_entries
+from helpers.s3 import s3, BUCKET, WriteConflict
+from routes import publish
+
+BOUNDARY = "watkit-test-boundary"
+CHUNK_SIZE = 64 * 1024
+
+
+def multipart_chunks(name: str, version: str, archive: bytes):
+    """
+    A publish form, the way the CLI sends it, cut into CHUNK_SIZE pieces.
+    """
+    head = "".join(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{field}"\r\n\r\n{value}\r\n'
+        for field, value in (("name", name), ("version", version))
+    )
+    head += (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="watpkg_file"; '
+             f'filename="{name}-{version}.watpkg"\r\nContent-Type: application/octet-stream\r\n\r\n')
+    yield head.encode("utf-8")
+    for offset in range(0, len(archive), CHUNK_SIZE):
+        yield archive[offset:offset + CHUNK_SIZE]
+    yield f"\r\n--{BOUNDARY}--\r\n".encode("utf-8")
+
+
+def publish_headers(username: str, content_length: int | None = None) -> dict[str, str]:
+    headers = {
+        "content-type": f"multipart/form-data; boundary={BOUNDARY}",
+        "cookie": f"watkit_token={create_jwt(username)}",
+    }
+    if content_length is not None:
+        headers["content-length"] = str(content_length)
+    return headers
+
+
+def bucket_keys(prefix: str = "") -> list[str]:
+    return [item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET, Prefix=prefix).get("Contents", [])]
+
+
+def test_publish_refuses_a_content_length_over_the_limit(asgi):
+    # turned away by the middleware before any of the body is read
+    response = asgi("POST", "/publish",
+                    headers=publish_headers("alice", main.MAX_UPLOAD_SIZE + 64 * 1024 + 1),
+                    body=[b"never read"])
+
+    assert response["status"] == 413
+    assert bucket_keys() == []
+
+
+def test_publish_caps_uploads_without_a_content_length(asgi, monkeypatch):
+    monkeypatch.setattr(file_validation_helpers, "MAX_UPLOAD_SIZE", 256 * 1024)
+    archive = make_watpkg("big", "1.0.0", files={"assets/blob.wasm": os.urandom(512 * 1024)})
+
+    # a chunked upload gets past the middleware and is stopped while it's copied
+    response = asgi("POST", "/publish", headers=publish_headers("alice"),
+                    body=multipart_chunks("big", "1.0.0", archive))
+
+    assert response["status"] == 413
+    assert bucket_keys("big/1.0.0/") == []
+    assert not version_exists("big", "1.0.0")
+
+
+def test_save_upload_stops_at_the_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_validation_helpers, "MAX_UPLOAD_SIZE", 100 * 1024)
+    upload = UploadFile(file=io.BytesIO(b"x" * (300 * 1024)), filename="big.watpkg")
+    dest = tmp_path / "big.watpkg"
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(save_upload(upload, str(dest)))
+
+    assert error.value.status_code == 413
+    # it gave up at the first chunk past the limit instead of copying the rest
+    assert dest.stat().st_size <= 100 * 1024
+
+
+def test_publish_near_the_limit_in_bounded_memory(asgi, monkeypatch):
+    # two incompressible files just under the per-file cap, so the archive lands just under MAX_UPLOAD_SIZE
+    blob_size = (file_validation_helpers.MAX_UPLOAD_SIZE - 256 * 1024) // 2
+    archive = make_watpkg("big", "1.0.0", files={
+        "assets/a.wasm": os.urandom(blob_size),
+        "assets/b.wasm": os.urandom(blob_size),
+    })
+    assert file_validation_helpers.MAX_UPLOAD_SIZE - 512 * 1024 < len(archive) <= file_validation_helpers.MAX_UPLOAD_SIZE
+
+    # moto would keep the uploaded archive in memory, which isn't the server's doing
+    uploaded = {}
+
+    async def fake_upload(file_path, key, cache_control=None):
+        uploaded[key] = os.path.getsize(file_path)
+
+    monkeypatch.setattr(publish, "s3_upload", fake_upload)
+    # the first publish imports and caches things, keep that out of the measurement
+    asgi("POST", "/publish", headers=publish_headers("alice"),
+         body=multipart_chunks("warm", "1.0.0", make_watpkg("warm", "1.0.0")))
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    try:
+        response = asgi("POST", "/publish", headers=publish_headers("alice"),
+                        body=multipart_chunks("big", "1.0.0", archive))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+
+    assert response["status"] == 200
+    assert uploaded["big/1.0.0/big-1.0.0.watpkg"] == len(archive)
+    assert version_exists("big", "1.0.0")
+    # the archive is spooled to disk and read back in chunks, so memory doesn't follow its size
+    assert peak < 4 * 1024 * 1024
+    # building the archive above already set the high-water mark, the publish shouldn't push it up much
+    assert rss_growth < len(archive) // 2
+
+
+def publish_form(client, name: str, version: str, archive: bytes, username: str = "alice"):
+    client.cookies.set("watkit_token", create_jwt(username))
+    return client.post("/publish", data={"name": name, "version": version},
+                       files={"watpkg_file": (f"{name}-{version}.watpkg", archive, "application/octet-stream")})
+
+
+def test_publish_refuses_a_version_another_publish_holds(client):
+    # a publish of the same version that's still uploading
+    assert reserve_version("math", "1.0.0", "alice")
+
+    response = publish_form(client, "math", "1.0.0", make_watpkg("math", "1.0.0"))
+
+    assert response.status_code == 409
+    assert bucket_keys("math/1.0.0/") == []
+
+
+def test_publish_refuses_a_version_already_in_the_bucket(client):
+    # published through another machine, whose database this one hasn't seen
+    s3.put_object(Bucket=BUCKET, Key="math/1.0.0/watkit.json", Body=b'{"author": "bob"}')
+
+    response = publish_form(client, "math", "1.0.0", make_watpkg("math", "1.0.0"))
+
+    assert response.status_code == 409
+    assert bucket_keys("math/1.0.0/") == ["math/1.0.0/watkit.json"]
+    assert s3.get_object(Bucket=BUCKET, Key="math/1.0.0/watkit.json")["Body"].read() == b'{"author": "bob"}'
+    assert not version_exists("math", "1.0.0")
+    # the reservation was given back
+    assert reserve_version("math", "1.0.0", "alice")
+
+
+def test_failed_publish_gives_the_version_back(client):
+    response = publish_form(client, "math", "1.0.0", b"not a gzip file")
+    assert response.status_code == 400
+
+    response = publish_form(client, "math", "1.0.0", make_watpkg("math", "1.0.0"))
+    assert response.status_code == 200
+    assert version_exists("math", "1.0.0")
+    assert publish_form(client, "math", "1.0.0", make_watpkg("math", "1.0.0")).status_code == 409
+
+
+def test_reservations_of_dead_publishes_expire(client, monkeypatch):
+    assert reserve_version("math", "1.0.0", "alice")
+    monkeypatch.setattr(registry_db, "RESERVATION_TIMEOUT_SECONDS", -1)
+
+    response = publish_form(client, "math", "1.0.0", make_watpkg("math", "1.0.0"))
+
+    assert response.status_code == 200
+
+
+def test_reserved_versions_are_not_listed(client):
+    assert publish_form(client, "math", "1.0.0", make_watpkg("math", "1.0.0")).status_code == 200
+    assert reserve_version("math", "2.0.0", "alice")
+
+    assert not version_exists("math", "2.0.0")
+    assert load_search_entries()[0]["versions"] == ["1.0.0"]
+
+
+def test_publish_that_cant_update_latest_is_rolled_back(client, monkeypatch):
+    assert publish_form(client, "math", "1.0.0", make_watpkg("math", "1.0.0")).status_code == 200
+    original = publish.s3_update_text
+    attempts = []
+
+    async def conflicting_update(key, mutate, cache_control=None):
+        # only the publish's own update loses, the rollback's goes through
+        attempts.append(key)
+        if len(attempts) == 1:
+            raise WriteConflict(f"Gave up updating {key}")
+        return await original(key, mutate, cache_control)
+
+    monkeypatch.setattr(publish, "s3_update_text", conflicting_update)
+
+    response = publish_form(client, "math", "2.0.0", make_watpkg("math", "2.0.0"))
+
+    assert response.status_code == 500
+    assert not version_exists("math", "2.0.0")
+    assert registry_db.get_latest_version("math") == "1.0.0"
+    assert s3.get_object(Bucket=BUCKET, Key="math/LATEST")["Body"].read() == b"1.0.0"
+    assert bucket_keys("math/2.0.0/") == []
+
+
+def test_publish_stores_the_archive_under_its_own_name(client):
+    client.cookies.set("watkit_token", create_jwt("alice"))
+    archive = make_watpkg("math", "1.0.0")
+
+    response = client.post("/publish", data={"name": "math", "version": "1.0.0"},
+                           files={"watpkg_file": ("../../build/out.watpkg", archive, "application/octet-stream")})
+
+    assert response.status_code == 200
+    # wherever the client built it, it's stored where install and /download look
+    assert "math/1.0.0/math-1.0.0.watpkg" in bucket_keys("math/1.0.0/")
+    assert not any("out.watpkg" in key for key in bucket_keys())
+    assert client.get("/package/math/1.0.0/archive").content == archive
@@ -0,0 +1,121 @@
+import time
+import random
+
+import pytest
+
+from helpers import ranking, registry_db
+from helpers.downloads import increment_download_counts
+from helpers.ranking import search_ranked
+
+ENTRIES = [
+    {"name": "hash", "author": "alice", "description": "fast non-cryptographic hash functions"},
+    {"name": "json", "author": "bob", "description": "parse and print json, hash maps of values"},
+    {"name": "allocator", "author": "carol", "description": "a bump allocator for linear memory"},
+    {"name": "alloc", "author": "carol", "description": "malloc and free for linear memory"},
+    {"name": "string", "author": "dave", "description": "utf-8 string helpers"},
+    {"name": "matrix", "author": "erin", "description": "matrix multiply and decompose"},
+    {"name": "matrix_lite", "author": "erin", "description": "small matrix multiply"},
+    {"name": "sort_fast", "author": "frank", "description": "sorting for i32 arrays"},
+    {"name": "sort_tiny", "author": "frank", "description": "sorting for i32 arrays"},
+    {"name": "popular", "author": "grace", "description": "the most downloaded package of all"},
+]
+
+
+def names(query: str, downloads: dict[str, int] | None = None, entries: list[dict] = ENTRIES) -> list[str]:
+    return [entry["name"] for entry in search_ranked(entries, query, downloads or {})]
+
+
+def test_a_name_match_beats_a_description_match():
+    assert names("hash")[:2] == ["hash", "json"]
+
+
+def test_matching_more_query_terms_ranks_higher():
+    assert names("matrix decompose")[:2] == ["matrix", "matrix_lite"]
+
+
+def test_an_author_finds_their_packages():
+    assert set(names("carol")[:2]) == {"alloc", "allocator"}
+
+
+def test_prefixes_match_longer_terms_below_exact_matches():
+    results = names("alloc")
+
+    assert results[:2] == ["alloc", "allocator"]
+
+
+def test_typos_still_find_the_package():
+    assert names("strng")[0] == "string"
+    assert names("matirx")[0] == "matrix"
+
+
+def test_ties_are_broken_by_name():
+    assert names("sort")[:2] == ["sort_fast", "sort_tiny"]
+
+
+def test_popularity_breaks_ties_between_equal_matches():
+    assert names("sort", {"sort_tiny": 500, "sort_fast": 3})[:2] == ["sort_tiny", "sort_fast"]
+
+
+def test_popularity_alone_doesnt_get_a_package_into_the_results():
+    assert "popular" not in names("sort", {"popular": 1_000_000})
+
+
+def test_popularity_doesnt_beat_a_much_better_match():
+    assert names("hash", {"json": 1_000_000, "hash": 0})[0] == "hash"
+
+
+def test_republished_descriptions_are_reindexed():
+    entries = [dict(entry) for entry in ENTRIES]
+    assert "string" not in names("unicode", entries=entries)
+
+    entries = [dict(entry, description="unicode aware") if entry["name"] == "string" else entry for entry in entries]
+
+    assert names("unicode", entries=entries)[0] == "string"
+
+
+@pytest.fixture
+def large_registry():
+    rng = random.Random(7)
+    words = ["math", "array", "alloc", "string", "utils", "hash", "json", "list", "matrix", "sort",
+             "crypto", "rand", "io", "fmt", "bits", "heap", "tree", "map", "queue", "bigint"]
+    entries = [
+        {
+            "name": f"{rng.choice(words)}_{rng.choice(words)}_{i}",
+            "author": f"author{i % 300}",
+            "description": " ".join(rng.choice(words) for _ in range(8)),
+        }
+        for i in range(10_000)
+    ]
+    downloads = {entry["name"]: rng.randrange(10_000) for entry in entries}
+    return entries, downloads
+
+
+def test_ranking_latency(large_registry):
+    entries, downloads = large_registry
+    queries = ["hash", "matrix sort", "alloc", "strng", "json list", "author12", "bigint crypto", "que"]
+    # the first search indexes every package, that's paid once per change to the registry
+    search_ranked(entries, queries[0], downloads)
+    assert ranking.get_ranking_stats()["documents"] == len(entries)
+
+    started = time.perf_counter()
+    rounds = 5
+    for _ in range(rounds):
+        for query in queries:
+            assert search_ranked(entries, query, downloads)
+    per_query = (time.perf_counter() - started) / (rounds * len(queries))
+
+    # a generous bound, it fails when ranking goes back to scanning every package per query
+    assert per_query < 0.05, f"{per_query * 1000:.1f}ms per query"
+
+
+def test_search_route_lifts_downloaded_packages(client):
+    for name in ("sort_fast", "sort_tiny"):
+        assert registry_db.reserve_version(name, "1.0.0", "frank")
+        registry_db.record_publish(name, "1.0.0", "frank", description="sorting for i32 arrays")
+    for _ in range(20):
+        increment_download_counts("sort_tiny", "1.0.0")
+
+    results = client.get("/search", params={"q": "sort"}).json()["results"]
+
+    assert [result["name"] for result in results] == ["sort_tiny", "sort_fast"]
+    assert results[0]["downloads"] == 20